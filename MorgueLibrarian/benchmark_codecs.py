@@ -0,0 +1,98 @@
+""" Benchmark the Compression Codecs
+
+How long does it take to load our data files with each compression codec (see file_codecs.py)?
+The data files given (or all the winners_* files, by default) are written out once with every
+installed codec, and then read back with iter_lines, the way KnownMorgues and SearchWinners
+read them.
+
+Usage:
+
+    python MorgueLibrarian/benchmark_codecs.py
+    python MorgueLibrarian/benchmark_codecs.py data/morgue_urls_20200101_120000.txt -w 8
+"""
+import os
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+from time import perf_counter
+from data_files import default_workers, find_data_files, iter_lines, write_lines
+from file_codecs import CODECS, available_codecs
+from library_data import DATA_DIR, WINNERS
+
+# CONSTANTS
+REPEATS = 3
+
+
+def main():
+    workers = default_workers()
+    file_paths = []
+
+    # optional commandline parsing
+    a = 1
+    while a < len(argv):
+        if argv[a].lower() in ('-w', '--workers'):
+            a += 1
+            workers = int(argv[a])
+        else:
+            file_paths.append(argv[a])
+        a += 1
+
+    if not len(file_paths):
+        file_paths = find_data_files(DATA_DIR, WINNERS)
+
+    lines = [line for f in file_paths for line in iter_lines(f)]
+    print('{0} lines, {1} workers\n'.format(len(lines), workers))
+    print('codec\tsize (MB)\tratio\twrite (s)\tload (s)\tload, {0} workers (s)'.format(workers))
+    for result in benchmark(lines, workers):
+        print('{0}\t{1:.2f}\t\t{2:.1f}\t{3:.3f}\t\t{4:.3f}\t\t{5:.3f}'.format(*result))
+
+
+def benchmark(lines, workers=1, repeats=REPEATS):
+    """ Write some lines with every installed codec, and time how long it takes to read them back
+
+    Args:
+        lines (list): lines of text, each ending in a newline
+        workers (int): threads to use in the parallel load
+        repeats (int): every load is timed this many times, and the best time is kept
+    Returns:
+        list: (codec, size in MB, compression ratio, write seconds, load seconds, parallel load seconds)
+    """
+    temp_dir = mkdtemp()
+    results = []
+    try:
+        raw_size = None
+        for name in ['none'] + available_codecs():
+            extension = '' if name == 'none' else CODECS[name].extension
+            file_path = os.path.join(temp_dir, 'benchmark.txt' + extension)
+
+            start = perf_counter()
+            write_lines(file_path, lines)
+            write_time = perf_counter() - start
+
+            size = os.path.getsize(file_path)
+            raw_size = size if raw_size is None else raw_size
+            load_times = [min(_load_time(file_path, w) for _ in range(repeats)) for w in (1, workers)]
+            results.append((name, size / 1048576.0, raw_size / float(max(size, 1)), write_time) + tuple(load_times))
+    finally:
+        rmtree(temp_dir, ignore_errors=True)
+
+    return results
+
+
+def _load_time(file_path, workers):
+    """ Time how long it takes to stream every line of a data file
+
+    Args:
+        file_path (str): path to the data file
+        workers (int): threads used to decompress the file
+    Returns:
+        float: seconds
+    """
+    start = perf_counter()
+    for _ in iter_lines(file_path, workers):
+        pass
+    return perf_counter() - start
+
+
+if __name__ == '__main__':
+    main()
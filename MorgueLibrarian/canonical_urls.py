@@ -0,0 +1,91 @@
+""" Canonical URLs
+
+The same morgue can show up under many different URLs:
+
+* http:// vs https://
+* upper or lower case host names, and explicit default ports (:80, :443)
+* trailing slashes, doubled slashes, and #fragments
+* percent-encoded characters that don't need to be encoded (e.g. %7E for ~)
+* the same game, served from two different mirror servers
+
+The first few are handled by reducing every URL to a canonical form before comparing them.
+The last one is handled by a game fingerprint: DCSS names every morgue file after the player and
+the time the game ended (morgue-<player>-<YYYYMMDD>-<HHMMSS>.txt), which identifies the same game
+no matter what server it is on.
+
+The canonical form is only used to compare URLs, we still fetch the URL we were given.
+"""
+import re
+from urllib.parse import quote, unquote, urlsplit
+
+MORGUE_FILE = re.compile(r'^morgue-(.+)-(\d{8})-(\d{6})\.txt(\.gz|\.bz2|\.xz|\.zst)?$', re.IGNORECASE)
+SAFE_CHARS = "/~!$&'()*+,;=:@-._"
+DEFAULT_PORTS = {80, 443}
+
+
+def canonical_url(url):
+    """ Reduce a URL to a canonical form, so that trivially different URLs compare equal
+
+    Args:
+        url (str): Any arbitrary URL (or local file path)
+    Returns:
+        str: canonical form of the URL
+    """
+    url = url.strip()
+    if not url.lower().startswith('http'):
+        return url
+
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or '').lower()
+        if parts.port and parts.port not in DEFAULT_PORTS:
+            host += ':' + str(parts.port)
+    except ValueError:
+        return url
+
+    path = quote(unquote(parts.path), safe=SAFE_CHARS)
+    path = re.sub('/+', '/', path).rstrip('/') or '/'
+    query = '?' + parts.query if parts.query else ''
+
+    return 'http://' + host + path + query
+
+
+def game_fingerprint(url):
+    """ Identify the game a morgue URL belongs to, by the player name and end time in its file name
+
+    Args:
+        url (str): Any arbitrary URL (or local file path)
+    Returns:
+        tuple: (player, timestamp), or None if this doesn't look like a morgue file
+    """
+    m = MORGUE_FILE.match(url.strip().split('#')[0].split('?')[0].rstrip('/').split('/')[-1])
+    if not m:
+        return None
+    return (m.group(1).lower(), m.group(2) + m.group(3))
+
+
+def unique_urls(urls, known=None):
+    """ Drop any URL that is a duplicate of an earlier one, or of a known morgue,
+    either because the canonical URLs match or because it is the same game on another mirror.
+
+    Args:
+        urls (iterable): URLs (or local file paths)
+        known (KnownMorgues): optional, URLs we have already seen
+    Returns:
+        list: the first URL for each distinct morgue, in order
+    """
+    seen = set()
+    unique = []
+    for url in urls:
+        url = url.strip()
+        if not len(url) or (known is not None and known.includes(url)):
+            continue
+
+        keys = [canonical_url(url), game_fingerprint(url)]
+        if any(k in seen for k in keys if k is not None):
+            continue
+
+        seen.update(k for k in keys if k is not None)
+        unique.append(url)
+
+    return unique
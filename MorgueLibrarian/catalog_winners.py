@@ -26,7 +26,7 @@ from search_winners import SearchWinners
 def main():
     """
     1. parse input commandline for winning build/run info
-    2. open/read all winning runs in /data/, bzip or not
+    2. open/read all winning runs in /data/, compressed or not
     3. print lines that match search criteria
     """
     print("WARNING: This tool still under construction!")
@@ -0,0 +1,275 @@
+""" Compact the Data Directory
+
+Every spider auto-save and every parser run adds a new timestamped file to the data directory:
+morgue_urls_*, winners_*, losers_*, parser_errors_*, and features_*. Over time, that means that
+loading the data directory costs more and more, even if there aren't many more URLs.
+
+This script merges all those files into a few sorted, deduplicated, compressed shards per
+file prefix, in data/shards/. By default, the shards are compressed with the fastest codec
+installed (see file_codecs.py), but any codec can be chosen with --codec. A manifest
+(data/shards/manifest.json) records the shards, their first and last URLs, and how many lines
+they hold, along with which raw files were merged in (and their size and modification time).
+KnownMorgues and SearchWinners read the shards from the manifest, plus any newer raw files.
+
+If a URL shows up more than once in the same category, the line from the newest file wins.
+
+It is safe to compact while the spider or parser is running: raw files modified in the last few
+minutes are left alone until a later compaction, and a raw file that is appended to after it was
+merged is neither deleted nor hidden from the loaders.
+
+The files are merged as sorted runs of at most --shard_lines lines each (spilled to temporary files
+in data/shards/), so a category never has to fit in memory all at once.
+
+Usage:
+
+    python MorgueLibrarian/compact_data.py
+    python MorgueLibrarian/compact_data.py --keep
+    python MorgueLibrarian/compact_data.py --shard_lines 1000000
+    python MorgueLibrarian/compact_data.py --codec bz2
+"""
+from datetime import datetime
+from heapq import merge
+import json
+import os
+from sys import argv
+from time import time
+from data_files import compacted_sources, file_stat, find_data_files, iter_lines, read_manifest, write_lines
+from file_codecs import CODECS, default_codec
+from library_data import *
+
+# CONSTANTS
+ACTIVE_SECONDS = 600.0
+SHARD_LINES = 500000
+
+
+def main():
+    keep = False
+    shard_lines = SHARD_LINES
+    codec = default_codec()
+
+    # optional commandline parsing
+    a = 1
+    while a < len(argv):
+        if argv[a].lower() in ('-k', '--keep'):
+            keep = True
+        elif argv[a].lower() in ('-s', '--shard_lines'):
+            a += 1
+            shard_lines = int(argv[a])
+        elif argv[a].lower() in ('-c', '--codec'):
+            a += 1
+            codec = CODECS[argv[a].lower()]
+        a += 1
+
+    cd = CompactData(DATA_DIR, shard_lines, keep, codec)
+    cd.compact()
+
+
+class CompactData:
+    """ Merge all the timestamped output files in a data directory into sorted, deduplicated shards """
+
+    PREFIXES = (MORGUE_URLS, WINNERS, LOSERS, PARSER_ERRORS, FEATURES)
+
+    def __init__(self, data_dir, shard_lines=SHARD_LINES, keep=False, codec=None, active_seconds=ACTIVE_SECONDS):
+        self.data_dir = data_dir
+        self.codec = default_codec() if codec is None else codec
+        self.shard_lines = int(shard_lines)
+        self.keep = keep
+        self.active_seconds = float(active_seconds)
+        self.dt_fmt = DT_FMT
+        self.shards_dir = os.path.join(data_dir, SHARDS_DIR)
+
+    def compact(self):
+        """ Master method to compact every category of output file
+
+        Returns: None
+        """
+        os.makedirs(self.shards_dir, exist_ok=True)
+        old_manifest = read_manifest(self.data_dir)
+        manifest = {}
+        dt_now = datetime.now().strftime(self.dt_fmt)
+
+        for prefix in CompactData.PREFIXES:
+            manifest[prefix] = self._compact_prefix(prefix, old_manifest.get(prefix, {}), dt_now)
+            print('{0}: {1} lines in {2} shard(s)'.format(prefix, manifest[prefix]['count'],
+                                                          len(manifest[prefix]['shards'])))
+
+        # switch over to the new manifest in a single step
+        manifest_path = os.path.join(self.shards_dir, MANIFEST)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+        # only now is it safe to remove the files that were merged into the new shards
+        new_shards = set(s['file'] for category in manifest.values() for s in category['shards'])
+        for prefix in CompactData.PREFIXES:
+            for shard in old_manifest.get(prefix, {}).get('shards', []):
+                if shard['file'] not in new_shards:
+                    self._remove(os.path.join(self.shards_dir, shard['file']))
+            if not self.keep:
+                # anything appended to a raw file since we read it isn't in the shards yet, so keep that file
+                sources = manifest[prefix]['sources']
+                for source, stat in list(sources.items()):
+                    file_path = os.path.join(self.data_dir, source)
+                    if not os.path.exists(file_path) or stat is None or stat == file_stat(file_path):
+                        self._remove(file_path)
+                        del sources[source]
+
+        if not self.keep:
+            with open(manifest_path + '.tmp', 'w') as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+            os.replace(manifest_path + '.tmp', manifest_path)
+
+    def _compact_prefix(self, prefix, old_category, dt_now):
+        """ Merge the old shards and all raw output files of one prefix into new shards
+
+        Args:
+            prefix (str): file prefix, e.g. "winners_"
+            old_category (dict): the entry for this prefix in the old manifest
+            dt_now (str): timestamp used to name the new shards
+        Returns:
+            dict: the entry for this prefix in the new manifest
+        """
+        file_paths = find_data_files(self.data_dir, prefix)
+        shard_paths = set(os.path.join(self.shards_dir, s['file']) for s in old_category.get('shards', []))
+        sources = compacted_sources(old_category)
+        sources = dict((s, stat) for s, stat in sources.items() if os.path.exists(os.path.join(self.data_dir, s)))
+
+        # leave the raw files that are still being written for next time
+        now = time()
+        raw_paths = [f for f in file_paths if f not in shard_paths and now - os.path.getmtime(f) >= self.active_seconds]
+        for file_path in raw_paths:
+            sources[os.path.basename(file_path)] = file_stat(file_path)
+
+        # the old shards are already sorted, the raw files are sorted in runs
+        runs = []
+        run_paths = []
+        try:
+            for order, file_path in enumerate(file_paths):
+                if file_path in shard_paths:
+                    runs.append(CompactData._shard_run(file_path, order))
+            runs += self._sorted_runs(raw_paths, len(file_paths), run_paths)
+
+            shards = []
+            count = 0
+            for block in self._blocks(CompactData._newest_lines(merge(*runs))):
+                file_name = '{0}{1}_{2:03d}.txt{3}'.format(prefix, dt_now, len(shards), self.codec.extension)
+                write_lines(os.path.join(self.shards_dir, file_name), (line for _, line in block))
+                shards.append({'file': file_name, 'first': block[0][0], 'last': block[-1][0], 'count': len(block)})
+                count += len(block)
+        finally:
+            for run_path in run_paths:
+                self._remove(run_path)
+
+        return {'shards': shards, 'count': count, 'sources': sources, 'compacted': dt_now}
+
+    def _sorted_runs(self, file_paths, first_order, run_paths):
+        """ Read raw files into sorted runs of at most shard_lines lines, spilling all but the last
+        run to temporary files
+
+        Args:
+            file_paths (list): raw files, oldest first
+            first_order (int): order of the first raw file (they come after every old shard)
+            run_paths (list): the temporary files written are appended here, to be removed later
+        Returns:
+            list: iterables of (url, order, line number, line), each sorted
+        """
+        runs = []
+        lines = {}
+        for order, file_path in enumerate(file_paths, first_order):
+            for n, line in enumerate(iter_lines(file_path)):
+                cols = line.split()
+                if len(cols):
+                    # later lines (from newer files) override earlier ones
+                    lines[cols[0]] = (order, n, line.rstrip('\n') + '\n')
+
+                if len(lines) >= self.shard_lines:
+                    run_path = os.path.join(self.shards_dir, '.run.{0}.{1}.tmp'.format(os.getpid(), len(run_paths)))
+                    run_paths.append(run_path)
+                    with open(run_path, 'w') as f:
+                        for url in sorted(lines):
+                            f.write('{0} {1} {2}'.format(*lines[url]))
+                    runs.append(CompactData._run_file(run_path))
+                    lines = {}
+
+        runs.append([(url,) + lines[url] for url in sorted(lines)])
+        return runs
+
+    @staticmethod
+    def _run_file(run_path):
+        """ Stream a sorted run back from its temporary file
+
+        Args:
+            run_path (str): path to the run file
+        Returns:
+            generator: (url, order, line number, line) for each line
+        """
+        with open(run_path, 'r') as f:
+            for row in f:
+                order, n, line = row.split(' ', 2)
+                yield line.split()[0], int(order), int(n), line
+
+    @staticmethod
+    def _shard_run(file_path, order):
+        """ Stream an old shard, which is already sorted and deduplicated
+
+        Args:
+            file_path (str): path to the shard
+            order (int): where this shard comes, among all the files being merged
+        Returns:
+            generator: (url, order, line number, line) for each line
+        """
+        for n, line in enumerate(iter_lines(file_path)):
+            cols = line.split()
+            if len(cols):
+                yield cols[0], order, n, line.rstrip('\n') + '\n'
+
+    @staticmethod
+    def _newest_lines(merged):
+        """ Keep only the newest line for each URL, from a merge of sorted runs
+
+        Args:
+            merged (iterable): (url, order, line number, line), sorted
+        Returns:
+            generator: (url, line) for each distinct URL, in order
+        """
+        last = None
+        for row in merged:
+            if last is not None and row[0] != last[0]:
+                yield last[0], last[3]
+            last = row
+
+        if last is not None:
+            yield last[0], last[3]
+
+    def _blocks(self, lines):
+        """ Cut a stream of lines into blocks, one for each shard
+
+        Args:
+            lines (iterable): (url, line), in order
+        Returns:
+            generator: lists of at most shard_lines (url, line) pairs
+        """
+        block = []
+        for pair in lines:
+            block.append(pair)
+            if len(block) >= self.shard_lines:
+                yield block
+                block = []
+
+        if len(block):
+            yield block
+
+    @staticmethod
+    def _remove(file_path):
+        """ Delete a file, if it is still there
+
+        Args:
+            file_path (str): path to the file
+        Returns: None
+        """
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+if __name__ == '__main__':
+    main()
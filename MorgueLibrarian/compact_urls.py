@@ -0,0 +1,138 @@
+""" Compact URL Storage
+
+Thousands of winning morgue URLs share the same server and player directory, and nearly all of
+the file names follow the pattern "morgue-<player>-<YYYYMMDD>-<HHMMSS>.txt", where the player
+name is the same as the directory name.
+
+To keep the RAM footprint of a big library of winners small, we store each URL as:
+
+1. a directory ID, against shared tables of hosts and directories, and
+2. the date and time of the morgue, packed into a single integer.
+
+Any file name that doesn't follow the usual pattern is stored separately, as a plain string.
+"""
+from array import array
+import re
+from sys import intern
+
+MORGUE_NAME = re.compile(r'^morgue-(.+)-(\d{8})-(\d{6})\.txt$')
+
+
+class URLTable:
+    """ Shared prefix tables, so that every host and directory is only stored once,
+    no matter how many morgue URLs live there.
+    """
+
+    def __init__(self):
+        self.hosts = []
+        self.host_ids = {}
+        self.dirs = []
+        self.dir_ids = {}
+
+    def split(self, url):
+        """ Split a URL (or file path) into a directory ID, packed timestamp, and file name.
+
+        Args:
+            url (str): URL or file path of a morgue
+        Returns:
+            tuple: (directory ID, timestamp, file name); the timestamp is zero if the file name is unusual
+        """
+        i = url.find('://')
+        slash = url.find('/', i + 3 if i >= 0 else 0)
+        if slash < 0:
+            # a bare host, or a local file name with no directory
+            host, path, file_name = (url, '', '') if i >= 0 else ('', '', url)
+        else:
+            host = url[:slash]
+            path, _, file_name = url[slash:].rpartition('/')
+            path += '/'
+
+        dir_id = self._dir_id(host, path)
+        m = MORGUE_NAME.match(file_name)
+        if m and m.group(1) == self.dirs[dir_id][2]:
+            return dir_id, int(m.group(2) + m.group(3)), file_name
+        return dir_id, 0, file_name
+
+    def join(self, dir_id, stamp, file_name=None):
+        """ Rebuild the full URL from the parts created by URLTable.split.
+
+        Args:
+            dir_id (int): directory ID
+            stamp (int): packed morgue timestamp, or zero
+            file_name (str): file name, only needed if the timestamp is zero
+        Returns:
+            str: URL or file path of the morgue
+        """
+        host_id, path, player = self.dirs[dir_id]
+        if stamp:
+            stamp = str(stamp)
+            file_name = 'morgue-{0}-{1}-{2}.txt'.format(player, stamp[:8], stamp[8:])
+        return self.hosts[host_id] + path + file_name
+
+    def _dir_id(self, host, path):
+        """ Look up (or create) the ID for a host / directory pair
+
+        Args:
+            host (str): scheme and host of the URL, e.g. "http://crawl.akrasiac.org"
+            path (str): directory path, with leading and trailing slashes (empty for a bare file name)
+        Returns:
+            int: directory ID
+        """
+        key = (host, path)
+        if key not in self.dir_ids:
+            if host not in self.host_ids:
+                self.host_ids[host] = len(self.hosts)
+                self.hosts.append(intern(host))
+            player = path.rstrip('/').split('/')[-1]
+            self.dir_ids[key] = len(self.dirs)
+            self.dirs.append((self.host_ids[host], intern(path), intern(player)))
+
+        return self.dir_ids[key]
+
+    def __len__(self):
+        return len(self.dirs)
+
+
+class URLList:
+    """ A list-like collection of URLs, stored compactly against a shared URLTable.
+    Iterating over it yields plain URL strings.
+    """
+
+    __slots__ = ('table', 'dir_ids', 'stamps', 'others')
+
+    def __init__(self, table, urls=()):
+        self.table = table
+        self.dir_ids = array('I')
+        self.stamps = array('Q')
+        self.others = None
+        for url in urls:
+            self.append(url)
+
+    def append(self, url):
+        """ Add a single URL to this collection
+
+        Args:
+            url (str): URL or file path of a morgue
+        Returns: None
+        """
+        dir_id, stamp, file_name = self.table.split(url.strip())
+        if not stamp:
+            if self.others is None:
+                self.others = {}
+            self.others[len(self.stamps)] = file_name
+
+        self.dir_ids.append(dir_id)
+        self.stamps.append(stamp)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.stamps)
+        file_name = self.others.get(i) if self.others else None
+        return self.table.join(self.dir_ids[i], self.stamps[i], file_name)
+
+    def __iter__(self):
+        for i in range(len(self.stamps)):
+            yield self[i]
+
+    def __len__(self):
+        return len(self.stamps)
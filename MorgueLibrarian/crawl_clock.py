@@ -0,0 +1,62 @@
+""" Crawl Clock
+
+Everything that waits between requests (URLIterator, MorgueSpider) asks a clock for the time,
+and asks it to sleep. Normally that is the real wall clock, but crawl_simulator.py swaps in a
+VirtualClock, so a crawl that would take days can be replayed in seconds.
+"""
+from datetime import datetime
+from time import sleep
+
+
+class Clock:
+    """ The real wall clock """
+
+    def now(self):
+        """ What time is it?
+
+        Returns:
+            float: timestamp
+        """
+        return datetime.now().timestamp()
+
+    def sleep(self, seconds):
+        """ Wait for a while
+
+        Args:
+            seconds (float): how long to wait
+        Returns: None
+        """
+        sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """ A clock that only moves forward when someone sleeps, so waiting costs nothing """
+
+    def __init__(self, start=None):
+        self.start = datetime.now().timestamp() if start is None else float(start)
+        self.time = self.start
+
+    def now(self):
+        """ What time is it, in the simulation?
+
+        Returns:
+            float: timestamp
+        """
+        return self.time
+
+    def sleep(self, seconds):
+        """ Move the clock forward, instantly
+
+        Args:
+            seconds (float): how long to "wait"
+        Returns: None
+        """
+        self.time += max(0.0, float(seconds))
+
+    def elapsed(self):
+        """ How much simulated time has passed?
+
+        Returns:
+            float: seconds since the clock started
+        """
+        return self.time - self.start
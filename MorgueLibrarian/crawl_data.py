@@ -30,3 +30,10 @@ GODS = {'ashenzari': 'Ash', 'beogh': 'Beo', 'cheibriados': 'Chei', 'council': 'W
         'the shining one': 'TSO', 'the wu jian council': 'Wu', 'trog': 'Trog', 'uskayaw': 'Usk', 'vehumet': 'Veh',
         'wu': 'Wu', 'xobeh': 'Nem', 'xom': 'Xom', 'ym': 'Goz', 'yredelemnul': 'Yred', 'zin': 'Zin'}
 GODS_ABR = {g.lower(): g for g in GODS.values()}
+
+# Every skill, in the fixed order used for the feature vectors of winning characters (see morgue_features.py).
+SKILLS = ('fighting', 'short blades', 'long blades', 'axes', 'maces & flails', 'polearms', 'staves',
+          'unarmed combat', 'bows', 'crossbows', 'throwing', 'slings', 'armour', 'dodging', 'shields',
+          'spellcasting', 'conjurations', 'hexes', 'charms', 'summonings', 'necromancy', 'translocations',
+          'transmutations', 'fire magic', 'ice magic', 'air magic', 'earth magic', 'poison magic', 'invocations',
+          'evocations', 'stealth', 'alchemy', 'forgecraft', 'ranged weapons', 'shapeshifting')
@@ -0,0 +1,144 @@
+""" Crawl Frontier
+
+Not every page the spider could visit is equally likely to lead to new morgue files.
+The frontier scores each page before we spider it, so that the most productive pages are
+fetched first, and a spider run with a time limit finds as many new morgues as possible:
+
+1. Directory listings under a known morgue root (a directory whose sub-directories hold
+   morgue files, like http://crawl.akrasiac.org/rawdata/) get a head start.
+2. Every spidered page updates the yield of its path (host plus first directory): how many
+   times we fetched pages there, and how many new morgue links they held.
+   That history is saved between runs, in data/path_yields.json.
+3. Pages on paths that have historically produced nothing sink to the bottom.
+
+The morgue roots are saved in the same file, along with the names of the morgue URL files they
+were learned from, so each morgue URL file only has to be read (and canonicalized) once.
+"""
+import json
+import os
+from canonical_urls import canonical_url
+from data_files import find_data_files, iter_lines
+from file_codecs import strip_extension
+
+
+class CrawlFrontier:
+    """ Score and order the pages the spider could visit next """
+
+    ROOT_BONUS = 3.0
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.yields = {}
+        self.roots = set()
+        self.scanned = set()
+
+    def load(self, data_dir=None, morgue_prefix=None):
+        """ Read the path yields and morgue roots from previous runs, and (optionally) learn more
+        morgue roots from any morgue URL files we haven't read before.
+
+        Args:
+            data_dir (str): optional, data directory holding morgue URL files
+            morgue_prefix (str): optional, file prefix of the morgue URL files
+        Returns: None
+        """
+        self.yields = {}
+        self.roots = set()
+        self.scanned = set()
+        if os.path.exists(self.file_path):
+            saved = json.load(open(self.file_path, 'r'))
+            if isinstance(saved.get('yields'), dict):
+                self.yields = saved['yields']
+                self.roots = set(saved.get('roots', []))
+                self.scanned = set(saved.get('scanned', []))
+            else:
+                # older files only held the yields
+                self.yields = saved
+
+        if data_dir is not None and morgue_prefix is not None:
+            for file_path in find_data_files(data_dir, morgue_prefix):
+                name = strip_extension(os.path.basename(file_path))
+                if name in self.scanned:
+                    continue
+
+                for line in iter_lines(file_path):
+                    cols = line.split()
+                    if len(cols):
+                        self.add_root(cols[0])
+                self.scanned.add(name)
+
+    def save(self):
+        """ Write the path yields and morgue roots to file, replacing the old one in a single step
+
+        Returns: None
+        """
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'roots': sorted(self.roots), 'scanned': sorted(self.scanned), 'yields': self.yields},
+                      f, sort_keys=True)
+
+        os.replace(temp_path, self.file_path)
+
+    def add_root(self, morgue_url):
+        """ Learn a morgue root from a morgue URL: the directory above the player's directory
+
+        Args:
+            morgue_url (str): URL of a morgue file
+        Returns: None
+        """
+        parts = canonical_url(morgue_url).split('/')
+        if len(parts) > 5:
+            self.roots.add('/'.join(parts[:-2]) + '/')
+
+    def record(self, url, new_morgues):
+        """ Update the yield of a page's path, after spidering it
+
+        Args:
+            url (str): URL of the page we just spidered
+            new_morgues (int): how many new morgue links were on it
+        Returns: None
+        """
+        key = CrawlFrontier.path_key(url)
+        fetches, found = self.yields.get(key, [0, 0])
+        self.yields[key] = [fetches + 1, found + int(new_morgues)]
+
+    def score(self, url):
+        """ How likely is this page to lead to new morgue links? (Bigger is better.)
+
+        Args:
+            url (str): URL of a page we might spider
+        Returns:
+            float: score of the page
+        """
+        canon = canonical_url(url)
+        prior = 1.0
+        if url.endswith('/') or url.endswith('index.html'):
+            if any((canon + '/').startswith(root) for root in self.roots):
+                prior += CrawlFrontier.ROOT_BONUS
+
+        fetches, found = self.yields.get(CrawlFrontier.path_key(url), [0, 0])
+        return prior * (found + 1.0) / (fetches + 1.0)
+
+    def order(self, urls, tie_breaker=None):
+        """ Sort pages so the most promising are first
+
+        Args:
+            urls (iterable): URLs of pages we might spider
+            tie_breaker (function): optional, sort key for pages with the same score
+        Returns:
+            list: URLs, best first
+        """
+        if tie_breaker is None:
+            return sorted(urls, key=lambda u: -self.score(u))
+        return sorted(urls, key=lambda u: (-self.score(u), tie_breaker(u)))
+
+    @staticmethod
+    def path_key(url):
+        """ The path a page belongs to, for tracking yields: its host and first directory
+
+        Args:
+            url (str): Any arbitrary URL
+        Returns:
+            str: e.g. "http://crawl.akrasiac.org/rawdata"
+        """
+        parts = canonical_url(url).split('/')
+        return '/'.join(parts[:4])
@@ -0,0 +1,214 @@
+""" Crawl Simulator
+
+Choosing the search depth, the wait between requests and the auto-save interval is guesswork,
+because every real experiment takes days. This script replays a link graph recorded by an earlier
+crawl (see "morgue_spider.py -r") through the real MorgueSpider and URLIterator, on a virtual
+clock, without touching any server. It reports:
+
+* the projected wall time of the crawl,
+* the requests made to each server,
+* the peak memory used by the spider, and
+* the new morgues discovered at each depth.
+
+The wait, depth, auto-save and time limit flags each take a comma-separated list of values, and
+every combination is simulated.
+
+Usage:
+
+    python MorgueLibrarian/crawl_simulator.py
+    python MorgueLibrarian/crawl_simulator.py -d 2,3,4 -w 30,60,120
+    python MorgueLibrarian/crawl_simulator.py -g data/link_graph.json -u data/starting_urls.txt -t 86400
+"""
+from contextlib import redirect_stdout
+from io import StringIO
+from itertools import product
+import json
+import os
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+import tracemalloc
+from crawl_clock import VirtualClock
+from crawl_frontier import CrawlFrontier
+from host_policies import HostPolicies, base_url
+from library_data import *
+from morgue_spider import AUTO_SAVE_SECONDS, SEARCH_DEPTH, STARTING_URL_FILE, MorgueSpider
+from page_validators import PageValidators
+from retry_queue import RetryQueue
+
+# CONSTANTS
+FETCH_SECONDS = 1.0
+
+
+def main():
+    auto_saves = [int(AUTO_SAVE_SECONDS)]
+    depths = [int(SEARCH_DEPTH)]
+    time_limits = [0]
+    waits = [None]
+    graph_file = os.path.join(DATA_DIR, LINK_GRAPH)
+    starting_url_file = STARTING_URL_FILE
+
+    # optional commandline parsing
+    a = 1
+    while a < len(argv):
+        if argv[a].lower() in ('-a', '--auto_save_second'):
+            a += 1
+            auto_saves = [int(v) for v in argv[a].split(',')]
+        elif argv[a].lower() in ('-d', '--depth'):
+            a += 1
+            depths = [int(v) for v in argv[a].split(',')]
+        elif argv[a].lower() in ('-g', '--graph'):
+            a += 1
+            graph_file = argv[a]
+        elif argv[a].lower() in ('-t', '--time_limit'):
+            a += 1
+            time_limits = [int(v) for v in argv[a].split(',')]
+        elif argv[a].lower() in ('-u', '--url_file'):
+            a += 1
+            starting_url_file = argv[a]
+        elif argv[a].lower() in ('-w', '--wait'):
+            a += 1
+            waits = [float(v) for v in argv[a].split(',')]
+        else:
+            usage()
+        a += 1
+
+    link_graph = json.load(open(graph_file, 'r'))
+    starting_urls = [u.strip() for u in open(starting_url_file, 'r').readlines() if len(u.strip())]
+
+    for wait, depth, auto_save, time_limit in product(waits, depths, auto_saves, time_limits):
+        cs = CrawlSimulator(link_graph, starting_urls, auto_save, depth, time_limit, wait)
+        cs.simulate()
+        cs.report()
+
+
+class CrawlSimulator:
+    """ Replay a recorded link graph through the real spider, on a virtual clock """
+
+    def __init__(self, link_graph, starting_urls, auto_save=1800, depth=3, time_limit=0, wait=None):
+        self.link_graph = link_graph
+        self.starting_urls = starting_urls
+        self.auto_save = auto_save
+        self.depth = int(depth)
+        self.time_limit = time_limit
+        self.wait = wait
+        self.results = {}
+
+    def simulate(self):
+        """ Run one simulated crawl, quietly
+
+        Returns:
+            dict: projected wall time, requests per host, peak memory and morgues per depth
+        """
+        temp_dir = mkdtemp()
+        spider = SimulatedSpider(self.link_graph, self.starting_urls, self.auto_save, self.depth,
+                                 self.time_limit, self.wait, temp_dir)
+
+        tracemalloc.start()
+        try:
+            with redirect_stdout(StringIO()):
+                spider.spider()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            rmtree(temp_dir, ignore_errors=True)
+
+        self.results = {'wall_time': spider.clock.elapsed(),
+                        'requests': spider.requests,
+                        'unrecorded': spider.unrecorded,
+                        'files_written': spider.files_written,
+                        'peak_memory': peak_memory,
+                        'morgues': [len(spider.morgues[d]) for d in sorted(spider.morgues)]}
+        return self.results
+
+    def report(self):
+        """ Print the results of the last simulated crawl to the screen
+
+        Returns: None
+        """
+        r = self.results
+        wait = 'recorded' if self.wait is None else '{0}s'.format(self.wait)
+        print('depth={0} wait={1} auto_save={2}s time_limit={3}s'.format(self.depth, wait, self.auto_save,
+                                                                         self.time_limit))
+        print('\tprojected wall time: {0:.1f} hours'.format(r['wall_time'] / 3600.0))
+        print('\tpeak memory: {0:.1f} MB'.format(r['peak_memory'] / 1048576.0))
+        print('\tmorgue_urls files written: {0}'.format(r['files_written']))
+        print('\trequests: {0} ({1} not in the link graph)'.format(sum(r['requests'].values()), r['unrecorded']))
+        for host, count in sorted(r['requests'].items(), key=lambda hc: -hc[1]):
+            print('\t\t{0}\t{1}'.format(count, host))
+        for level, count in enumerate(r['morgues']):
+            print('\tnew morgues at depth {0}: {1}'.format(level + 1, count))
+
+
+class SimulatedSpider(MorgueSpider):
+    """ A MorgueSpider that reads pages from a recorded link graph, instead of the internet,
+    and writes nothing but scratch files to a temporary directory. """
+
+    def __init__(self, link_graph, urls, auto_save, depth, time_limit, wait, temp_dir):
+        super().__init__(urls, auto_save, depth, time_limit)
+        self.pages = link_graph.get('pages', {})
+        self.clock = VirtualClock()
+        self.data_dir = temp_dir
+        self.frontier = CrawlFrontier(os.path.join(temp_dir, PATH_YIELDS))
+        self.validators = PageValidators(os.path.join(temp_dir, PAGE_VALIDATORS))
+        self.retry_queue = RetryQueue(os.path.join(temp_dir, SPIDER_RETRY_QUEUE))
+
+        # replay the waits the real crawl used, unless we are trying out a new one
+        self.policies = HostPolicies(use_robots=False, clock=self.clock)
+        if wait is None:
+            self.policies.waits.update(link_graph.get('waits', {}))
+        else:
+            self.policies.default_wait = abs(float(wait))
+
+        self.level = 0
+        self.requests = {}
+        self.unrecorded = 0
+        self.files_written = 0
+        self.morgues = {}
+
+    def _spider(self, all_urls, new_urls, depth):
+        """ Keep track of which depth we are at, then spider as usual """
+        self.level = self.depth - depth + 1
+        return super()._spider(all_urls, new_urls, depth)
+
+    def _find_new_links(self, url):
+        """ Look up the links on a page in the link graph, and let the fetch take as long as it did
+
+        Args:
+            url (str): Any arbitary URL
+        Returns:
+            set: All the URLs recorded on that page.
+        """
+        base = base_url(url)
+        self.requests[base] = self.requests.get(base, 0) + 1
+
+        if url not in self.pages:
+            self.unrecorded += 1
+            self.clock.sleep(FETCH_SECONDS)
+            return set()
+
+        seconds, links = self.pages[url]
+        self.clock.sleep(seconds)
+        return set(links)
+
+    def _write_morgue_urls_to_file(self, urls):
+        """ Count the new morgues found at this depth, instead of writing them to a file
+
+        Args:
+            urls (set): Lots of arbitrary URLs
+        Returns: None
+        """
+        if self.level not in self.morgues:
+            self.morgues[self.level] = set()
+        self.morgues[self.level].update(MorgueSpider.find_morgues(urls))
+        self.files_written += 1
+
+
+def usage():
+    """ Print a help menu to the screen, if the user enters a bad command line flag. """
+    print(__doc__)
+    exit()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,3 +5,10 @@ class Loser(Exception):
 
 class ParserError(Exception):
     pass
+
+
+class TransientError(Exception):
+
+    def __init__(self, message, retry_after=None):
+        super(TransientError, self).__init__(message)
+        self.retry_after = retry_after
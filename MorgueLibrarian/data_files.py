@@ -0,0 +1,341 @@
+""" Data Files
+
+Helpers to read the plain text and compressed data files MorgueLibrarian creates
+(morgue_urls_*, winners_*, losers_*, parser_errors_*, features_*) quickly:
+
+1. Lines are streamed, instead of reading whole files into lists.
+2. Several files are decompressed at once, in a thread pool (decompression releases the GIL).
+3. A big bzip2 file made of several concatenated streams (as written by "bzip2 -c a b > c",
+   pbzip2, or compact_data.py) is split at its stream boundaries, and the streams are
+   decompressed in parallel.
+
+Any codec in file_codecs.py (gzip, bz2, xz, or zstd) can be read, and is detected automatically.
+
+Once a data directory has been compacted (see compact_data.py), the loaders read the sorted
+shards listed in the manifest, plus any output files written (or appended to) since then.
+A loader that only needs a few URLs can skip the shards whose key range can't hold any of them.
+"""
+from bisect import bisect_left
+from bz2 import BZ2Decompressor
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+import json
+import os
+import re
+from types import GeneratorType
+from file_codecs import EXTENSIONS, codec_for_path, compress, open_file
+from library_data import MANIFEST, SHARDS_DIR
+
+# every bzip2 stream starts with "BZh", the block size, and the block header magic number
+BZ2_STREAM_START = re.compile(b'BZh[1-9]\x31\x41\x59\x26\x53\x59')
+MIN_SPLIT_BYTES = 4 * 1024 * 1024
+
+
+def default_workers():
+    """ How many threads to use when reading data files
+
+    Returns:
+        int: number of CPUs, or 1 if that can't be determined
+    """
+    return os.cpu_count() or 1
+
+
+def read_manifest(data_dir):
+    """ Read the manifest of compacted shards in a data directory
+
+    Args:
+        data_dir (str): path to the data directory
+    Returns:
+        dict: the manifest, keyed by file prefix (empty if the directory was never compacted)
+    """
+    manifest_path = os.path.join(data_dir, SHARDS_DIR, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+
+    return json.load(open(manifest_path, 'r'))
+
+
+def file_stat(file_path):
+    """ The size and modification time of a file, to tell later if it has changed
+
+    Args:
+        file_path (str): path to the file
+    Returns:
+        dict: {"size": bytes, "mtime": timestamp}
+    """
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def compacted_sources(category):
+    """ The raw files merged into one category's shards, as recorded in the manifest
+
+    Args:
+        category (dict): the entry for one file prefix in the manifest
+    Returns:
+        dict: file name -> file_stat() when it was merged (None in manifests from before that was recorded)
+    """
+    sources = category.get('sources', {})
+    if isinstance(sources, list):
+        return dict((s, None) for s in sources)
+    return dict(sources)
+
+
+def find_data_files(data_dir, prefix, keys=None):
+    """ Find all the data files for one file prefix: the compacted shards listed in the manifest,
+    plus any plain txt or compressed output files that haven't been compacted yet.
+    A raw file that has changed since it was compacted (a run was still appending to it) is read again.
+
+    Args:
+        data_dir (str): path to the data directory
+        prefix (str): file prefix to look for, e.g. "winners_"
+        keys (list): optional, only return the shards whose key range could hold one of these URLs
+    Returns:
+        list: paths to all the data files
+    """
+    category = read_manifest(data_dir).get(prefix, {})
+    shards = category.get('shards', [])
+    if keys is not None:
+        keys = sorted(keys)
+        shards = [s for s in shards if _in_range(keys, s['first'], s['last'])]
+    shards = [os.path.join(data_dir, SHARDS_DIR, s['file']) for s in shards]
+    compacted = compacted_sources(category)
+
+    raw_files = []
+    for ext in [''] + EXTENSIONS:
+        raw_files += glob(os.path.join(data_dir, prefix + '*.txt' + ext))
+    return shards + sorted(f for f in raw_files if not _compacted(f, compacted))
+
+
+def _in_range(keys, first, last):
+    """ Is any of these keys between first and last (inclusive)?
+
+    Args:
+        keys (list): sorted keys
+        first (str): first key in a shard
+        last (str): last key in a shard
+    Returns:
+        bool: True if the shard could hold one of the keys
+    """
+    i = bisect_left(keys, first)
+    return i < len(keys) and keys[i] <= last
+
+
+def _compacted(file_path, compacted):
+    """ Was this raw file merged into the shards, and hasn't changed since?
+
+    Args:
+        file_path (str): path to a raw data file
+        compacted (dict): from compacted_sources()
+    Returns:
+        bool: True if all the lines in this file are already in the shards
+    """
+    name = os.path.basename(file_path)
+    if name not in compacted:
+        return False
+    return compacted[name] is None or compacted[name] == file_stat(file_path)
+
+
+def write_lines(file_path, lines, lines_per_stream=20000):
+    """ Write lines to a data file, compressed according to its extension (see file_codecs.py).
+    A compressed file is made of several independent streams, so that a bzip2 file can later
+    be decompressed in parallel.
+
+    Args:
+        file_path (str): path to the new file, e.g. "winners_20200101_120000.txt.zst"
+        lines (iterable): lines of text, each ending in a newline
+        lines_per_stream (int): number of lines in each compressed stream
+    Returns: None
+    """
+    codec = codec_for_path(file_path, sniff=False)
+    with open(file_path, 'wb') as f:
+        block = []
+        for line in lines:
+            block.append(line)
+            if len(block) >= lines_per_stream:
+                f.write(_compress_block(block, codec))
+                block = []
+
+        if len(block):
+            f.write(_compress_block(block, codec))
+
+
+def _compress_block(lines, codec):
+    """ Compress some lines of text into a single, complete stream
+
+    Args:
+        lines (list): lines of text
+        codec (Codec): codec to compress with, or None to leave the text uncompressed
+    Returns:
+        bytes: one compressed stream
+    """
+    data = ''.join(lines).encode('utf-8')
+    return data if codec is None else compress(data, codec)
+
+
+def map_data_files(fn, file_paths, workers=None):
+    """ Call fn(file_path, workers) on each data file, in a thread pool, yielding the results as we go.
+    Only a few files are in flight at once, so the results of the whole library are never all in RAM.
+    If there are fewer files than workers, the files are read one at a time instead,
+    and the workers are spent on decompressing the pieces of each file in parallel.
+    (In that case, if fn returns a generator, the file is streamed straight to the caller.)
+
+    Args:
+        fn (function): takes a file path and a number of workers, returns anything
+        file_paths (list): paths to data files
+        workers (int): number of threads to use (defaults to the number of CPUs)
+    Returns:
+        generator: the result of fn for each file, in order
+    """
+    workers = default_workers() if workers is None else max(1, int(workers))
+    if workers == 1 or len(file_paths) < workers:
+        for f in file_paths:
+            yield fn(f, workers)
+        return
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for f in file_paths:
+            pending.append(pool.submit(_read_data_file, fn, f))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+
+        while len(pending):
+            yield pending.popleft().result()
+
+
+def _read_data_file(fn, file_path):
+    """ Call fn on one data file, inside a worker thread
+
+    Args:
+        fn (function): takes a file path and a number of workers, returns anything
+        file_path (str): path to a data file
+    Returns:
+        the result of fn, with any generator run to the end here, rather than in the caller's thread
+    """
+    result = fn(file_path, 1)
+    return list(result) if isinstance(result, GeneratorType) else result
+
+
+def iter_lines(file_path, workers=1):
+    """ Stream the lines of a plain text or compressed data file, as strings
+
+    Args:
+        file_path (str): path to a *.txt file, or a compressed one (e.g. *.txt.bz2 or *.txt.zst)
+        workers (int): threads used to decompress the streams of a large bzip2 file
+    Returns:
+        generator: each line of the file
+    """
+    codec = codec_for_path(file_path)
+    if codec is None:
+        with open(file_path, 'r') as f:
+            for line in f:
+                yield line
+        return
+    elif codec.name != 'bz2':
+        with open_file(file_path, 'rb', codec) as f:
+            for line in f:
+                yield line.decode('utf-8')
+        return
+
+    data = b''
+    if workers > 1 and os.path.getsize(file_path) >= MIN_SPLIT_BYTES:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+
+    blocks = bz2_streams(data)
+    if len(blocks) < 2:
+        with open_file(file_path, 'rb', codec) as f:
+            for line in f:
+                yield line.decode('utf-8')
+        return
+
+    # decompress the streams in parallel, but stitch the lines together in order
+    partial = b''
+    for chunk in _decompress_blocks(data, blocks, workers):
+        lines = (partial + chunk).split(b'\n')
+        partial = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8') + '\n'
+
+    if len(partial):
+        yield partial.decode('utf-8')
+
+
+def bz2_streams(data):
+    """ Find the (likely) start of every bzip2 stream in a compressed file
+
+    Args:
+        data (bytes): the whole compressed file
+    Returns:
+        list: (start, end) byte offsets of each stream
+    """
+    starts = [m.start() for m in BZ2_STREAM_START.finditer(data)]
+    if not len(starts) or starts[0] != 0:
+        return []
+
+    return list(zip(starts, starts[1:] + [len(data)]))
+
+
+class _NotAStreamBoundary(Exception):
+    pass
+
+
+def _decompress_block(data, start, end):
+    """ Decompress one piece of a bzip2 file, which should hold one or more complete streams
+
+    Args:
+        data (bytes): the whole compressed file
+        start (int): offset of the first stream in this piece
+        end (int): offset just past the end of this piece
+    Returns:
+        bytes: decompressed content of this piece
+    """
+    out = []
+    chunk = data[start:end]
+    while len(chunk):
+        d = BZ2Decompressor()
+        try:
+            out.append(d.decompress(chunk))
+        except (OSError, EOFError):
+            raise _NotAStreamBoundary()
+        if not d.eof:
+            raise _NotAStreamBoundary()
+        chunk = d.unused_data
+
+    return b''.join(out)
+
+
+def _decompress_blocks(data, blocks, workers):
+    """ Decompress the pieces of a bzip2 file in a thread pool, yielding them in order,
+    with only a few pieces in memory at once.
+
+    If one of the split points turns out to be a false positive (the magic number just happened
+    to appear inside a stream), everything from the first piece that fails onward is decompressed
+    in one go. That piece always starts at a real stream boundary, because the piece before it
+    decompressed to the end of a stream exactly.
+
+    Args:
+        data (bytes): the whole compressed file
+        blocks (list): (start, end) byte offsets of each stream
+        workers (int): number of threads to use
+    Returns:
+        generator: decompressed content of each piece, in order
+    """
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, (start, end) in enumerate(blocks):
+            pending.append((start, pool.submit(_decompress_block, data, start, end)))
+            if len(pending) < 2 * workers and i < len(blocks) - 1:
+                continue
+
+            while len(pending) >= 2 * workers or (len(pending) and i == len(blocks) - 1):
+                start, future = pending.popleft()
+                try:
+                    yield future.result()
+                except _NotAStreamBoundary:
+                    for _, f in pending:
+                        f.cancel()
+                    yield _decompress_block(data, start, len(data))
+                    return
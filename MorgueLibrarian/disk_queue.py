@@ -0,0 +1,147 @@
+""" Disk Queue
+
+A bounded, first-in first-out queue of URLs, stored on disk so that it survives restarts and
+can be shared between processes. It is used to stream newly-discovered morgue URLs from the
+spider straight into the parser (see pipeline.py).
+
+The queue lives in a directory:
+
+    queue.txt   one URL per line, appended to by the producer
+    offset      how many bytes of queue.txt the consumer has already taken
+    closed      exists once the producer is finished, until the consumer has seen it
+
+Once the consumer has taken everything, queue.txt is truncated, so it never grows without bound.
+"""
+from datetime import datetime
+import os
+from time import sleep
+from file_lock import FileLock
+
+
+class DiskQueue:
+    """ A bounded FIFO queue of URLs on disk, safe to share between threads and processes """
+
+    def __init__(self, queue_dir, max_bytes=4 * 1024 * 1024, poll_seconds=1.0):
+        self.queue_dir = queue_dir
+        self.max_bytes = int(max_bytes)
+        self.poll_seconds = float(poll_seconds)
+        self.queue_path = os.path.join(queue_dir, 'queue.txt')
+        self.offset_path = os.path.join(queue_dir, 'offset')
+        self.closed_path = os.path.join(queue_dir, 'closed')
+        self.lock = FileLock(os.path.join(queue_dir, 'lock'))
+        os.makedirs(queue_dir, exist_ok=True)
+
+    def put(self, urls, timeout=None):
+        """ Add URLs to the end of the queue, waiting for the consumer if the queue is full
+
+        Args:
+            urls (iterable): URLs to add
+            timeout (float): optional, most seconds to wait for room in the queue
+        Returns:
+            bool: True if the URLs were added, False if we timed out
+        """
+        text = ''.join(u.strip() + '\n' for u in urls if len(u.strip()))
+        if not len(text):
+            return True
+
+        start = datetime.now().timestamp()
+        while True:
+            with self.lock:
+                if self._pending_bytes() + len(text) <= self.max_bytes or not self._pending_bytes():
+                    with open(self.queue_path, 'a') as f:
+                        f.write(text)
+                    return True
+
+            if timeout is not None and datetime.now().timestamp() - start > timeout:
+                return False
+            sleep(self.poll_seconds)
+
+    def get(self, max_items=100):
+        """ Take up to max_items URLs off the front of the queue, without waiting
+
+        Args:
+            max_items (int): most URLs to take
+        Returns:
+            list: URLs (empty if the queue is empty)
+        """
+        with self.lock:
+            if not os.path.exists(self.queue_path):
+                return []
+
+            offset = self._offset()
+            with open(self.queue_path, 'rb') as f:
+                f.seek(offset)
+                lines = []
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    lines.append(line)
+                    if len(lines) >= max_items:
+                        break
+
+            offset += sum(len(line) for line in lines)
+            if offset >= os.path.getsize(self.queue_path):
+                # everything has been consumed, start the file over
+                open(self.queue_path, 'w').close()
+                offset = 0
+            self._write_offset(offset)
+
+        return [line.decode('utf-8').strip() for line in lines]
+
+    def close(self):
+        """ The producer is done, no more URLs will be added
+
+        Returns: None
+        """
+        open(self.closed_path, 'w').close()
+
+    def reopen(self):
+        """ A new producer is starting (or the consumer has seen the last one finish),
+        so the queue is open again
+
+        Returns: None
+        """
+        try:
+            os.remove(self.closed_path)
+        except FileNotFoundError:
+            pass
+
+    def finished(self):
+        """ Is the producer done, and has everything been consumed?
+
+        Returns:
+            bool: True if there will never be anything more to get
+        """
+        with self.lock:
+            return os.path.exists(self.closed_path) and not self._pending_bytes()
+
+    def _pending_bytes(self):
+        """ How many bytes are in the queue, waiting to be consumed? (Call while holding the lock.)
+
+        Returns:
+            int: number of bytes
+        """
+        if not os.path.exists(self.queue_path):
+            return 0
+        return os.path.getsize(self.queue_path) - self._offset()
+
+    def _offset(self):
+        """ How many bytes of the queue file have already been consumed? (Call while holding the lock.)
+
+        Returns:
+            int: number of bytes
+        """
+        if not os.path.exists(self.offset_path):
+            return 0
+        return int(open(self.offset_path, 'r').read().strip() or 0)
+
+    def _write_offset(self, offset):
+        """ Record how many bytes of the queue file have been consumed (Call while holding the lock.)
+
+        Args:
+            offset (int): number of bytes
+        Returns: None
+        """
+        with open(self.offset_path + '.tmp', 'w') as f:
+            f.write(str(offset))
+        os.replace(self.offset_path + '.tmp', self.offset_path)
@@ -0,0 +1,180 @@
+""" File Codecs
+
+Every compressed file MorgueLibrarian reads or writes (master URL files, output files, compacted
+shards, saved morgues, and the response cache) goes through one of these codecs:
+
+    codec   extension   notes
+    gzip    .gz         fast to decompress, always available
+    bz2     .bz2        small, but slow to decompress
+    xz      .xz         smallest, slow to compress
+    zstd    .zst        fastest, needs the optional "zstandard" package
+
+When reading, the codec is chosen by the file extension, or failing that by the magic bytes at the
+start of the file. When writing, it is chosen by the file extension. New files are written with
+the fastest codec installed (zstd, otherwise gzip), see default_codec().
+
+Every codec can read a file made of several concatenated streams, so big files can be written
+one block of lines at a time (see data_files.write_lines).
+"""
+import bz2
+from collections import namedtuple
+import gzip
+import io
+import lzma
+
+# one compression format
+Codec = namedtuple('Codec', ['name', 'extension', 'magic'])
+
+CODECS = {'gzip': Codec('gzip', '.gz', b'\x1f\x8b'),
+          'bz2': Codec('bz2', '.bz2', b'BZh'),
+          'xz': Codec('xz', '.xz', b'\xfd7zXZ\x00'),
+          'zstd': Codec('zstd', '.zst', b'\x28\xb5\x2f\xfd')}
+EXTENSIONS = [c.extension for c in CODECS.values()]
+MAGIC_BYTES = max(len(c.magic) for c in CODECS.values())
+
+
+def available_codecs():
+    """ Which codecs can be used here? (zstd needs an optional package)
+
+    Returns:
+        list: names of the usable codecs
+    """
+    names = ['gzip', 'bz2', 'xz']
+    if _zstandard() is not None:
+        names.append('zstd')
+    return names
+
+
+def default_codec():
+    """ The codec new files are written with: the fastest one to decompress that is installed
+
+    Returns:
+        Codec: zstd if it is installed, otherwise gzip
+    """
+    return CODECS['zstd'] if _zstandard() is not None else CODECS['gzip']
+
+
+def codec_for_path(file_path, sniff=True):
+    """ Determine the codec of a file, by its extension, or else by the magic bytes it starts with
+
+    Args:
+        file_path (str): path to the file
+        sniff (bool): if the extension isn't known, look at the start of the file
+    Returns:
+        Codec: the codec of this file, or None if it isn't compressed
+    """
+    for codec in CODECS.values():
+        if file_path.endswith(codec.extension):
+            return codec
+
+    if sniff:
+        try:
+            with open(file_path, 'rb') as f:
+                start = f.read(MAGIC_BYTES)
+        except OSError:
+            return None
+
+        for codec in CODECS.values():
+            if start.startswith(codec.magic):
+                return codec
+
+    return None
+
+
+def strip_extension(file_path):
+    """ Remove the compression extension from a file path, if there is one
+
+    Args:
+        file_path (str): e.g. "data/winners_20200101_120000.txt.bz2"
+    Returns:
+        str: e.g. "data/winners_20200101_120000.txt"
+    """
+    for ext in EXTENSIONS:
+        if file_path.endswith(ext):
+            return file_path[:-len(ext)]
+    return file_path
+
+
+def open_file(file_path, mode='rb', codec=None):
+    """ Open a file, compressed or not, in binary mode
+
+    Args:
+        file_path (str): path to the file
+        mode (str): "rb" to read, "wb" to write, or "ab" to append
+        codec (Codec): optional, otherwise it is chosen by codec_for_path
+    Returns:
+        file: a file object that reads or writes uncompressed bytes
+    """
+    if codec is None:
+        codec = codec_for_path(file_path, sniff=mode.startswith('r'))
+
+    if codec is None:
+        return open(file_path, mode)
+    elif codec.name == 'gzip':
+        return gzip.open(file_path, mode)
+    elif codec.name == 'bz2':
+        return bz2.open(file_path, mode)
+    elif codec.name == 'xz':
+        return lzma.open(file_path, mode)
+
+    zstandard = _require_zstandard()
+    if mode.startswith('r'):
+        reader = zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), read_across_frames=True,
+                                                           closefd=True)
+        return io.BufferedReader(reader)
+    return zstandard.ZstdCompressor().stream_writer(open(file_path, mode), closefd=True)
+
+
+def read_bytes(file_path):
+    """ Read the whole (decompressed) content of a file, compressed or not
+
+    Args:
+        file_path (str): path to the file
+    Returns:
+        bytes: content of the file
+    """
+    with open_file(file_path, 'rb') as f:
+        return f.read()
+
+
+def compress(data, codec):
+    """ Compress some bytes into a single, complete stream
+
+    Args:
+        data (bytes): uncompressed data
+        codec (Codec): codec to compress with
+    Returns:
+        bytes: one compressed stream
+    """
+    if codec.name == 'gzip':
+        return gzip.compress(data)
+    elif codec.name == 'bz2':
+        return bz2.compress(data)
+    elif codec.name == 'xz':
+        return lzma.compress(data)
+    return _require_zstandard().ZstdCompressor().compress(data)
+
+
+def _zstandard():
+    """ The optional zstandard module, if it is installed
+
+    Returns:
+        module: zstandard, or None
+    """
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def _require_zstandard():
+    """ The optional zstandard module, which we can't do without
+
+    Returns:
+        module: zstandard
+    """
+    zstandard = _zstandard()
+    if zstandard is None:
+        raise ImportError('Reading or writing zstd files requires the "zstandard" package.')
+    return zstandard
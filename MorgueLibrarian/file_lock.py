@@ -0,0 +1,118 @@
+""" File Lock
+
+A very simple lock, shared between threads and processes (even on different machines, if they
+share a filesystem that supports locking, like a local disk or NFS with lockd).
+
+The lock is held with the operating system's own file locking (flock, or msvcrt on Windows) on
+a lock file that is never removed, so there is never a lock file to break: if a process dies
+holding the lock, the operating system releases it. Threads in the same process also take a
+per-path threading lock first, as some filesystems only lock between processes.
+"""
+import os
+from threading import Lock
+from time import sleep
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# one threading lock per lock file, shared by every FileLock on that path in this process
+_THREAD_LOCKS = {}
+_THREAD_LOCKS_LOCK = Lock()
+
+
+class FileLock:
+    """ Context manager that holds a lock file for the duration of a with block """
+
+    def __init__(self, file_path, poll_seconds=0.05):
+        self.file_path = file_path
+        self.poll_seconds = float(poll_seconds)
+        self.thread_lock = FileLock._thread_lock(file_path)
+        self.file = None
+
+    def acquire(self):
+        """ Block until we hold the lock
+
+        Returns: None
+        """
+        self.thread_lock.acquire()
+        try:
+            f = open(self.file_path, 'a+')
+            while not FileLock._try_lock(f):
+                sleep(self.poll_seconds)
+            self.file = f
+        except BaseException:
+            self.thread_lock.release()
+            raise
+
+    def release(self):
+        """ Give up the lock
+
+        Returns: None
+        """
+        f = self.file
+        self.file = None
+        try:
+            FileLock._unlock(f)
+            f.close()
+        finally:
+            self.thread_lock.release()
+
+    @staticmethod
+    def _try_lock(f):
+        """ Try to lock an open lock file, without waiting
+
+        Args:
+            f (file): the open lock file
+        Returns:
+            bool: True if we now hold the lock
+        """
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _unlock(f):
+        """ Unlock an open lock file
+
+        Args:
+            f (file): the open lock file
+        Returns: None
+        """
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    @staticmethod
+    def _thread_lock(file_path):
+        """ The threading lock for a lock file, shared by every FileLock on that path in this process
+
+        Args:
+            file_path (str): path to the lock file
+        Returns:
+            Lock: threading lock
+        """
+        key = os.path.abspath(file_path)
+        with _THREAD_LOCKS_LOCK:
+            if key not in _THREAD_LOCKS:
+                _THREAD_LOCKS[key] = Lock()
+            return _THREAD_LOCKS[key]
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
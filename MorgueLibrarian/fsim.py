@@ -11,11 +11,34 @@ Usage:
 
     python fsim.py  base_damage  STR  weapon_skill  fighting_skill  enchant  slaying
 
+Batch Mode:
+
+In batch mode, every argument may be a single value or an inclusive range "start:stop[:step]",
+and the whole grid of combinations is evaluated at once, with NumPy. The base damage can instead
+come from a CSV of weapons, with one "name,base_damage" line per weapon. The result is a table
+of damage (expected damage by default) with one column for every value of one parameter
+(weapon skill by default), and one row for every combination of the rest.
+
+    python fsim.py -b  base_damage  STR  weapon_skill  fighting_skill  enchant  slaying
+    python fsim.py -b  17  18  0:27  10:20:5  0:9:3  0
+    python fsim.py -b -w weapons.csv  STR  weapon_skill  fighting_skill  enchant  slaying
+    python fsim.py -b -w weapons.csv -c fighting_skill -s max  20  27  0:27  9  0
+
 """
+import csv
+from itertools import product
 from sys import argv
 
+# CONSTANTS
+PARAMS = ('base_damage', 'strength', 'weapon_skill', 'fighting_skill', 'enchant', 'slaying')
+STATS = ('min', 'expected', 'max')
+
 
 def main():
+    if len(argv) > 1 and argv[1].lower() in ('-b', '--batch'):
+        batch_main(argv[2:])
+        return
+
     if len(argv) < 7:
         usage()
 
@@ -36,6 +59,145 @@ def damage(base_damage, strength, weapon_skill, fighting_skill, enchant, slaying
     return mind, expd, maxd
 
 
+def batch_main(args):
+    """ Parse the batch mode command line, evaluate the whole grid, and print the table
+
+    Args:
+        args (list): command line arguments, after the batch flag
+    Returns: None
+    """
+    column = 'weapon_skill'
+    stat = 'expected'
+    weapon_file = None
+    values = []
+
+    a = 0
+    while a < len(args):
+        if args[a].lower() in ('-c', '--column'):
+            a += 1
+            column = args[a].lower()
+        elif args[a].lower() in ('-s', '--stat'):
+            a += 1
+            stat = args[a].lower()
+        elif args[a].lower() in ('-w', '--weapons'):
+            a += 1
+            weapon_file = args[a]
+        else:
+            try:
+                values.append(parse_range(args[a]))
+            except ValueError:
+                usage()
+        a += 1
+
+    names = []
+    if weapon_file is not None:
+        names, base_damages = read_weapons(weapon_file)
+        values = [base_damages] + values
+
+    if len(values) != len(PARAMS) or column not in PARAMS or stat not in STATS:
+        usage()
+
+    grid = batch_damage(*values)[STATS.index(stat)]
+    print_table(grid, values, column, names)
+
+
+def parse_range(text):
+    """ Parse a single value, or an inclusive range of values "start:stop[:step]"
+
+    Args:
+        text (str): e.g. "17", "0:27", or "0:9:3"
+    Returns:
+        list: all the values in the range
+    Raises:
+        ValueError: if the text isn't a number or a valid range
+    """
+    if ':' not in text:
+        return [float(text)]
+
+    parts = [float(p) for p in text.split(':')]
+    if len(parts) not in (2, 3):
+        raise ValueError('A range is "start:stop" or "start:stop:step": ' + text)
+
+    step = parts[2] if len(parts) > 2 else 1.0
+    if step <= 0 or parts[0] > parts[1]:
+        raise ValueError('A range needs start <= stop and a positive step: ' + text)
+
+    num = int(round((parts[1] - parts[0]) / step)) + 1
+    return [parts[0] + i * step for i in range(num)]
+
+
+def read_weapons(file_path):
+    """ Read a CSV of weapons, with one "name,base_damage" line per weapon (a header line is skipped)
+
+    Args:
+        file_path (str): path to the CSV file
+    Returns:
+        tuple: (list of weapon names, list of base damages)
+    """
+    names = []
+    base_damages = []
+    with open(file_path, 'r') as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            try:
+                base_damages.append(float(row[1]))
+            except ValueError:
+                continue
+            names.append(row[0].strip())
+
+    return names, base_damages
+
+
+def batch_damage(base_damage, strength, weapon_skill, fighting_skill, enchant, slaying):
+    """ Evaluate damage() over every combination of the given parameter values, at once.
+    Each parameter gets its own axis, and NumPy broadcasting does the rest.
+
+    Args:
+        (lists): the values of each parameter, in the same order as damage()
+    Returns:
+        tuple: min, expected, and max damage; each an array with one axis per parameter
+    """
+    import numpy as np
+
+    params = (base_damage, strength, weapon_skill, fighting_skill, enchant, slaying)
+    axes = []
+    for i, values in enumerate(params):
+        shape = [1] * len(params)
+        shape[i] = -1
+        axes.append(np.asarray(values, dtype=float).reshape(shape))
+
+    return tuple(np.broadcast_arrays(*[np.asarray(d, dtype=float) for d in damage(*axes)]))
+
+
+def print_table(grid, values, column, names=None):
+    """ Print one damage table: a column for every value of one parameter,
+    and a row for every combination of all the others (that have more than one value).
+
+    Args:
+        grid (array): damage, with one axis per parameter
+        values (list): the values of each parameter
+        column (str): name of the parameter to use for the columns
+        names (list): optional, weapon names to label the base damage values with
+    Returns: None
+    """
+    col = PARAMS.index(column)
+    rows = [i for i in range(len(PARAMS)) if i != col and (len(values[i]) > 1 or (i == 0 and names))]
+
+    headers = ['weapon' if i == 0 and names else PARAMS[i] for i in rows]
+    print('\t'.join(headers + ['{0}={1:g}'.format(column, v) for v in values[col]]))
+    for index in product(*[range(len(values[i])) for i in rows]):
+        labels = []
+        for i, j in zip(rows, index):
+            labels.append(names[j] if i == 0 and names else '{0:g}'.format(values[i][j]))
+
+        full = [0] * len(PARAMS)
+        for i, j in zip(rows, index):
+            full[i] = j
+        full[col] = slice(None)
+        print('\t'.join(labels + ['%3.1f' % d for d in grid[tuple(full)]]))
+
+
 def print_damage(tup):
     print('min\texpected\tmax')
     print('%1.0f' % tup[0] + '\t' + '%3.1f' % tup[1] + '\t\t' + '%3.1f' % tup[2])
@@ -0,0 +1,212 @@
+""" Host Policies
+
+Every DCSS server gets its own politeness policy. The wait between two requests to the same
+server is the largest of:
+
+1. the wait set for that server in the config file (or the default wait),
+2. the Crawl-delay (or Request-rate) in that server's robots.txt, and
+3. any extra slow-down we picked up because the server told us to back off
+   (HTTP 429 or 503, optionally with a Retry-After header). Every normal response after
+   that eases the slow-down, until we are back to the waits above.
+
+The optional config file is JSON, e.g. data/host_policies.json:
+
+    {
+        "default_wait": 60.0,
+        "skip": ["http://dobrazupa.com"],
+        "hosts": {
+            "http://crawl.akrasiac.org": {"wait": 120.0},
+            "http://crawl.example.org": {"wait": 5.0}
+        }
+    }
+
+A server we run ourselves can be given a shorter wait than the default, but never shorter than
+the Crawl-delay it asks for in its own robots.txt.
+
+Back-off deadlines are kept on the given clock (see crawl_clock.py), the real wall clock by default.
+The slow-downs are shared by all the parser's worker threads, so they are only changed under a lock.
+"""
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+import json
+import os
+from random import choice
+from threading import Lock
+from urllib.robotparser import RobotFileParser
+import requests
+from crawl_clock import Clock
+from library_data import USER_AGENTS
+
+DEFAULT_SKIP = ['http://dobrazupa.com']
+
+
+def base_url(url):
+    """ Find the base URL of a URL, with https treated the same as http
+
+    Args:
+        url (str): Any arbitrary URL
+    Returns:
+        str: scheme and host of the URL, e.g. "http://crawl.akrasiac.org"
+    """
+    return url[:url[8:].find('/') + 8].replace('https', 'http')
+
+
+def retry_after_seconds(header):
+    """ Read the Retry-After header, which is either a number of seconds or an HTTP date
+
+    Args:
+        header (str): value of the Retry-After header (may be empty)
+    Returns:
+        float: seconds to wait (zero if the header is missing or unreadable)
+    """
+    header = header.strip()
+    if header.isdigit():
+        return float(header)
+
+    try:
+        return max(0.0, parsedate_to_datetime(header).timestamp() - datetime.now().timestamp())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class HostPolicies:
+    """ Per-host politeness policies, loaded from an optional config file and from each server's robots.txt """
+
+    MAX_SLOW_DOWN = 16.0
+    SPEED_UP = 0.8
+
+    def __init__(self, file_path=None, default_wait=60.0, use_robots=True, clock=None):
+        self.default_wait = abs(float(default_wait))
+        self.use_robots = use_robots
+        self.clock = Clock() if clock is None else clock
+        self.skip = set(DEFAULT_SKIP)
+        self.waits = {}
+        self.robots = {}
+        self.slow_downs = {}
+        self.not_befores = {}
+        self.lock = Lock()
+
+        if file_path and os.path.exists(file_path):
+            self.load(file_path)
+
+    def load(self, file_path):
+        """ Read the per-host policies from a JSON config file
+
+        Args:
+            file_path (str): path to the config file
+        Returns: None
+        """
+        config = json.load(open(file_path, 'r'))
+        self.default_wait = abs(float(config.get('default_wait', self.default_wait)))
+        self.skip.update(base_url(u) for u in config.get('skip', []))
+        for host, policy in config.get('hosts', {}).items():
+            if 'wait' in policy:
+                self.waits[base_url(host)] = abs(float(policy['wait']))
+
+    def skipped(self, base):
+        """ Should we stay away from this server entirely?
+
+        Args:
+            base (str): base URL of a server
+        Returns:
+            bool: True if this server should never be requested
+        """
+        return base in self.skip
+
+    def allowed(self, url):
+        """ Does the server's robots.txt allow us to fetch this URL?
+
+        Args:
+            url (str): Any arbitrary URL
+        Returns:
+            bool: True if we may fetch this URL
+        """
+        robots = self._robots(base_url(url))
+        return robots is None or robots.can_fetch('*', url)
+
+    def wait_for(self, base):
+        """ How long must we wait between two requests to this server?
+
+        Args:
+            base (str): base URL of a server
+        Returns:
+            float: wait in seconds
+        """
+        wait = self.waits.get(base, self.default_wait)
+
+        robots = self._robots(base)
+        if robots is not None:
+            delay = robots.crawl_delay('*')
+            if delay:
+                wait = max(wait, float(delay))
+            rate = robots.request_rate('*')
+            if rate and rate.requests:
+                wait = max(wait, rate.seconds / float(rate.requests))
+
+        return wait * self.slow_downs.get(base, 1.0)
+
+    def not_before(self, base):
+        """ The earliest time we may hit this server again, if it asked us to back off.
+
+        Args:
+            base (str): base URL of a server
+        Returns:
+            float: timestamp, or zero if the server hasn't asked us to back off
+        """
+        return self.not_befores.get(base, 0.0)
+
+    def slow_down(self, url, retry_after=None):
+        """ The server told us to back off (HTTP 429 or 503), so double the wait for this host,
+        and respect the Retry-After header if there was one.
+
+        Args:
+            url (str): URL that was rejected
+            retry_after (float): seconds the server asked us to wait, if any
+        Returns: None
+        """
+        base = base_url(url)
+        with self.lock:
+            self.slow_downs[base] = min(HostPolicies.MAX_SLOW_DOWN, 2.0 * self.slow_downs.get(base, 1.0))
+            if retry_after:
+                not_before = self.clock.now() + float(retry_after)
+                self.not_befores[base] = max(self.not_before(base), not_before)
+
+    def speed_up(self, url):
+        """ The server answered normally, so ease any slow-down for this host back toward its usual wait
+
+        Args:
+            url (str): URL that was fetched
+        Returns: None
+        """
+        base = base_url(url)
+        with self.lock:
+            if base in self.slow_downs:
+                slow_down = HostPolicies.SPEED_UP * self.slow_downs[base]
+                if slow_down > 1.0:
+                    self.slow_downs[base] = slow_down
+                else:
+                    del self.slow_downs[base]
+
+    def _robots(self, base):
+        """ Fetch and parse the robots.txt for a server, only once per server
+
+        Args:
+            base (str): base URL of a server
+        Returns:
+            RobotFileParser: parsed robots.txt, or None if there isn't one
+        """
+        if not self.use_robots or not base.startswith('http'):
+            return None
+
+        if base not in self.robots:
+            self.robots[base] = None
+            try:
+                r = requests.get(base + '/robots.txt', headers={'User-Agent': choice(USER_AGENTS)}, timeout=5)
+                if r.status_code == 200:
+                    robots = RobotFileParser()
+                    robots.parse(r.content.decode('utf-8', 'replace').splitlines())
+                    self.robots[base] = robots
+            except Exception:
+                pass
+
+        return self.robots[base]
@@ -0,0 +1,98 @@
+""" Host Scheduler
+
+When the spider and the parser run at the same time (see pipeline.py), they must not both hit
+the same server at once. The HostScheduler is the one place that records when each server was
+last hit, and makes everyone wait their turn, according to the HostPolicies.
+
+If a state file is given, the last hit times are kept in that file (behind a FileLock), so that
+cooperating processes share one schedule.
+"""
+from datetime import datetime
+import json
+import os
+from threading import Lock
+from time import sleep
+from file_lock import FileLock
+from host_policies import HostPolicies, base_url
+
+
+class HostScheduler:
+    """ A politeness schedule shared by every stage (and process) that fetches URLs """
+
+    def __init__(self, policies=None, state_file=None):
+        self.policies = HostPolicies() if policies is None else policies
+        self.state_file = state_file
+        self.file_lock = FileLock(state_file + '.lock') if state_file else None
+        self.lock = Lock()
+        self.last_hits = {}
+
+    def refresh(self):
+        """ Re-read the last hit times shared by other processes, if there are any
+
+        Returns: None
+        """
+        if self.state_file:
+            with self.lock:
+                self.last_hits = self._read_state()
+
+    def acquire(self, url):
+        """ Wait until we are allowed to hit the server of this URL, and record that we are hitting it
+
+        Args:
+            url (str): URL we are about to fetch
+        Returns: None
+        """
+        base = base_url(url)
+        while True:
+            with self.lock:
+                if self.file_lock:
+                    self.file_lock.acquire()
+                try:
+                    if self.state_file:
+                        self.last_hits = self._read_state()
+
+                    now = datetime.now().timestamp()
+                    to_wait = self.ready_time(base) - now
+                    if to_wait <= 0:
+                        self.last_hits[base] = now
+                        if self.state_file:
+                            self._write_state()
+                        return
+                finally:
+                    if self.file_lock:
+                        self.file_lock.release()
+
+            sleep(to_wait)
+
+    def ready_time(self, base):
+        """ When may this server next be hit, according to the last hit times we already have?
+
+        Args:
+            base (str): base URL of a server
+        Returns:
+            float: timestamp
+        """
+        last_hit = self.last_hits.get(base, 0.0)
+        return max(last_hit + self.policies.wait_for(base), self.policies.not_before(base))
+
+    def _read_state(self):
+        """ Read the shared last hit times
+
+        Returns:
+            dict: last hit timestamp for each server
+        """
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            return json.load(open(self.state_file, 'r'))
+        except ValueError:
+            return {}
+
+    def _write_state(self):
+        """ Write the shared last hit times, replacing the old file in a single step
+
+        Returns: None
+        """
+        with open(self.state_file + '.tmp', 'w') as f:
+            json.dump(self.last_hits, f)
+        os.replace(self.state_file + '.tmp', self.state_file)
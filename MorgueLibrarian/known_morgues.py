@@ -1,6 +1,7 @@
-from bz2 import BZ2File
-from glob import glob
-import os
+from functools import partial
+from canonical_urls import canonical_url, game_fingerprint
+from data_files import find_data_files, iter_lines, map_data_files
+from library_data import LOSERS, WINNERS
 
 
 class KnownMorgues:
@@ -8,12 +9,26 @@ class KnownMorgues:
     To that end, we end up checking and re-checking if a URL has been seen or parsed before.
     This class encapsulates that logic.
     To improve the RAM footprint, we only save the hash of the URL.
+
+    URLs are compared in their canonical form (see canonical_urls.py), and we also keep the hash
+    of each morgue's game fingerprint (player and end time), to recognize the same game on a mirror.
+    Only games we actually parsed (winners and losers) are fingerprinted: a game that failed on one
+    mirror (or is still waiting to be parsed) may yet be read from another.
+
+    If we only need to check a few URLs (keys), only the compacted shards whose key range could
+    hold them are read (see compact_data.py). The same games on other mirrors are then only
+    recognized in the raw files not yet compacted.
     """
 
-    def __init__(self, file_prefixes=['morgue_urls'], dirs=['data']):
+    FINGERPRINTED = (WINNERS, LOSERS)
+
+    def __init__(self, file_prefixes=['morgue_urls'], dirs=['data'], workers=None, keys=None):
         self.file_prefixes = file_prefixes
         self.dirs = dirs
+        self.workers = workers
+        self.keys = keys
         self.paths = set()
+        self.games = set()
 
     def find(self):
         """ Master method to populate the known morgues collection
@@ -22,6 +37,7 @@ class KnownMorgues:
         """
         # this set of known morgues saves only the hash of the URL or file path, to save space
         self.paths = set()
+        self.games = set()
 
         for d in self.dirs:
             for prefix in self.file_prefixes:
@@ -34,32 +50,57 @@ class KnownMorgues:
 
         Here we parse one directory and one file prefix to find all the URLs that match that those
         file names and grab all the URLs from those files and add them to our hashed set.
+        The files (plain txt or compressed, and any compacted shards) are read in parallel, in a thread pool.
 
         Args:
             d (str): directory path to find files
             prefix (str): file prefix to look for
         Returns: None
         """
-        # read any old outputs that are in plain txt format
-        old_morgue_files = glob(os.path.join(d, prefix + '*.txt'))
-        for old_file in old_morgue_files:
-            self.paths.update([hash(f.strip().split()[0]) for f in open(old_file, 'r').readlines()])
+        old_morgue_files = find_data_files(d, prefix, self.keys)
+        fingerprint = prefix in KnownMorgues.FINGERPRINTED
+        read_hashes = partial(KnownMorgues._read_hashes, fingerprint=fingerprint)
+        for paths, games in map_data_files(read_hashes, old_morgue_files, self.workers):
+            self.paths.update(paths)
+            self.games.update(games)
 
-        # read any old outputs that are in bzip2 format
-        old_morgue_files = glob(os.path.join(d, prefix + '*.txt.bz2'))
-        for old_file in old_morgue_files:
-            self.paths.update([hash(f.strip().split()[0]) for f in BZ2File(old_file, 'r').readlines()])
+    @staticmethod
+    def _read_hashes(file_path, workers=1, fingerprint=True):
+        """ Stream through one output file, and hash the URL at the start of each line
 
-    def add(self, urls):
+        Args:
+            file_path (str): path to a plain txt or compressed output file
+            workers (int): threads used to decompress a large bzip2 file
+            fingerprint (bool): also hash the game fingerprint of each URL
+        Returns:
+            tuple: hashes of all the canonical URLs in the file, and of all their game fingerprints
+        """
+        paths = set()
+        games = set()
+        for line in iter_lines(file_path, workers):
+            cols = line.split()
+            if len(cols):
+                paths.add(hash(canonical_url(cols[0])))
+                game = game_fingerprint(cols[0]) if fingerprint else None
+                if game is not None:
+                    games.add(hash(game))
+
+        return paths, games
+
+    def add(self, urls, fingerprint=False):
         """ Helper method to add some collection of URLs to our hashed set.
 
         Args:
             urls (iterable): iterable collection URLs as strings
+            fingerprint (bool): also recognize these games on other mirrors (only once they are parsed)
         Returns: None
         """
         # the intended case, where a collection of URLs are passed
         for url in urls:
-            self.paths.add(hash(url.strip()))
+            self.paths.add(hash(canonical_url(url)))
+            game = game_fingerprint(url) if fingerprint else None
+            if game is not None:
+                self.games.add(hash(game))
 
     def includes(self, url):
         """ Helper method to test if a URL is included in our hashed set.
@@ -67,9 +108,13 @@ class KnownMorgues:
         Args:
             url (str): URL address
         Returns:
-            bool: Is this URL in the our set of known addresses?
+            bool: Is this URL (or the same game on a mirror) in the our set of known addresses?
         """
-        return hash(url) in self.paths
+        if hash(canonical_url(url)) in self.paths:
+            return True
+
+        game = game_fingerprint(url)
+        return game is not None and hash(game) in self.games
 
     def reset(self):
         """ Helper method to nuke all the URLs in our hashed set.
@@ -77,6 +122,7 @@ class KnownMorgues:
         Returns: None
         """
         self.paths = set()
+        self.games = set()
 
     def __len__(self):
         return len(self.paths)
@@ -2,11 +2,25 @@
 # Constants used for file names and paths
 DATA_DIR = 'data'
 DT_FMT = '%Y%m%d_%H%M%S'
+FEATURES = 'features_'
+HOST_POLICIES = 'host_policies.json'
+HOST_SCHEDULE = 'host_schedule.json'
+LINK_GRAPH = 'link_graph.json'
 LOSERS = 'losers_'
+MANIFEST = 'manifest.json'
 MORGUE_URLS = 'morgue_urls_'
+PAGE_VALIDATORS = 'page_validators.json'
 PARSER_ERRORS = 'parser_errors_'
+PATH_YIELDS = 'path_yields.json'
+PIPELINE_QUEUE = 'pipeline_queue'
+RESPONSE_CACHE = 'response_cache'
+RETRY_QUEUE = 'retry_queue.txt'
 SAVED_DIR = 'saved'
+SHARDS_DIR = 'shards'
+SPIDER_RETRY_QUEUE = 'spider_retry_queue.txt'
 WINNERS = 'winners_'
+WINNERS_INDEX = 'winners_index.npz'
+WORK_QUEUE = 'work_queue.sqlite'
 
 
 # Constants useful in HTML requests
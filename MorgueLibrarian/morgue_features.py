@@ -0,0 +1,101 @@
+""" Morgue Features
+
+A numeric description of a character: experience level, stats, runes, turn count, god, and the
+level of every skill. These are read from a morgue file, or from a character dump of a game that
+is still in progress, so that similar winning characters can be found (see similar_winners.py).
+
+Only the top of the file, down to the end of the skills section, is ever decoded.
+"""
+from collections import namedtuple
+import re
+from crawl_data import GODS, GODS_ABR, SKILLS
+from custom_errors import ParserError
+
+# the numeric description of one character (skills are in the same order as crawl_data.SKILLS)
+MorgueFeatures = namedtuple('MorgueFeatures', ['god', 'num_runes', 'xl', 'strength', 'intelligence', 'dexterity',
+                                               'turns', 'skills'])
+
+XL_RE = re.compile(r'XL:\s+(\d+)')
+STR_RE = re.compile(r'Str:\s+(\d+)')
+INT_RE = re.compile(r'Int:\s+(\d+)')
+DEX_RE = re.compile(r'Dex:\s+(\d+)')
+TURNS_RE = re.compile(r'Turns:\s+(\d+)')
+RUNES_RE = re.compile(r'\.\.\. and (\d+) runes|(\d+)/\d+ runes')
+GOD_RE = re.compile(r'God:[ \t]+([A-Za-z][A-Za-z \t]*?)[ \t]*(?:\[|$)', re.MULTILINE)
+# e.g. " - Level 14.2(17.0) Axes": the trained level, then (optionally) the level with any boosts
+SKILL_RE = re.compile(r'^[ \t]*[-+*O]?[ \t]*Level[ \t]+(\d+(?:\.\d+)?)(?:\(\d+(?:\.\d+)?\))?[ \t]+(.+?)[ \t]*$',
+                      re.MULTILINE)
+SKILLS_END_RE = re.compile(rb'\n[ \t\r]*\n')
+
+# if a file has no skills section, only decode this much of it, looking for the stats
+MAX_BYTES = 16384
+
+
+def read_features(data):
+    """ Read the numeric description of a character from a morgue file or character dump
+
+    Args:
+        data (bytes): the text of the morgue, with any HTML already stripped (a str is also accepted)
+    Returns:
+        MorgueFeatures: the numbers that describe this character
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    # the skills section comes after the inventory, which can be long: read down to its end
+    start = data.find(b'Skills:')
+    if start >= 0:
+        end = SKILLS_END_RE.search(data, start)
+        end = len(data) if end is None else end.start()
+        skills_text = data[start:end].decode('utf-8', 'replace')
+    else:
+        end = MAX_BYTES
+        skills_text = ''
+    text = data[:end].decode('utf-8', 'replace')
+
+    xl = XL_RE.search(text)
+    turns = TURNS_RE.search(text)
+    if xl is None or turns is None:
+        raise ParserError('No character stats found')
+
+    runes = RUNES_RE.search(text)
+    num_runes = 0 if runes is None else int(runes.group(1) or runes.group(2))
+
+    skills = dict((name.lower(), float(level)) for level, name in SKILL_RE.findall(skills_text))
+
+    return MorgueFeatures(god_code(_first_match(GOD_RE, text, '')), num_runes, int(xl.group(1)),
+                          int(_first_match(STR_RE, text, 0)), int(_first_match(INT_RE, text, 0)),
+                          int(_first_match(DEX_RE, text, 0)), int(turns.group(1)),
+                          tuple(skills.get(s, 0.0) for s in SKILLS))
+
+
+def god_code(name):
+    """ Convert a god's name, as written in a morgue, to the shorthand players use
+
+    Args:
+        name (str): e.g. "Sif Muna", or "the Shining One"
+    Returns:
+        str: e.g. "Sif", or "" if there is no god
+    """
+    name = name.strip().lower()
+    if name in GODS:
+        return GODS[name]
+    elif name in GODS_ABR:
+        return GODS_ABR[name]
+    elif len(name) and name.split()[-1] in GODS:
+        return GODS[name.split()[-1]]
+    return ''
+
+
+def _first_match(regex, text, default):
+    """ The first group matched by a regex in some text, or a default if there is no match
+
+    Args:
+        regex (Pattern): compiled regular expression, with one group
+        text (str): text to search
+        default: value to return if nothing matches
+    Returns:
+        str: the text of the first group
+    """
+    m = regex.search(text)
+    return default if m is None else m.group(1)
@@ -19,17 +19,45 @@ The longer the wait you put on this spider script, the nicer you will be to the
 volunteer their time to run DCSS's non-profit websites.
 
 Please consider setting WAIT_SECONDS to 120. or longer, and never run this script in parallel.
+The wait can be set per server in data/host_policies.json (see host_policies.py), and every
+server's own robots.txt Crawl-delay is always respected.
+
+To keep weekly recrawls cheap, the spider remembers the ETag, Last-Modified, length and digest of
+every page (in data/page_validators.json) and makes conditional requests. Pages that haven't
+changed are not re-parsed, and pages that changed recently are recrawled first.
+
+Pages are spidered in order of how likely they are to lead to new morgues (see crawl_frontier.py),
+so a spider run with a time limit (-t) spends its time on the most productive pages.
+
+With -r, every page fetched and the links on it are recorded in data/link_graph.json, so the crawl
+can be replayed offline to tune the depth, wait and auto-save settings (see crawl_simulator.py).
+
+With -c, every page fetched is kept in the compressed response cache (see response_cache.py).
+Listing pages do change, so a cached page is only used once a conditional request tells us it
+hasn't changed (HTTP 304), and then even a run recording the link graph (-r) needn't download it.
+
+Pages a server refuses with HTTP 429 or 503 are kept in data/spider_retry_queue.txt (see
+retry_queue.py), and spidered again once their backoff expires, later in the run or on the next run.
 """
 from bs4 import BeautifulSoup
 from bz2 import BZ2File
 from datetime import datetime
 from glob import glob
+import json
 import os
 from random import random
 from requests import get as get_url
 from sys import argv
+from urllib.parse import urldefrag, urljoin
+from canonical_urls import unique_urls
+from crawl_clock import Clock
+from crawl_frontier import CrawlFrontier
 from library_data import *
+from host_policies import HostPolicies, base_url, retry_after_seconds
 from known_morgues import KnownMorgues
+from page_validators import PageValidators
+from response_cache import ResponseCache
+from retry_queue import RetryQueue
 from url_iterator import URLIterator
 
 # CONSTANTS
@@ -43,6 +71,9 @@ def main():
     auto_save = int(AUTO_SAVE_SECONDS)
     depth = int(SEARCH_DEPTH)
     starting_url_file = STARTING_URL_FILE
+    time_limit = 0
+    record = False
+    use_cache = False
 
     # optional commandline parsing
     a = 1
@@ -53,32 +84,55 @@ def main():
         elif argv[a].lower() in ('-d', '--depth'):
             a += 1
             depth = int(argv[a])
+        elif argv[a].lower() in ('-t', '--time_limit'):
+            a += 1
+            time_limit = int(argv[a])
         elif argv[a].lower() in ('-u', '--url_file'):
             a += 1
             starting_url_file = argv[a]
+        elif argv[a].lower() in ('-r', '--record'):
+            record = True
+        elif argv[a].lower() in ('-c', '--cache'):
+            use_cache = True
         a += 1
 
     # parse input file for starting URLS
     starting_urls = [u.strip() for u in open(starting_url_file, 'r').readlines()]
 
     # run spider
-    ms = MorgueSpider(starting_urls, auto_save, depth)
+    ms = MorgueSpider(starting_urls, auto_save, depth, time_limit)
+    if record:
+        ms.record_links(os.path.join(DATA_DIR, LINK_GRAPH))
+    if use_cache:
+        ms.cache = ResponseCache(os.path.join(DATA_DIR, RESPONSE_CACHE))
     all_urls = ms.spider()
     print('Spidered {0} URLs'.format(len(all_urls)))
 
 
 class MorgueSpider:
 
-    def __init__(self, urls, auto_save=1800, depth=3):
+    def __init__(self, urls, auto_save=1800, depth=3, time_limit=0):
         self.urls = urls
         self.auto_save = float(auto_save)
         self.depth = int(depth)
+        self.time_limit = float(time_limit)
         self.data_dir = DATA_DIR
         self.dt_fmt = DT_FMT
+        self.frontier = CrawlFrontier(os.path.join(DATA_DIR, PATH_YIELDS))
+        self.known_morgues = None
         self.losers = LOSERS
         self.morgue_urls = MORGUE_URLS
         self.parser_errors = PARSER_ERRORS
+        self.policies = HostPolicies(os.path.join(DATA_DIR, HOST_POLICIES))
+        self.retry_queue = RetryQueue(os.path.join(DATA_DIR, SPIDER_RETRY_QUEUE))
+        self.validators = PageValidators(os.path.join(DATA_DIR, PAGE_VALIDATORS))
         self.winners = WINNERS
+        self.scheduler = None
+        self.on_morgues = None
+        self.clock = Clock()
+        self.cache = None
+        self.link_graph = None
+        self.link_graph_file = None
 
     def spider(self):
         """ Spider through all the links you can find, recursively, to look for DCSS morgue files,
@@ -89,6 +143,16 @@ class MorgueSpider:
         Returns:
             set: All the URLs that were found during the spidering
         """
+        self.validators.load()
+        self.frontier.load(self.data_dir, self.morgue_urls)
+        self.known_morgues = KnownMorgues([self.morgue_urls, self.winners, self.losers, self.parser_errors],
+                                          [self.data_dir])
+        self.known_morgues.find()
+        self.retry_queue.load()
+        for url, _ in self.retry_queue.exhausted():
+            self.retry_queue.remove(url)
+
+        self.deadline = self.clock.now() + self.time_limit if self.time_limit > 0 else float('inf')
         return self._spider(set(self.urls), set(self.urls), self.depth)
 
     def _spider(self, all_urls, new_urls, depth):
@@ -102,38 +166,81 @@ class MorgueSpider:
         Returns:
             set: All the URLs that were found during the spidering
         """
-        if depth <= 0 or len(new_urls) == 0:
+        if depth <= 0 or len(new_urls) == 0 or self.clock.now() > self.deadline:
             return all_urls
 
         print('Depth {0}: {1} new URLs'.format(depth, len(new_urls)))
         print('\t', end='', flush=True)
 
         # init some loop variables
-        start = datetime.now().timestamp()
+        start = self.clock.now()
         newer_urls = set()
 
-        url_iter = URLIterator(new_urls)
-        for url in url_iter:
-            if not (url.endswith('.html') and self._looks_crawl_related(url)):
-                # let's not spider the whole internet
-                continue
+        # pages a server refused earlier may be retried, once their backoff has expired
+        new_urls = new_urls.union(self.retry_queue.due(self.clock.now()))
+
+        # let's not spider the whole internet, and spider the most promising pages first
+        to_spider = [u for u in new_urls if self._should_spider(u)]
+        to_spider = self.frontier.order(to_spider, self.validators.priority)
 
+        url_iter = URLIterator(to_spider, policies=self.policies, ordered=True, scheduler=self.scheduler,
+                               clock=self.clock)
+        for url in url_iter:
             # look for links inside this URL
             print('.', end='', flush=True)
-            newer_urls.update(MorgueSpider.find_links_in_file(url))
+            fetched = self.clock.now()
+            links = self._find_new_links(url)
+            if self.link_graph is not None:
+                self._record_page(url, links, self.clock.now() - fetched)
+
+            # learn how productive this part of the site is (only morgues we never found before count)
+            morgues = set(m for m in MorgueSpider.find_morgues(links) if not self.known_morgues.includes(m))
+            morgues = morgues - all_urls - newer_urls
+            self.frontier.record(url, len(morgues))
+            for morgue in morgues:
+                self.frontier.add_root(morgue)
+            newer_urls.update(links)
+
+            # optionally, stream the new morgues straight on to the parser
+            if self.on_morgues is not None and len(morgues):
+                self.on_morgues(morgues)
 
             # write a temp output file if it's been too long
-            if datetime.now().timestamp() - start > self.auto_save:
+            if self.clock.now() - start > self.auto_save:
                 self._write_morgue_urls_to_file(newer_urls - all_urls)
-                start = datetime.now().timestamp()
+                self.validators.save()
+                self.frontier.save()
+                self.retry_queue.save()
+                self._save_link_graph()
+                start = self.clock.now()
                 print('\t', end='', flush=True)
 
+            # stop early, if we are out of time
+            if self.clock.now() > self.deadline:
+                print('\n\tTime limit reached.')
+                break
+
         # write any new morgues you found to file
         newer_urls = newer_urls - all_urls
         self._write_morgue_urls_to_file(newer_urls)
+        self.validators.save()
+        self.frontier.save()
+        self.retry_queue.save()
+        self._save_link_graph()
 
         return self._spider(all_urls.union(newer_urls), newer_urls, depth - 1)
 
+    @staticmethod
+    def _should_spider(url):
+        """ Determine if a URL is worth spidering for more links.
+
+        Args:
+            url (str): Any arbitary URL
+        Returns:
+            bool: Might this page link to DCSS morgue files?
+        """
+        return (url.endswith('.html') or url.endswith('/')) and MorgueSpider._looks_crawl_related(url)
+
     @staticmethod
     def _looks_crawl_related(url):
         """ Determine if, broadly, it seems likely a URL is DCSS-related.
@@ -153,19 +260,128 @@ class MorgueSpider:
         return False
 
     @staticmethod
-    def find_links_in_file(url):
+    def find_links_in_file(url, policies=None, cache=None, retry_queue=None):
         """ Find all the HTML links we can on a given webpage.
 
+        Args:
+            url (str): Any arbitary URL
+            policies (HostPolicies): optional, told to slow down if the server rejects us
+            cache (ResponseCache): optional, where to keep a copy of the page (it is always fetched,
+                as listing pages change)
+            retry_queue (RetryQueue): optional, where to put the page if the server rejects us
+        Returns:
+            set: All the URLs we could find on that page.
+        """
+        r = get_url(url, timeout=30)
+        if r.status_code in (429, 503):
+            if policies is not None:
+                policies.slow_down(url, retry_after_seconds(r.headers.get('Retry-After', '')))
+            if retry_queue is not None:
+                retry_queue.add(url, 'HTTP{0}'.format(r.status_code))
+            return set()
+
+        if policies is not None:
+            policies.speed_up(url)
+        if retry_queue is not None:
+            retry_queue.remove(url)
+            retry_queue.succeeded(url)
+        if cache is not None and r.status_code == 200:
+            cache.put(url, r.content)
+        return MorgueSpider.links_in_html(r.content, url)
+
+    def _find_new_links(self, url):
+        """ Find all the HTML links on a given webpage, using a conditional request.
+        If the page hasn't changed since the last spider run, we skip parsing it, and
+        only return the links on it that are worth spidering further.
+
         Args:
             url (str): Any arbitary URL
         Returns:
             set: All the URLs we could find on that page.
         """
-        r = get_url(url)
-        html = r.content
+        # when recording the link graph, we need every link on every page, changed or not,
+        # so there are no conditional requests, unless we have a copy of the page in the cache
+        cached = None if self.cache is None or self.link_graph is None else self.cache.get(url)
+        headers = {} if self.link_graph is not None and cached is None else self.validators.headers_for(url)
+        r = get_url(url, headers=headers, timeout=30)
+        if r.status_code in (429, 503):
+            # back off from this server, and try the page again later
+            self.policies.slow_down(url, retry_after_seconds(r.headers.get('Retry-After', '')))
+            self.retry_queue.add(url, 'HTTP{0}'.format(r.status_code), self.clock.now())
+            return set()
+
+        self.policies.speed_up(url)
+        self.retry_queue.remove(url)
+        self.retry_queue.succeeded(url)
+        if self.link_graph is not None and cached is not None and r.status_code == 304:
+            self.validators.touch(url)
+            return MorgueSpider.links_in_html(cached, url)
+        elif self.link_graph is None and self.validators.unchanged(url, r.status_code, r.content):
+            return set(self.validators.touch(url))
+        elif r.status_code != 200:
+            return set()
+
+        if self.cache is not None:
+            self.cache.put(url, r.content)
+        links = MorgueSpider.links_in_html(r.content, url)
+        self.validators.update(url, r.headers, r.content, [u for u in links if self._should_spider(u)])
+        return links
+
+    def record_links(self, file_path):
+        """ Record every page we fetch, how long it took, and the links on it, so that this crawl
+        can be replayed offline later (see crawl_simulator.py). Pages recorded by earlier runs are kept.
+
+        Args:
+            file_path (str): path to the JSON link graph
+        Returns: None
+        """
+        self.link_graph_file = file_path
+        self.link_graph = {'pages': {}, 'waits': {}}
+        if os.path.exists(file_path):
+            self.link_graph = json.load(open(file_path, 'r'))
+
+    def _record_page(self, url, links, seconds):
+        """ Add one fetched page to the link graph, along with the politeness wait used for its server
+
+        Args:
+            url (str): URL of the page
+            links (set): all the links found on that page
+            seconds (float): how long the fetch took
+        Returns: None
+        """
+        base = base_url(url)
+        self.link_graph['pages'][url] = [round(seconds, 3), sorted(links)]
+        self.link_graph['waits'][base] = self.policies.wait_for(base)
+
+    def _save_link_graph(self):
+        """ Write the link graph, if we are recording one, replacing the old file in a single step
+
+        Returns: None
+        """
+        if self.link_graph is None or self.link_graph_file is None:
+            return
+
+        temp_path = self.link_graph_file + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.link_graph, f)
+        os.replace(temp_path, self.link_graph_file)
+
+    @staticmethod
+    def links_in_html(html, url=None):
+        """ Find all the HTML links in a webpage.
+
+        Args:
+            html (bytes): content of a webpage
+            url (str): optional, URL of the page, used to resolve relative links
+        Returns:
+            set: All the URLs we could find on that page (without #fragments).
+        """
         soup = BeautifulSoup(html, features="html.parser")
-        all_links = soup.findAll('a')
-        return set([a['href'].strip() for a in all_links])
+        all_links = [a['href'].strip() for a in soup.findAll('a') if a.has_attr('href')]
+        if url is not None:
+            all_links = [urljoin(url, link) for link in all_links]
+
+        return set([urldefrag(link)[0] for link in all_links])
 
     def _write_morgue_urls_to_file(self, urls):
         """ Write all the morgues you found to a simple text file,
@@ -176,11 +392,13 @@ class MorgueSpider:
         Returns: None
         """
         # What morgue files have we already seen?
-        known_morgues = KnownMorgues([self.morgue_urls, self.winners, self.losers, self.parser_errors], [self.data_dir])
-        known_morgues.find()
+        if self.known_morgues is None:
+            self.known_morgues = KnownMorgues([self.morgue_urls, self.winners, self.losers, self.parser_errors],
+                                              [self.data_dir])
+            self.known_morgues.find()
 
-        # Strip out known morgues.
-        urls = [u for u in urls if not known_morgues.includes(u)]
+        # Strip out known morgues, and duplicates of the same morgue (on mirrors, or http vs https, etc).
+        urls = unique_urls(urls, self.known_morgues)
 
         # only write valid links to file
         urls = [u for u in urls if u.startswith('http')]
@@ -192,6 +410,7 @@ class MorgueSpider:
             print("\n\tWriting {0} new morgues to file.".format(len(urls)))
 
         # write all the new and unique morgues we have found to a text file
+        self.known_morgues.add(urls)
         file_path = os.path.join(self.data_dir, '{0}{1}.txt'.format(self.morgue_urls, datetime.now().strftime(self.dt_fmt)))
         with open(file_path, 'a+') as f:
             for url in sorted(urls):
@@ -0,0 +1,126 @@
+""" Page Validators
+
+Most of the morgue directory listings on DCSS servers don't change from one week to the next.
+To avoid re-downloading and re-parsing them on every spider run, we remember a few validators
+for every page we spider:
+
+* the ETag and Last-Modified headers, used to make conditional requests, and
+* the length and SHA1 digest of the content, for servers that ignore conditional requests.
+
+For each page we also remember the links on it that are worth spidering further, so that even
+an unchanged page lets us recurse down into its (possibly changed) sub-directories.
+"""
+from datetime import datetime
+from hashlib import sha1
+import json
+import os
+
+
+class PageValidators:
+    """ A persistent record of how every spidered page looked the last time we fetched it """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.pages = {}
+
+    def load(self):
+        """ Read the page validators from file, if it exists
+
+        Returns: None
+        """
+        self.pages = {}
+        if os.path.exists(self.file_path):
+            self.pages = json.load(open(self.file_path, 'r'))
+
+    def save(self):
+        """ Write the page validators to file, replacing the old one in a single step
+
+        Returns: None
+        """
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.pages, f)
+
+        os.replace(temp_path, self.file_path)
+
+    def headers_for(self, url):
+        """ Build the headers for a conditional GET of a page we have seen before
+
+        Args:
+            url (str): URL of the page
+        Returns:
+            dict: If-None-Match and/or If-Modified-Since headers (empty for a new page)
+        """
+        page = self.pages.get(url, {})
+        headers = {}
+        if page.get('etag'):
+            headers['If-None-Match'] = page['etag']
+        if page.get('last_modified'):
+            headers['If-Modified-Since'] = page['last_modified']
+
+        return headers
+
+    def unchanged(self, url, status_code, content):
+        """ Has this page changed since the last time we fetched it?
+
+        Args:
+            url (str): URL of the page
+            status_code (int): HTTP status code of the response
+            content (bytes): body of the response
+        Returns:
+            bool: True if the page is the same as last time
+        """
+        if url not in self.pages:
+            return False
+        elif status_code == 304:
+            return True
+
+        page = self.pages[url]
+        return page.get('length') == len(content) and page.get('digest') == sha1(content).hexdigest()
+
+    def update(self, url, headers, content, links):
+        """ Remember the validators for a page we just downloaded
+
+        Args:
+            url (str): URL of the page
+            headers (dict): HTTP headers of the response
+            content (bytes): body of the response
+            links (iterable): links on this page worth spidering further
+        Returns: None
+        """
+        now = datetime.now().timestamp()
+        self.pages[url] = {'etag': headers.get('ETag', ''),
+                           'last_modified': headers.get('Last-Modified', ''),
+                           'length': len(content),
+                           'digest': sha1(content).hexdigest(),
+                           'checked': now,
+                           'changed': now,
+                           'links': sorted(links)}
+
+    def touch(self, url):
+        """ Note that we just checked an unchanged page
+
+        Args:
+            url (str): URL of the page
+        Returns:
+            list: the links worth spidering that were on the page the last time it changed
+        """
+        page = self.pages[url]
+        page['checked'] = datetime.now().timestamp()
+        return page['links']
+
+    def priority(self, url):
+        """ Sort key for spidering: pages we have never seen come first, and then
+        pages that changed most recently, as they are the most likely to have changed again.
+
+        Args:
+            url (str): URL of the page
+        Returns:
+            tuple: smaller is more urgent
+        """
+        if url not in self.pages:
+            return (0, 0.0)
+        return (1, -self.pages[url].get('changed', 0.0))
+
+    def __len__(self):
+        return len(self.pages)
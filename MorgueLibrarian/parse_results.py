@@ -0,0 +1,63 @@
+""" Parse Results
+
+Lightweight records returned by WinningParser.parse_many, one per morgue file or URL.
+These let library code consume parse results in memory, instead of re-reading the
+winners_*, losers_* and parser_errors_* text files.
+"""
+from collections import namedtuple
+
+
+# a winning game, the build info of the winning character, and (optionally) its MorgueFeatures
+WinningRecord = namedtuple('WinningRecord', ['url', 'species', 'background', 'god', 'num_runes', 'version',
+                                             'features'])
+WinningRecord.__new__.__defaults__ = (None,)
+
+# a game that did not end in a win
+LosingRecord = namedtuple('LosingRecord', ['url'])
+
+# a morgue we could not read or parse (category is ConnectionError, Timeout, HTTPError, ParserError,
+# or UnknownError), and whether the failure was transient and worth retrying later
+ErrorRecord = namedtuple('ErrorRecord', ['url', 'category', 'message', 'transient'])
+
+
+def winning_line(record):
+    """ Format a winning record as a custom winning game description line
+    (the inverse of SearchWinners.read_winning_line)
+
+    Args:
+        record (WinningRecord): a parsed winning game
+    Returns:
+        str: custom winning morgue line
+    """
+    god_str = '^' + record.god if len(record.god) else ''
+    return '{0}  {1}{2}{3},{4},{5}\n'.format(record.url, record.species, record.background, god_str,
+                                             record.num_runes, record.version)
+
+
+def features_line(record):
+    """ Format a winning record, with its MorgueFeatures, as a line in a features file
+    (the inverse of SimilarWinners.read_features_line)
+
+    Args:
+        record (WinningRecord): a parsed winning game, with features
+    Returns:
+        str: custom features line
+    """
+    f = record.features
+    god_str = '^' + record.god if len(record.god) else ''
+    numbers = [f.num_runes, f.xl, f.strength, f.intelligence, f.dexterity, f.turns] + list(f.skills)
+    return '{0}  {1}{2}{3},{4}\n'.format(record.url, record.species, record.background, god_str,
+                                         ','.join('{0:g}'.format(n) for n in numbers))
+
+
+def error_line(record):
+    """ Format an error record as a line in a parser_errors file
+
+    Args:
+        record (ErrorRecord): a morgue that could not be parsed
+    Returns:
+        str: parser error line
+    """
+    if not len(record.message):
+        return '{0} {1}\n'.format(record.url, record.category)
+    return '{0}  {1}: {2}\n'.format(record.url, record.category, record.message)
@@ -0,0 +1,171 @@
+""" Pipelined Spider and Parser
+
+Normally, morgue_spider.py has to finish writing its morgue_urls_* files before anyone runs
+winning_parser.py on them. In pipelined mode, every new morgue URL the spider finds goes straight
+into a bounded queue on disk (data/pipeline_queue/), and the parser takes them off the other end,
+so discovery and parsing happen at the same time.
+
+Both stages share one politeness schedule (data/host_schedule.json), so no server is ever hit by
+the spider and the parser at once. The two stages can run in one process, or as two cooperating
+processes on the same data directory.
+
+Usage:
+
+    python MorgueLibrarian/pipeline.py
+    python MorgueLibrarian/pipeline.py -u data/starting_urls.txt -d 4 --save
+    python MorgueLibrarian/pipeline.py --spider     # only run the spider stage
+    python MorgueLibrarian/pipeline.py --parser     # only run the parser stage
+    python MorgueLibrarian/pipeline.py --cache      # keep every page fetched (see response_cache.py)
+"""
+import os
+from sys import argv
+from threading import Thread
+from time import sleep
+from canonical_urls import unique_urls
+from disk_queue import DiskQueue
+from host_policies import HostPolicies
+from host_scheduler import HostScheduler
+from known_morgues import KnownMorgues
+from response_cache import ResponseCache
+from library_data import *
+from morgue_spider import AUTO_SAVE_SECONDS, SEARCH_DEPTH, STARTING_URL_FILE, MorgueSpider
+from winning_parser import WinningParser
+
+# CONSTANTS
+BATCH_SIZE = 100
+POLL_SECONDS = 10.0
+
+
+def main():
+    auto_save = int(AUTO_SAVE_SECONDS)
+    depth = int(SEARCH_DEPTH)
+    starting_url_file = STARTING_URL_FILE
+    save_winners = False
+    workers = 1
+    stage = 'both'
+    use_cache = False
+
+    # optional commandline parsing
+    a = 1
+    while a < len(argv):
+        if argv[a].lower() in ('-a', '--auto_save_second'):
+            a += 1
+            auto_save = int(argv[a])
+        elif argv[a].lower() in ('-d', '--depth'):
+            a += 1
+            depth = int(argv[a])
+        elif argv[a].lower() in ('-u', '--url_file'):
+            a += 1
+            starting_url_file = argv[a]
+        elif argv[a].lower() in ('-s', '--save'):
+            save_winners = True
+        elif argv[a].lower() in ('-w', '--workers'):
+            a += 1
+            workers = int(argv[a])
+        elif argv[a].lower() == '--spider':
+            stage = 'spider'
+        elif argv[a].lower() == '--parser':
+            stage = 'parser'
+        elif argv[a].lower() in ('-c', '--cache'):
+            use_cache = True
+        a += 1
+
+    starting_urls = []
+    if stage != 'parser':
+        starting_urls = [u.strip() for u in open(starting_url_file, 'r').readlines()]
+
+    p = Pipeline(starting_urls, auto_save, depth, save_winners, workers)
+    if use_cache:
+        p.use_cache(ResponseCache(os.path.join(DATA_DIR, RESPONSE_CACHE)))
+    if stage == 'spider':
+        p.run_spider()
+    elif stage == 'parser':
+        p.run_parser()
+    else:
+        p.run()
+
+
+class Pipeline:
+    """ Stream newly-discovered morgue URLs from a MorgueSpider into a WinningParser """
+
+    def __init__(self, starting_urls, auto_save=1800, depth=3, save_winners=False, workers=1,
+                 batch_size=BATCH_SIZE):
+        self.batch_size = int(batch_size)
+        self.data_dir = DATA_DIR
+        self.queue = DiskQueue(os.path.join(DATA_DIR, PIPELINE_QUEUE))
+
+        # the spider and parser share one set of policies, and one schedule
+        self.policies = HostPolicies(os.path.join(DATA_DIR, HOST_POLICIES))
+        self.scheduler = HostScheduler(self.policies, os.path.join(DATA_DIR, HOST_SCHEDULE))
+
+        self.spider = MorgueSpider(starting_urls, auto_save, depth)
+        self.spider.policies = self.policies
+        self.spider.scheduler = self.scheduler
+        self.spider.on_morgues = self.queue.put
+
+        self.parser = WinningParser([], save_winners, workers)
+        self.parser.policies = self.policies
+        self.parser.scheduler = self.scheduler
+
+    def use_cache(self, cache):
+        """ Share one response cache between the spider and the parser
+
+        Args:
+            cache (ResponseCache): cache of fetched pages
+        Returns: None
+        """
+        self.spider.cache = cache
+        self.parser.cache = cache
+
+    def run(self):
+        """ Run the spider in a background thread, and the parser in this one
+
+        Returns: None
+        """
+        self.queue.reopen()
+        spider_thread = Thread(target=self.run_spider, daemon=True)
+        spider_thread.start()
+        self.run_parser()
+        spider_thread.join()
+
+    def run_spider(self):
+        """ Spider for morgues, pushing every new morgue URL onto the queue
+
+        Returns: None
+        """
+        self.queue.reopen()
+        try:
+            all_urls = self.spider.spider()
+            print('\nSpidered {0} URLs'.format(len(all_urls)))
+        finally:
+            self.queue.close()
+
+    def run_parser(self):
+        """ Parse morgue URLs as they come off the queue, until the spider is done and the queue is empty
+
+        Returns: None
+        """
+        known_morgues = KnownMorgues([self.parser.winners, self.parser.losers, self.parser.parser_errors],
+                                     [self.data_dir])
+        known_morgues.find()
+        self.parser.retry_queue.load()
+
+        # all the results of this run go to the same set of output files
+        dt_now = self.parser.current_datetime_string()
+        while True:
+            urls = self.queue.get(self.batch_size)
+            if not len(urls):
+                if self.queue.finished():
+                    # clear the marker, so the next parser doesn't mistake it for the end of the next run
+                    self.queue.reopen()
+                    break
+                sleep(POLL_SECONDS)
+                continue
+
+            urls = unique_urls(urls, known_morgues)
+            known_morgues.add(urls)
+            self.parser.parse_urls(urls, dt_now)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+""" Recompress the Data Directory
+
+Rewrite every data file (morgue_urls_*, winners_*, losers_*, parser_errors_*, features_*, and the
+compacted shards) with a different compression codec (see file_codecs.py), and update the shard
+manifest to match. Optionally, the saved winning morgues are recompressed as well.
+
+The old files are only removed once the new files and the new manifest are in place.
+
+Usage:
+
+    python MorgueLibrarian/recompress_data.py zstd
+    python MorgueLibrarian/recompress_data.py gzip --saved
+    python MorgueLibrarian/recompress_data.py none      # decompress everything
+"""
+from glob import glob
+import json
+import os
+from sys import argv
+from compact_data import CompactData
+from data_files import compacted_sources, file_stat, find_data_files, iter_lines, read_manifest, write_lines
+from file_codecs import CODECS, codec_for_path, open_file, read_bytes, strip_extension
+from library_data import *
+
+
+def main():
+    if len(argv) < 2 or argv[1].lower() not in list(CODECS) + ['none']:
+        usage()
+
+    codec = CODECS.get(argv[1].lower())
+    saved = '-s' in argv[2:] or '--saved' in argv[2:]
+
+    rd = RecompressData(DATA_DIR, codec, saved)
+    rd.recompress()
+
+
+class RecompressData:
+    """ Rewrite every data file in a data directory with one compression codec """
+
+    def __init__(self, data_dir, codec, saved=False):
+        self.data_dir = data_dir
+        self.codec = codec
+        self.extension = '' if codec is None else codec.extension
+        self.saved = saved
+        self.shards_dir = os.path.join(data_dir, SHARDS_DIR)
+        self.saved_dir = os.path.join(data_dir, SAVED_DIR)
+
+    def recompress(self):
+        """ Master method to recompress the data files, shards, and (optionally) saved morgues
+
+        Returns: None
+        """
+        manifest = read_manifest(self.data_dir)
+        replaced = []
+        old_stats = {}
+        for prefix in CompactData.PREFIXES:
+            # raw files already compacted (and kept) are recompressed too
+            kept = [os.path.join(self.data_dir, s) for s in compacted_sources(manifest.get(prefix, {}))]
+            for file_path in find_data_files(self.data_dir, prefix) + [f for f in kept if os.path.exists(f)]:
+                old_stats[os.path.basename(file_path)] = file_stat(file_path)
+                new_path = self._recompress_file(file_path, True)
+                if new_path is not None:
+                    replaced.append((file_path, new_path))
+
+        if self.saved:
+            for file_path in sorted(glob(os.path.join(self.saved_dir, '*'))):
+                new_path = self._recompress_file(file_path, False)
+                if new_path is not None:
+                    replaced.append((file_path, new_path))
+
+        self._update_manifest(dict((os.path.basename(old), os.path.basename(new)) for old, new in replaced), old_stats)
+        renamed = [(old, new) for old, new in replaced if old != new]
+
+        # only now is it safe to remove the old files (those rewritten in place are already gone)
+        for old_path, _ in renamed:
+            os.remove(old_path)
+        print('Recompressed {0} files'.format(len(replaced)))
+
+    def _recompress_file(self, file_path, is_data_file):
+        """ Write a copy of one file with the new codec, next to the old one
+        (or over it, if the file name stays the same, e.g. a saved morgue with no extension)
+
+        Args:
+            file_path (str): path to the old file
+            is_data_file (bool): True for line-based data files, False for saved morgues
+        Returns:
+            str: path to the new file (which may be the old path), or None if the file already uses the new codec
+        """
+        new_path = strip_extension(file_path) + self.extension
+        if new_path == file_path and codec_for_path(file_path) == self.codec:
+            return None
+
+        # write to a hidden temporary file, so nobody reads it half-written
+        temp_path = os.path.join(os.path.dirname(new_path), '.tmp.' + os.path.basename(new_path))
+        if is_data_file:
+            write_lines(temp_path, iter_lines(file_path))
+        else:
+            with open_file(temp_path, 'wb', self.codec) as f:
+                f.write(read_bytes(file_path))
+
+        os.replace(temp_path, new_path)
+        return new_path
+
+    def _update_manifest(self, renames, old_stats):
+        """ Point the shard manifest at the new file names, replacing it in a single step
+
+        Args:
+            renames (dict): new file name for each old file name (the same name, if it was rewritten in place)
+            old_stats (dict): file_stat() of each old data file, before it was rewritten
+        Returns: None
+        """
+        manifest = read_manifest(self.data_dir)
+        if not len(manifest):
+            return
+
+        for category in manifest.values():
+            for shard in category.get('shards', []):
+                shard['file'] = renames.get(shard['file'], shard['file'])
+            # a source that was unchanged since it was compacted is still compacted, under its new name
+            sources = {}
+            for source, stat in compacted_sources(category).items():
+                new_source = renames.get(source, source)
+                if source in renames and stat == old_stats.get(source):
+                    stat = file_stat(os.path.join(self.data_dir, new_source))
+                sources[new_source] = stat
+            category['sources'] = sources
+
+        manifest_path = os.path.join(self.shards_dir, MANIFEST)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def usage():
+    """ Print a help menu to the screen, if the user enters a bad command line flag. """
+    print(__doc__)
+    exit()
+
+
+if __name__ == '__main__':
+    main()
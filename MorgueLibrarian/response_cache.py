@@ -0,0 +1,168 @@
+""" Response Cache
+
+An optional, compressed, on-disk cache of every morgue and listing page we fetch, so that after
+a change to the parsing rules (say, a new species in crawl_data.py) the whole corpus can be
+reparsed locally, without downloading anything again.
+
+Each response is stored in its own compressed file (zstd if it is installed, otherwise gzip,
+see file_codecs.py), named for the SHA-1 of its canonical URL (see canonical_urls.py), so the same
+page over http vs https, or with the host name in a different case, is only stored once. (The same
+morgue on two different mirrors is still stored twice.) When the cache grows past its size limit,
+the least recently used files are removed.
+
+    data/response_cache/3f/3f786850e387550fdab836ed7e6dc881de23001b
+
+The file names have no extension, and the codec of each file is read from its first few bytes, so
+the cache stays valid when zstd is installed. If zstd is removed, the pages it compressed are
+treated as missing, and are fetched (and cached with gzip, under the same name) again.
+(Files named by older versions, with an extension, are still read.)
+
+Morgue files never change once the game is over, so the parser reads them from the cache as they
+are. Listing pages do change, so the spider only uses a cached page once a conditional request
+has told it the page is unchanged (see morgue_spider.py).
+"""
+from hashlib import sha1
+import os
+from threading import Lock
+from canonical_urls import canonical_url
+from file_codecs import EXTENSIONS, default_codec, open_file
+
+# CONSTANTS
+MAX_BYTES = 10 * 1024 * 1024 * 1024
+
+
+class ResponseCache:
+    """ A size-bounded, least-recently-used cache of fetched pages, keyed by canonical URL """
+
+    def __init__(self, cache_dir, max_bytes=MAX_BYTES, codec=None):
+        self.cache_dir = cache_dir
+        self.codec = default_codec() if codec is None else codec
+        self.max_bytes = int(max_bytes)
+        self.lock = Lock()
+        self.size = None
+
+    def get(self, url):
+        """ Read a page from the cache, if we have it
+
+        Args:
+            url (str): URL of the page
+        Returns:
+            bytes: content of the page, or None if it isn't cached
+        """
+        for file_path in self._paths_for(url):
+            try:
+                with open_file(file_path, 'rb') as f:
+                    data = f.read()
+            except (OSError, EOFError, ValueError, ImportError):
+                # unreadable, or written with a codec that is no longer installed
+                continue
+
+            # mark it as recently used
+            try:
+                os.utime(file_path)
+            except OSError:
+                pass
+            return data
+
+        return None
+
+    def includes(self, url):
+        """ Do we have this page in the cache?
+
+        Args:
+            url (str): URL of the page
+        Returns:
+            bool: True if the page is cached
+        """
+        return any(os.path.exists(p) for p in self._paths_for(url))
+
+    def put(self, url, data):
+        """ Add a page to the cache, evicting the least recently used pages if the cache is full
+
+        Args:
+            url (str): URL of the page
+            data (bytes): content of the page
+        Returns: None
+        """
+        file_path = self.path_for(url)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        temp_path = '{0}.{1}.tmp'.format(file_path, os.getpid())
+        with open_file(temp_path, 'wb', self.codec) as f:
+            f.write(data)
+        added = os.path.getsize(temp_path)
+        try:
+            added -= os.path.getsize(file_path)
+        except OSError:
+            pass
+        os.replace(temp_path, file_path)
+
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self._entries())
+            else:
+                self.size += added
+
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def path_for(self, url):
+        """ Where in the cache does this URL live?
+
+        Args:
+            url (str): URL of the page
+        Returns:
+            str: path to the cache file
+        """
+        key = sha1(canonical_url(url.strip()).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _paths_for(self, url):
+        """ Everywhere in the cache this URL might live: its current name, then the older names with an extension
+
+        Args:
+            url (str): URL of the page
+        Returns:
+            list: paths to try, in order
+        """
+        file_path = self.path_for(url)
+        return [file_path] + [file_path + ext for ext in EXTENSIONS]
+
+    def _evict(self):
+        """ Remove the least recently used pages, until the cache is comfortably under its limit
+        (Call while holding the lock.)
+
+        Returns: None
+        """
+        entries = sorted(self._entries())
+        self.size = sum(size for _, size, _ in entries)
+        target = 0.9 * self.max_bytes
+
+        for _, size, file_path in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(file_path)
+                self.size -= size
+            except FileNotFoundError:
+                pass
+
+    def _entries(self):
+        """ Every file in the cache
+
+        Returns:
+            list: (last used time, size in bytes, path) for each cached page
+        """
+        entries = []
+        if not os.path.exists(self.cache_dir):
+            return entries
+
+        for sub_dir in os.scandir(self.cache_dir):
+            if not sub_dir.is_dir():
+                continue
+            for entry in os.scandir(sub_dir.path):
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return entries
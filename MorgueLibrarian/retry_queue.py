@@ -0,0 +1,191 @@
+""" Retry Queue
+
+When a DCSS server is down or overloaded, every morgue we try to fetch from it fails.
+Those failures say nothing about the morgue itself, so instead of writing them to the
+parser_errors_* files (which are never retried), we keep them in a retry queue.
+
+Each failure pushes the URL back with an exponential backoff. The backoff is tracked per host,
+so that a server that keeps failing is left alone for longer and longer. A whole batch of URLs
+failing while the server is down only counts as one failure of that host; its backoff grows
+again only if it is still failing once the last backoff has expired. While a host is backing off,
+the rest of its URLs are put straight onto the queue, without being tried (see defer()).
+
+The queue is a simple text file, with one line per URL, and one line per failing host:
+
+    url  attempts  not_before  category
+    #host  host  failures  not_before
+"""
+from datetime import datetime
+import os
+
+
+def host_of(url):
+    """ Find the base URL (scheme and host) of a URL
+
+    Args:
+        url (str): Any arbitrary URL
+    Returns:
+        str: the scheme and host of the URL
+    """
+    i = url.find('://')
+    slash = url.find('/', i + 3 if i >= 0 else 0)
+    return url if slash < 0 else url[:slash]
+
+
+class RetryQueue:
+    """ A persistent queue of URLs that failed for transient reasons (connection errors, timeouts,
+    HTTP 429 and 5xx responses), along with when each of them may be retried.
+    """
+
+    def __init__(self, file_path, base_wait=600.0, max_wait=7 * 24 * 3600.0, max_attempts=8):
+        self.file_path = file_path
+        self.base_wait = float(base_wait)
+        self.max_wait = float(max_wait)
+        self.max_attempts = int(max_attempts)
+        self.entries = {}
+        self.host_failures = {}
+        self.host_not_before = {}
+
+    def load(self):
+        """ Read the retry queue from file, if it exists
+
+        Returns: None
+        """
+        self.entries = {}
+        self.host_failures = {}
+        self.host_not_before = {}
+        if not os.path.exists(self.file_path):
+            return
+
+        with open(self.file_path, 'r') as f:
+            for line in f:
+                cols = line.split()
+                if len(cols) < 4:
+                    continue
+                elif cols[0] == '#host':
+                    self.host_failures[cols[1]] = int(cols[2])
+                    self.host_not_before[cols[1]] = float(cols[3])
+                else:
+                    self.entries[cols[0]] = [int(cols[1]), float(cols[2]), cols[3]]
+
+    def save(self):
+        """ Write the retry queue to file, replacing the old one in a single step
+
+        Returns: None
+        """
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            for url in sorted(self.entries):
+                attempts, not_before, category = self.entries[url]
+                f.write('{0}  {1}  {2:.0f}  {3}\n'.format(url, attempts, not_before, category))
+            for host in sorted(self.host_failures):
+                f.write('#host  {0}  {1}  {2:.0f}\n'.format(host, self.host_failures[host],
+                                                            self.host_not_before.get(host, 0.0)))
+
+        os.replace(temp_path, self.file_path)
+
+    def add(self, url, category, now=None):
+        """ Push a URL that just failed onto the queue, backing off from its host
+
+        Args:
+            url (str): URL that failed
+            category (str): type of failure, e.g. ConnectionError
+            now (float): current timestamp (defaults to now)
+        Returns:
+            float: timestamp after which this URL may be retried
+        """
+        now = datetime.now().timestamp() if now is None else now
+        host = host_of(url)
+
+        # the host only backs off further if it is still failing after its last backoff expired
+        if self.host_not_before.get(host, 0.0) <= now:
+            self.host_failures[host] = self.host_failures.get(host, 0) + 1
+            self.host_not_before[host] = now + self._backoff(self.host_failures[host])
+
+        attempts = self.entries[url][0] + 1 if url in self.entries else 1
+        self.entries[url] = [attempts, now + self._backoff(attempts), category]
+
+        return max(self.entries[url][1], self.host_not_before[host])
+
+    def defer(self, url, category, now=None):
+        """ Push a URL we didn't even try, because its host is backing off (this isn't an attempt)
+
+        Args:
+            url (str): URL that was skipped
+            category (str): reason it was skipped, unless it was already queued for another reason
+            now (float): current timestamp (defaults to now)
+        Returns: None
+        """
+        now = datetime.now().timestamp() if now is None else now
+        if url in self.entries:
+            self.entries[url][1] = max(self.entries[url][1], now)
+        else:
+            self.entries[url] = [0, now, category]
+
+    def backing_off(self, url, now=None):
+        """ Is the host of this URL failing, and waiting out its backoff?
+
+        Args:
+            url (str): URL address
+            now (float): current timestamp (defaults to now)
+        Returns:
+            bool: True if we should leave this host alone for now
+        """
+        now = datetime.now().timestamp() if now is None else now
+        return self.host_not_before.get(host_of(url), 0.0) > now
+
+    def succeeded(self, url):
+        """ The server of this URL answered, so forget its past failures
+
+        Args:
+            url (str): URL address
+        Returns: None
+        """
+        host = host_of(url)
+        self.host_failures.pop(host, None)
+        self.host_not_before.pop(host, None)
+
+    def remove(self, url):
+        """ Drop a URL from the queue, because it succeeded or failed permanently
+
+        Args:
+            url (str): URL address
+        Returns: None
+        """
+        self.entries.pop(url, None)
+
+    def due(self, now=None):
+        """ Find all the URLs whose backoff has expired, and may be retried now
+
+        Args:
+            now (float): current timestamp (defaults to now)
+        Returns:
+            list: URLs that may be retried
+        """
+        now = datetime.now().timestamp() if now is None else now
+        return [u for u, e in self.entries.items()
+                if e[0] < self.max_attempts and max(e[1], self.host_not_before.get(host_of(u), 0.0)) <= now]
+
+    def exhausted(self):
+        """ Find all the URLs that have failed too many times to keep retrying
+
+        Returns:
+            list: (url, category) for each URL we should give up on
+        """
+        return [(u, e[2]) for u, e in self.entries.items() if e[0] >= self.max_attempts]
+
+    def _backoff(self, failures):
+        """ How long to wait after some number of failures in a row
+
+        Args:
+            failures (int): failures so far, at least one
+        Returns:
+            float: seconds to wait
+        """
+        return min(self.max_wait, self.base_wait * 2 ** (failures - 1))
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def __len__(self):
+        return len(self.entries)
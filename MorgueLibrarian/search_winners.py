@@ -19,16 +19,20 @@ Usage:
      python MorgueLibrarian/search_winners.py Mi Be Trog 3,4,5 0.23,0.24,0.25 -stats
 
 """
-from glob import glob
-import os
-from sys import argv
+from collections import namedtuple
+from sys import argv, intern
+from compact_urls import URLList, URLTable
+from data_files import find_data_files, iter_lines, map_data_files
 from library_data import DATA_DIR, WINNERS
 
+# the build info of one winning game, shared by all the winning morgues with that same build
+WinningBuild = namedtuple('WinningBuild', ['species', 'background', 'god', 'num_runes', 'ver'])
+
 
 def main():
     """
     1. parse input commandline for winning build/run info
-    2. open/read all winning runs in /data/, bzip or not
+    2. open/read all winning runs in /data/, compressed or not
     3. print lines that match search criteria
     """
     data_dir = DATA_DIR
@@ -56,6 +60,7 @@ class SearchWinners:
         self.prefix = prefix
         self.print_stats = print_stats
         self.morgues = {}
+        self.urls = URLTable()
 
     def print_matches(self, species, backgrounds, gods, num_runes, ver):
         """ Print any morgues that match the winning character build info provided
@@ -131,28 +136,50 @@ class SearchWinners:
 
         Returns: None
         """
-        # this set of known morgues saves only the hash of the URL or file path, to save space
+        # winning morgue URLs are stored compactly, against a shared table of hosts and directories
         self.morgues = {}
+        self.urls = URLTable()
 
-        # read any old outputs that are in plain txt format
-        old_morgue_files = glob(os.path.join(self.data_dir, self.prefix + '*.txt'))
-        for old_file in old_morgue_files:
-            with open(old_file, 'r') as f:
-                for line in f.readlines():
-                    url, build = SearchWinners.read_winning_line(line)
-                    if build not in self.morgues:
-                        self.morgues[build]= []
-                    self.morgues[build].append(url)
-
-        # read any old outputs that are in bzip2 format
-        old_morgue_files = glob(os.path.join(self.data_dir, self.prefix + '*.txt.bz2'))
-        for old_file in old_morgue_files:
-            with BZ2File(old_file, 'r') as f:
-                for line in f.readlines():
-                    url, build = SearchWinners.read_winning_line(line)
-                    if build not in self.morgues:
-                        self.morgues[build]= []
-                    self.morgues[build].append(url)
+        # read all the old outputs (plain txt, compressed, or compacted shards) in parallel
+        old_morgue_files = find_data_files(self.data_dir, self.prefix)
+        for winners in map_data_files(SearchWinners._read_winners, old_morgue_files):
+            for url, build in winners:
+                self.add(url, build)
+
+    @staticmethod
+    def _read_winners(file_path, workers=1):
+        """ Stream through one winners file, and parse each line
+
+        Args:
+            file_path (str): path to a plain txt or compressed winners file
+            workers (int): threads used to decompress a large bzip2 file
+        Returns:
+            generator: (url, WinningBuild) for each line in the file
+        """
+        return (SearchWinners.read_winning_line(line) for line in iter_lines(file_path, workers) if line.strip())
+
+    def add(self, url, build):
+        """ Add a single winning morgue to our collection
+
+        Args:
+            url (str): URL (or file path) for this morgue
+            build (tuple): (species, background, god, num_runes, ver)
+        Returns: None
+        """
+        if build not in self.morgues:
+            self.morgues[WinningBuild(*build)] = URLList(self.urls)
+        self.morgues[build].append(url)
+
+    def add_record(self, record):
+        """ Add a single winning morgue, as returned by WinningParser.parse_many
+
+        Args:
+            record (WinningRecord): a parsed winning game
+        Returns: None
+        """
+        build = SearchWinners.make_build(record.species, record.background, record.god,
+                                         record.num_runes, record.version)
+        self.add(record.url, build)
 
     @staticmethod
     def read_winning_line(line):
@@ -161,7 +188,7 @@ class SearchWinners:
         Args:
             line (str): custom winning morgue line
         Returns:
-            tuple: (url, (species, background, god, num_runes, ver))
+            tuple: (url, WinningBuild)
         """
         url, info = line.strip().split()
         sbg, num_runes, ver = info.split(',')
@@ -171,11 +198,22 @@ class SearchWinners:
             sb = sbg
             god = ''
 
-        species = sb[:2]
-        background = sb[2:]
-        num_runes = int(num_runes)
-        ver = float(ver)
-        return url, (species, background, god, num_runes, ver)
+        return url, SearchWinners.make_build(sb[:2], sb[2:], god, num_runes, ver)
+
+    @staticmethod
+    def make_build(species, background, god, num_runes, ver):
+        """ Build a winning build record, interning the build codes so they are shared in memory
+
+        Args:
+            species (str): species of winning character
+            background (str): background of winning character
+            god (str): final diety for the of winning character
+            num_runes (str): number of runes player had by end
+            ver (str): major game version
+        Returns:
+            WinningBuild: (species, background, god, num_runes, ver)
+        """
+        return WinningBuild(intern(species), intern(background), intern(god), int(num_runes), float(ver))
 
 
 if __name__ == '__main__':
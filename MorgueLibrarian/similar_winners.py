@@ -0,0 +1,239 @@
+""" Find the Winning Games Most Like Your Character
+
+Purpose:
+
+     search_winners.py only finds exact matches on species, background, god, runes and version.
+     This script instead finds the winning characters most similar to yours: by skills, XL, stats,
+     god, runes and turn count.
+
+     Every winning character is a row in a NumPy matrix (see morgue_features.py). Each number is
+     standardized across all the winners, the god is one-hot encoded, and each row is scaled to unit
+     length. So one matrix-vector product gives the cosine similarity of your character to every
+     winner, and the top few are picked out with argpartition.
+
+     The matrix is built once, from the features_* files written by winning_parser.py, and saved
+     to data/winners_index.npz.
+
+Usage:
+
+     python MorgueLibrarian/similar_winners.py --build
+     python MorgueLibrarian/similar_winners.py my_character.txt
+     python MorgueLibrarian/similar_winners.py http://crawl.akrasiac.org/rawdata/bob/morgue-bob-20200101-101010.txt -k 20
+
+"""
+import os
+from sys import argv
+from crawl_data import GODS, SKILLS
+from data_files import find_data_files, iter_lines, map_data_files
+from library_data import DATA_DIR, FEATURES, WINNERS_INDEX
+from morgue_features import MorgueFeatures, read_features
+from winning_parser import WinningParser
+
+# CONSTANTS
+GOD_CODES = [''] + sorted(set(GODS.values()))
+GOD_WEIGHT = 2.0
+NUM_RESULTS = 10
+
+
+def main():
+    build = False
+    num_results = NUM_RESULTS
+    sources = []
+
+    # optional commandline parsing
+    a = 1
+    while a < len(argv):
+        if argv[a].lower() in ('-b', '--build'):
+            build = True
+        elif argv[a].lower() in ('-k', '--num_results'):
+            a += 1
+            num_results = int(argv[a])
+        else:
+            sources.append(argv[a])
+        a += 1
+
+    if not build and not len(sources):
+        usage()
+
+    sw = SimilarWinners(DATA_DIR)
+    if build:
+        sw.build()
+        sw.save()
+        print('Indexed {0} winning characters'.format(len(sw)))
+    else:
+        sw.load()
+
+    for source in sources:
+        features = read_features(WinningParser.strip_html(WinningParser.read_source(source)))
+        print(source)
+        for similarity, url, build_str in sw.query(features, num_results):
+            print('{0:.3f}\t{1}\t{2}'.format(similarity, build_str, url))
+
+
+class SimilarWinners:
+    """ A nearest-neighbor index over the features of every winning character """
+
+    def __init__(self, data_dir, prefix=FEATURES):
+        self.data_dir = data_dir
+        self.prefix = prefix
+        self.index_path = os.path.join(data_dir, WINNERS_INDEX)
+        self.urls = []
+        self.builds = []
+        self.matrix = None
+        self.mean = None
+        self.std = None
+
+    def build(self):
+        """ Read every features file, and build the normalized matrix of winning characters
+
+        Returns: None
+        """
+        import numpy as np
+
+        # each URL only once, even if it was parsed more than once
+        winners = {}
+        for lines in map_data_files(SimilarWinners._read_features, find_data_files(self.data_dir, self.prefix)):
+            for url, build_str, features in lines:
+                winners[url] = (build_str, features)
+
+        self.urls = sorted(winners)
+        self.builds = [winners[u][0] for u in self.urls]
+        numbers = np.array([SimilarWinners.numbers(winners[u][1]) for u in self.urls], dtype=np.float64)
+        numbers = numbers.reshape(len(self.urls), len(SKILLS) + 6)
+        self.mean = numbers.mean(axis=0) if len(self.urls) else np.zeros(numbers.shape[1])
+        self.std = numbers.std(axis=0) if len(self.urls) else np.ones(numbers.shape[1])
+        self.std[self.std == 0] = 1.0
+
+        gods = [GOD_CODES.index(winners[u][1].god) if winners[u][1].god in GOD_CODES else 0 for u in self.urls]
+        self.matrix = self._rows(numbers, np.array(gods, dtype=np.int64))
+
+    def save(self):
+        """ Write the index to disk, replacing the old one in a single step
+
+        Returns: None
+        """
+        import numpy as np
+
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, matrix=self.matrix, mean=self.mean, std=self.std,
+                     urls=np.array(self.urls, dtype=str), builds=np.array(self.builds, dtype=str))
+        os.replace(temp_path, self.index_path)
+
+    def load(self):
+        """ Read a prebuilt index from disk
+
+        Returns: None
+        """
+        import numpy as np
+
+        with np.load(self.index_path, allow_pickle=False) as index:
+            if index['matrix'].shape[1] != len(SKILLS) + 6 + len(GOD_CODES):
+                raise ValueError('{0} was built for another list of skills or gods, rebuild it with --build'
+                                 .format(self.index_path))
+            self.matrix = index['matrix']
+            self.mean = index['mean']
+            self.std = index['std']
+            self.urls = index['urls'].tolist()
+            self.builds = index['builds'].tolist()
+
+    def query(self, features, num_results=NUM_RESULTS):
+        """ Find the winning characters most similar to the one given
+
+        Args:
+            features (MorgueFeatures): the character to compare against
+            num_results (int): how many of the most similar winners to return
+        Returns:
+            list: (similarity, url, build) for the most similar winners, most similar first
+        """
+        import numpy as np
+
+        num_results = min(int(num_results), len(self.urls))
+        if num_results <= 0:
+            return []
+
+        god = GOD_CODES.index(features.god) if features.god in GOD_CODES else 0
+        row = self._rows(np.array([SimilarWinners.numbers(features)], dtype=np.float64),
+                         np.array([god], dtype=np.int64))[0]
+
+        similarity = self.matrix.dot(row)
+        top = np.argpartition(-similarity, num_results - 1)[:num_results]
+        top = top[np.argsort(-similarity[top])]
+        return [(float(similarity[i]), self.urls[i], self.builds[i]) for i in top]
+
+    def _rows(self, numbers, gods):
+        """ Turn raw character numbers into unit-length rows of the index matrix
+
+        Args:
+            numbers (array): one row of SimilarWinners.numbers() for each character
+            gods (array): index into GOD_CODES of each character's god
+        Returns:
+            array: float32 matrix, one unit-length row per character
+        """
+        import numpy as np
+
+        one_hot = np.zeros((len(gods), len(GOD_CODES)))
+        one_hot[np.arange(len(gods)), gods] = GOD_WEIGHT
+        rows = np.hstack([(numbers - self.mean) / self.std, one_hot])
+
+        norms = np.sqrt((rows * rows).sum(axis=1, keepdims=True))
+        norms[norms == 0] = 1.0
+        return (rows / norms).astype(np.float32)
+
+    @staticmethod
+    def numbers(features):
+        """ The numeric part of a character's features (the turn count is on a log scale)
+
+        Args:
+            features (MorgueFeatures): the numbers that describe a character
+        Returns:
+            list: runes, XL, Str, Int, Dex, log10(turns), and then every skill
+        """
+        from math import log10
+
+        return [features.num_runes, features.xl, features.strength, features.intelligence, features.dexterity,
+                log10(features.turns + 1)] + list(features.skills)
+
+    @staticmethod
+    def _read_features(file_path, workers=1):
+        """ Stream through one features file, and parse each line
+
+        Args:
+            file_path (str): path to a plain txt or compressed features file
+            workers (int): threads used to decompress a large bzip2 file
+        Returns:
+            generator: (url, build, MorgueFeatures) for each line in the file
+        """
+        return (SimilarWinners.read_features_line(line) for line in iter_lines(file_path, workers) if line.strip())
+
+    @staticmethod
+    def read_features_line(line):
+        """ read a custom features line (the inverse of parse_results.features_line)
+
+        Args:
+            line (str): custom features line
+        Returns:
+            tuple: (url, build, MorgueFeatures)
+        """
+        url, info = line.strip().split()
+        values = info.split(',')
+        build_str = values[0]
+        god = build_str.split('^')[1] if '^' in build_str else ''
+        n = [float(v) for v in values[1:]]
+        skills = tuple(n[6:6 + len(SKILLS)]) + (0.0,) * max(0, len(SKILLS) + 6 - len(n))
+
+        return url, build_str, MorgueFeatures(god, int(n[0]), int(n[1]), int(n[2]), int(n[3]), int(n[4]),
+                                              int(n[5]), skills)
+
+    def __len__(self):
+        return len(self.urls)
+
+
+def usage():
+    """ Print a help menu to the screen, if the user enters a bad command line flag. """
+    print(__doc__)
+    exit()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,42 +1,68 @@
-from datetime import datetime
 from random import choice, random, shuffle
-from time import sleep
+from canonical_urls import unique_urls
+from crawl_clock import Clock
+from host_policies import HostPolicies, base_url
 
 
 class URLIterator:
     """ A Helpful iterator designed to loop through a set of URLs,
-    with an eye towards not hitting the same URL too often
+    with an eye towards not hitting the same URL too often.
+
+    How long to wait between hits to the same server is decided per host, by HostPolicies.
+    The URLs of each server are visited in random order, unless "ordered" is set, in which case
+    they are visited in the order given. Duplicate URLs (see canonical_urls.py) are only visited once.
+
+    If a HostScheduler is given, it is shared with whoever else is fetching URLs at the same time,
+    and all the waiting is done by the scheduler, on the shared schedule.
+
+    All waiting is done on the given clock (see crawl_clock.py), the real wall clock by default.
     """
 
-    DOMAINS_TO_SKIP = ['http://dobrazupa.com']
+    def __init__(self, url_set, wait=60.0, policies=None, ordered=False, scheduler=None, clock=None):
+        self.clock = Clock() if clock is None else clock
+        if policies is None:
+            policies = HostPolicies(default_wait=wait, clock=self.clock) if scheduler is None else scheduler.policies
+        self.policies = policies
+        self.scheduler = scheduler
 
-    def __init__(self, url_set, wait=60.0):
         # load set of URLs into interleaving dictionary
-        self.wait = min(60.0, abs(wait))
         self.urls = {}
-
-        for url in url_set:
-            base_url = url[:url[8:].find('/') + 8].replace('https', 'http')
-            if base_url in URLIterator.DOMAINS_TO_SKIP:
+        for url in unique_urls(url_set):
+            base = base_url(url)
+            if self.policies.skipped(base):
                 continue
 
-            if base_url not in self.urls:
-                self.urls[base_url] = []
+            if base not in self.urls:
+                self.urls[base] = []
 
-            self.urls[base_url].append(url.strip())
+            self.urls[base].append(url)
 
-        for base_url in list(self.urls.keys()):
-            shuffle(self.urls[base_url])
+        for base in list(self.urls.keys()):
+            self.urls[base] = [u for u in self.urls[base] if self.policies.allowed(u)]
+            if ordered:
+                # URLs are popped off the end of each list
+                self.urls[base].reverse()
+            else:
+                shuffle(self.urls[base])
 
         # set the last time each base URL has been hit
         self.last_times = {}
-        last = datetime.now().timestamp() - 2 * self.wait
-        for base_url in self.urls:
-            self.last_times[base_url] = last
+        for base in self.urls:
+            self.last_times[base] = 0.0
 
         # What was the last base URL we hit?
         self.last_base_url = 'FAKE_URL'
 
+    def drop(self, base):
+        """ Stop visiting a server (say, because it is failing)
+
+        Args:
+            base (str): base URL of the server
+        Returns:
+            list: the URLs of that server we haven't visited yet
+        """
+        return self.urls.pop(base, [])
+
     def __iter__(self):
         return self
 
@@ -51,28 +77,32 @@ class URLIterator:
         if not len(self.urls):
             raise StopIteration
 
-        # Okay, we need to iterate over something, pick a random element
-        new_keys = set(self.urls.keys()) - {self.last_base_url}
-        if not len(new_keys):
-            # if there is only one base URL left
-            new_key = self.last_base_url
+        # Okay, we need to iterate over something: pick the base URL we are allowed to hit soonest,
+        # preferring not to hit the same base URL twice in a row.
+        ready = {}
+        if self.scheduler is not None:
+            self.scheduler.refresh()
+        for u in self.urls:
+            ready[u] = max(self.last_times[u] + self.policies.wait_for(u), self.policies.not_before(u))
+            if self.scheduler is not None:
+                ready[u] = max(ready[u], self.scheduler.ready_time(u))
+
+        soonest = min(ready.values())
+        lonliest_urls = [u for u in ready if ready[u] == soonest]
+        if len(lonliest_urls) > 1 and self.last_base_url in lonliest_urls:
+            lonliest_urls.remove(self.last_base_url)
+        new_key = choice(lonliest_urls)
+
+        # Wait, if need be (a shared schedule is the only gate, so we never wait twice).
+        url = self.urls[new_key].pop()
+        if self.scheduler is not None:
+            self.scheduler.acquire(url)
         else:
-            # If there are multiple base URLs left, choose one that hasn't been hit lately.
-            oldest_time = min(self.last_times[u] for u in new_keys)
-            lonliest_urls = [u for u in new_keys if self.last_times[u] == oldest_time]
-            new_key = choice(lonliest_urls)
-
-        # Wait, if need be.
-        waited = max(0, datetime.now().timestamp() - self.last_times[new_key])
-        if new_key == self.last_base_url or waited < self.wait:
-            to_wait = min(self.wait, abs(self.wait - waited))
-            sleep(to_wait + 0.1 * self.wait * random())
+            to_wait = ready[new_key] - self.clock.now()
+            if to_wait > 0:
+                self.clock.sleep(to_wait + 0.1 * self.policies.wait_for(new_key) * random())
 
         # FINALLY, return the next URL
-        self.last_times[new_key] = datetime.now().timestamp()
+        self.last_times[new_key] = self.clock.now()
         self.last_base_url = new_key
-        return self.urls[new_key].pop().strip()
-
-
-if __name__ == '__main__':
-    main()
+        return url
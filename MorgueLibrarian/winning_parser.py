@@ -13,9 +13,42 @@ games playing similar character builds to myself.
 But a side result of this data mining is I can learn lots of other things. For instance,
 what percentage of games do players win?
 
-TODO: Needs usage guide
+Usage:
+
+    python MorgueLibrarian/winning_parser.py data/morgue_urls_20200101_120000.txt
+    python MorgueLibrarian/winning_parser.py data/morgue_urls_*.txt.bz2 --save
+    python MorgueLibrarian/winning_parser.py data/morgue_urls_*.txt.bz2 --save --codec zstd
+    python MorgueLibrarian/winning_parser.py data/morgue_urls_*.txt.zst
+    python MorgueLibrarian/winning_parser.py data/morgue_urls_*.txt -w 4
+    python MorgueLibrarian/winning_parser.py --retry
+    python MorgueLibrarian/winning_parser.py data/morgue_urls_*.txt --cache
+    python MorgueLibrarian/winning_parser.py data/morgue_urls_*.txt --cache --reparse
+
+With --save, winning morgues are saved to data/saved/, compressed with bz2, or with the codec
+given by --codec (see file_codecs.py).
+
+Morgues that fail for transient reasons (connection errors, timeouts, HTTP 429 or 5xx) are not
+written to the parser_errors_* files, they are kept in data/retry_queue.txt instead. Once a server
+fails, the rest of its morgues in this run go straight to the queue, without being tried. Running
+with --retry only re-processes the URLs in that queue whose backoff has expired.
+
+The skills, stats, XL, runes, god and turn count of every winning character are also written to
+the features_* files, from which similar_winners.py builds its nearest-neighbor index.
+
+With --cache, every morgue downloaded is kept in a compressed cache (data/response_cache/, see
+response_cache.py), and morgues already in the cache are never downloaded again. So after a
+change to the parsing rules, the whole corpus can be reparsed locally, as fast as the CPU allows:
+move the old winners_*, losers_*, parser_errors_* and features_* files aside, and run with
+--reparse, which parses every morgue given, even those the old output files already list.
+
+Library usage:
+
+    parser = WinningParser([])
+    for record in parser.parse_many(['data/saved/some_morgue.txt', 'http://...']):
+        print(record)
 """
-from bz2 import BZ2Compressor, BZ2File
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 from random import choice
@@ -23,25 +56,67 @@ import requests
 from sys import argv
 from crawl_data import *
 from library_data import *
-from custom_errors import Loser, ParserError
+from canonical_urls import unique_urls
+from custom_errors import Loser, ParserError, TransientError
+from data_files import iter_lines
+from file_codecs import CODECS, codec_for_path, open_file, read_bytes
+from host_policies import HostPolicies, retry_after_seconds
 from known_morgues import KnownMorgues
+from morgue_features import read_features
+from parse_results import ErrorRecord, LosingRecord, WinningRecord, error_line, features_line, winning_line
+from response_cache import ResponseCache
+from retry_queue import RetryQueue
 from url_iterator import URLIterator
 
+# byte strings we search for before decoding any of the morgue
+HEADER_MARKER = b' Dungeon Crawl Stone Soup version '
+WIN_MARKER = b'Escaped with the Orb'
+
+# a morgue we didn't try, because its server is failing
+BACKING_OFF = 'BackingOff'
+_BACKING_OFF = object()
+
 
 def main():
     # grab file paths from command line
     save_winners = False
-    master_files = argv[1:].copy()
-
-    save_flags = ('-s', '--save')
-    for s in save_flags:
-        if s in argv[1:]:
+    retry = False
+    reparse = False
+    use_cache = False
+    workers = 1
+    codec = CODECS['bz2']
+    master_files = []
+
+    a = 1
+    while a < len(argv):
+        if argv[a].lower() in ('-s', '--save'):
             save_winners = True
-            master_files.remove(s)
+        elif argv[a].lower() in ('-r', '--retry'):
+            retry = True
+        elif argv[a].lower() in ('-c', '--cache'):
+            use_cache = True
+        elif argv[a].lower() == '--reparse':
+            reparse = True
+        elif argv[a].lower() in ('-w', '--workers'):
+            a += 1
+            workers = int(argv[a])
+        elif argv[a].lower() == '--codec':
+            a += 1
+            codec = CODECS[argv[a].lower()]
+        else:
+            master_files.append(argv[a])
+        a += 1
 
     # run the winning game parser
-    p = WinningParser(master_files, save_winners)
-    p.parse()
+    p = WinningParser(master_files, save_winners, workers)
+    p.reparse = reparse
+    p.codec = codec
+    if use_cache:
+        p.cache = ResponseCache(os.path.join(DATA_DIR, RESPONSE_CACHE))
+    if retry:
+        p.retry()
+    else:
+        p.parse()
 
 
 class WinningParser:
@@ -49,13 +124,21 @@ class WinningParser:
     save the basic character information if so.
     """
 
-    def __init__(self, master_files, save_winners=False):
+    def __init__(self, master_files, save_winners=False, workers=1):
         self.master_files = master_files
         self.save_winners = save_winners
+        self.workers = max(1, int(workers))
         self.data_dir = DATA_DIR
         self.dt_fmt = DT_FMT
+        self.features = FEATURES
         self.losers = LOSERS
         self.parser_errors = PARSER_ERRORS
+        self.policies = HostPolicies(os.path.join(DATA_DIR, HOST_POLICIES))
+        self.reparse = False
+        self.scheduler = None
+        self.cache = None
+        self.codec = CODECS['bz2']
+        self.retry_queue = RetryQueue(os.path.join(DATA_DIR, RETRY_QUEUE))
         self.saved_dir = os.path.join(self.data_dir, SAVED_DIR)
         self.winners = WINNERS
 
@@ -68,111 +151,314 @@ class WinningParser:
         # the user will pass in some file filled with links / paths to morgues
         urls = []
         for master_file in self.master_files:
-            if master_file.endswith('.bz2'):
-                binary_urls = BZ2File(master_file, 'r').readlines()
-                urls += [u.decode('utf-8') for u in binary_urls]
-            else:
-                urls += open(master_file, 'r').readlines()
+            urls += iter_lines(master_file)
+
+        # what URLs have we already seen? (unless we are reparsing everything, after a change to the rules)
+        known_morgues = None
+        if not self.reparse:
+            known_morgues = KnownMorgues([self.winners, self.losers, self.parser_errors], [self.data_dir])
+            known_morgues.find()
+        urls = unique_urls(urls, known_morgues)
 
+        self.retry_queue.load()
+        self.parse_urls(urls)
+
+    def retry(self):
+        """ Re-process only the URLs in the retry queue whose backoff has expired,
+        giving up on any URL that has failed too many times.
+
+        Returns: None
+        """
+        self.retry_queue.load()
+
+        # anything that has since been parsed (say, from a master file) can be dropped
+        known_morgues = KnownMorgues([self.winners, self.losers, self.parser_errors], [self.data_dir],
+                                     keys=list(self.retry_queue.entries))
+        known_morgues.find()
+        for url in list(self.retry_queue.entries):
+            if known_morgues.includes(url):
+                self.retry_queue.remove(url)
+
+        # URLs that keep failing are eventually treated as permanent errors
+        ef = os.path.join(self.data_dir, '{0}{1}.txt'.format(self.parser_errors, self.current_datetime_string()))
+        for url, category in self.retry_queue.exhausted():
+            open(ef, 'a+').write(error_line(ErrorRecord(url, category, '', False)))
+            self.retry_queue.remove(url)
+
+        urls = self.retry_queue.due()
+        print('Retrying {0} of {1} queued URLs'.format(len(urls), len(self.retry_queue)))
+        self.parse_urls(urls)
+
+    def parse_urls(self, urls, dt_now=None):
+        """ Parse a lot of morgue files/URLs, and write the results to output files.
+        Transient failures go to the retry queue, instead of the parser_errors file.
+
+        Args:
+            urls (list): morgue file paths and/or URLs
+            dt_now (str): optional, timestamp of the output files to append to (defaults to now)
+        Returns: None
+        """
         # init new output files
-        dt_now = self.current_datetime_string()
+        if dt_now is None:
+            dt_now = self.current_datetime_string()
         wf = os.path.join(self.data_dir, '{0}{1}.txt'.format(self.winners, dt_now))
         lf = os.path.join(self.data_dir, '{0}{1}.txt'.format(self.losers, dt_now))
         ef = os.path.join(self.data_dir, '{0}{1}.txt'.format(self.parser_errors, dt_now))
-
-        # what URLs have we already seen?
-        known_morgues = KnownMorgues([self.winners, self.losers, self.parser_errors], [self.data_dir])
-        known_morgues.find()
+        ff = os.path.join(self.data_dir, '{0}{1}.txt'.format(self.features, dt_now))
 
         # loop through each morgue file/URL and parse it, save the results to files
-        url_iter = URLIterator(urls)
-        for url in url_iter:
-            # make sure we haven't already parsed this morgue
-            if known_morgues.includes(url):
-                continue
+        try:
+            for record in self.parse_many(urls, self.workers):
+                print('.', end='', flush=True)
+                if isinstance(record, ErrorRecord) and record.category == BACKING_OFF:
+                    self.retry_queue.defer(record.url, record.category)
+                    continue
+                elif isinstance(record, ErrorRecord) and record.transient:
+                    self.retry_queue.add(record.url, record.category)
+                    continue
+
+                self.retry_queue.remove(record.url)
+                if record.url.startswith('http'):
+                    self.retry_queue.succeeded(record.url)
+                if isinstance(record, WinningRecord):
+                    open(wf, 'a+').write(winning_line(record))
+                    if record.features is not None:
+                        open(ff, 'a+').write(features_line(record))
+                elif isinstance(record, LosingRecord):
+                    open(lf, 'a+').write('{0}\n'.format(record.url))
+                else:
+                    open(ef, 'a+').write(error_line(record))
+        finally:
+            self.retry_queue.save()
+
+    def parse_many(self, sources, workers=1):
+        """ Parse a collection of morgue files and URLs, yielding one result record per morgue.
+        Local files (and cached URLs) are read immediately, while URLs are interleaved by server
+        (via URLIterator) so we don't hit any one server more often than its HostPolicies allow.
+
+        Args:
+            sources (iterable): morgue file paths and/or URLs, as strings
+            workers (int): number of threads used to read and parse morgues concurrently
+        Returns:
+            generator: WinningRecord, LosingRecord, or ErrorRecord for each morgue
+            (a morgue not even tried, because its server is failing, is a transient ErrorRecord
+            with the category BACKING_OFF)
+        """
+        ordered = self._ordered_sources(s.strip() for s in sources if len(s.strip()))
+
+        if workers <= 1:
+            for source, data in ordered:
+                yield self.parse_source(source, data)
+            return
+
+        # keep a bounded number of morgues in flight, and yield results in order
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for source, data in ordered:
+                pending.append(pool.submit(self.parse_source, source, data))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+
+            while len(pending):
+                yield pending.popleft().result()
+
+    def _ordered_sources(self, sources):
+        """ The order to read morgues in: local files and cached URLs right away, then the other URLs
+        interleaved by server. Each URL is looked up in the cache only once. Once a server is
+        backing off (see retry_queue.py), the rest of its URLs are not fetched at all.
+
+        Args:
+            sources (iterable): morgue file paths and/or URLs, as strings
+        Returns:
+            generator: (source, data) for each morgue, where data is the cached content, or None
+        """
+        urls = []
+        for source in sources:
+            if source.startswith('http'):
+                urls.append(source)
+            else:
+                yield source, None
+
+        misses = []
+        for url in urls:
+            data = None if self.cache is None else self.cache.get(url)
+            if data is None:
+                misses.append(url)
+            else:
+                yield url, data
+
+        url_iter = URLIterator(misses, policies=self.policies, scheduler=self.scheduler)
+        while True:
+            for base in list(url_iter.urls):
+                if len(url_iter.urls[base]) and self.retry_queue.backing_off(url_iter.urls[base][0]):
+                    for url in url_iter.drop(base):
+                        yield url, _BACKING_OFF
 
-            # parse the file and write any results to output files
-            print('.', end='', flush=True)
             try:
-                # parse the text file or HTML link
-                if url.startswith('http'):
-                    txt = WinningParser.read_url(url)
-                elif url.endswith('bz2'):
-                    txt = WinningParser.read_bzip_file(url)
-                else:
-                    txt = WinningParser.read_txt_file(url)
-
-                # write out the winning build and reference
-                spec, back, god, runes, ver = self.parse_one_morgue(txt, url)
-                god_str = '^' + god if len(god) else ''
-                open(wf, 'a+').write('{0}  {1}{2}{3},{4},{5}\n'.format(url.strip(), spec, back, god_str, runes, ver))
-            except Loser:
-                open(lf, 'a+').write('{0}\n'.format(url.strip()))
-            except Exception as e:
-                err = str(e).replace('\n', '    ')
-                if 'connection' in err.lower():
-                    open(ef, 'a+').write('{0} ConnectionError\n'.format(url.strip()))
-                else:
-                    err_type = 'ParserError' if 'ParserError' in err else 'UnknownError'
-                    open(ef, 'a+').write('{0}  {1}: {2}\n'.format(url.strip(), err_type, err))
+                url = next(url_iter)
+            except StopIteration:
+                break
+            yield url, None
+
+    def parse_source(self, source, data=None):
+        """ Read and parse a single morgue file or URL, without ever raising.
+
+        Args:
+            source (str): path to the URL (or file path) for this morgue
+            data (bytes): optional, content of the morgue, if we already have it
+        Returns:
+            namedtuple: WinningRecord, LosingRecord, or ErrorRecord
+        """
+        if data is _BACKING_OFF:
+            return ErrorRecord(source, BACKING_OFF, '', True)
+
+        txt = data
+        try:
+            if txt is None and source.startswith('http'):
+                # _ordered_sources already looked in the cache
+                txt = WinningParser.read_url(source, self.cache, look_in_cache=False)
+            elif txt is None:
+                txt = WinningParser.read_source(source)
+        except Exception as e:
+            if isinstance(e, TransientError) and e.retry_after is not None:
+                # the server asked us to back off
+                self.policies.slow_down(source, e.retry_after)
+            return WinningParser.error_record(source, e)
+
+        # the server answered normally (this is never blamed on the morgue itself)
+        if data is None and source.startswith('http'):
+            self.policies.speed_up(source)
+
+        try:
+            spec, back, god, runes, ver = self.parse_one_morgue(txt, source)
+            return WinningRecord(source, spec, back, god, runes, ver, WinningParser.features(txt))
+        except Loser:
+            return LosingRecord(source)
+        except Exception as e:
+            return WinningParser.error_record(source, e)
+
+    @staticmethod
+    def error_record(source, e):
+        """ Classify an exception raised while reading or parsing a morgue as either transient
+        (the server had a problem, worth retrying later) or permanent (the morgue itself is bad).
+
+        Args:
+            source (str): path to the URL (or file path) for this morgue
+            e (Exception): whatever went wrong
+        Returns:
+            ErrorRecord: the category and message of the error
+        """
+        err = str(e).replace('\n', '    ')
+        if isinstance(e, requests.exceptions.Timeout):
+            return ErrorRecord(source, 'Timeout', '', True)
+        elif isinstance(e, requests.exceptions.ConnectionError) or 'connection' in err.lower():
+            return ErrorRecord(source, 'ConnectionError', '', True)
+        elif isinstance(e, TransientError):
+            return ErrorRecord(source, 'HTTPError', err, True)
+        elif isinstance(e, ParserError) or 'ParserError' in err:
+            return ErrorRecord(source, 'ParserError', err, False)
+        else:
+            return ErrorRecord(source, 'UnknownError', err, False)
+
+    @staticmethod
+    def read_source(source, cache=None):
+        """ Read the raw bytes of a morgue, whether it is a URL, a compressed file, or a plain txt file
+
+        Args:
+            source (str): path to the URL (or file path) for this morgue
+            cache (ResponseCache): optional, cache of fetched URLs
+        Returns:
+            bytes: content of the morgue
+        """
+        if source.startswith('http'):
+            return WinningParser.read_url(source, cache)
+        elif codec_for_path(source.strip()) is not None:
+            return WinningParser.read_compressed_file(source)
+        else:
+            return WinningParser.read_txt_file(source)
 
     @staticmethod
     def read_txt_file(file_path):
-        """ Read the text from a plain txt file
+        """ Read the raw bytes of a plain txt file
 
         Args:
             file_path (str): path to the morgue file
         Returns:
-            str: content of the file
+            bytes: content of the file
         """
-        return open(file_path.strip(), 'r').read()
+        with open(file_path.strip(), 'rb') as f:
+            return f.read()
 
     @staticmethod
-    def read_bzip_file(file_path):
-        """ Read the text from a bzip2 file
+    def read_compressed_file(file_path):
+        """ Read the raw (decompressed) bytes of a compressed file (gzip, bz2, xz, or zstd)
 
         Args:
             file_path (str): path to the morgue file
         Returns:
-            str: content of the file
+            bytes: content of the file
         """
-        return BZ2File(file_path, 'r').read()
+        return read_bytes(file_path.strip())
+
+    # older name, from when saved morgues could only be bzip2
+    read_bzip_file = read_compressed_file
 
     @staticmethod
-    def read_url(url):
-        """ Read the text from a URL
+    def read_url(url, cache=None, look_in_cache=True):
+        """ Read the raw bytes from a URL, from the cache if we have it there
 
         Args:
             url (str): HTML address for a morgue file
+            cache (ResponseCache): optional, cache of fetched URLs
+            look_in_cache (bool): False if we already know the URL isn't cached, and only want to add it
         Returns:
-            str: content of the URL
+            bytes: content of the URL
         """
-        r = requests.get(url.strip(), headers={'User-Agent': choice(USER_AGENTS)}, timeout=5)
-        return r.content.decode("utf-8")
+        if cache is not None and look_in_cache:
+            data = cache.get(url)
+            if data is not None:
+                return data
 
-    def parse_one_morgue(self, txt, url):
+        r = requests.get(url.strip(), headers={'User-Agent': choice(USER_AGENTS)}, timeout=5)
+        if r.status_code == 429 or r.status_code >= 500:
+            retry_after = None
+            if r.status_code in (429, 503):
+                retry_after = retry_after_seconds(r.headers.get('Retry-After', ''))
+            raise TransientError('HTTP {0}'.format(r.status_code), retry_after)
+        elif cache is not None and r.status_code == 200:
+            cache.put(url, r.content)
+        return r.content
+
+    def parse_one_morgue(self, data, url):
         """ Parse the text of a single morgue file, to try and determine:
         1. Did the player win this game?
         2. If so, what was their character build, how many runes did they get?
 
+        Only the header lines of a winning morgue are ever decoded, the rest is searched as raw bytes.
+
         Args:
-            txt (str): full text dump of morgue file
+            data (bytes): full dump of morgue file (a str is also accepted)
             url (str): path to the URL (or file path) for this morgue
         Returns:
             tuple: species, background, god, num_runes, version
         """
-        txt = WinningParser.strip_html(txt)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        data = WinningParser.strip_html(data)
 
-        lines = txt.split('\n')[:20]
-        if len(lines) < 13:
+        # most morgues are losses, so check the raw bytes before decoding anything
+        end = WinningParser.header_end(data, 20)
+        if data.count(b'\n', 0, end) < 12:
             raise ParserError('Invalid file, not long enough')
-        elif not lines[0].startswith(' Dungeon Crawl Stone Soup version '):
+        elif not data.startswith(HEADER_MARKER):
             raise ParserError('Invalid file, starting line not found')
-        elif "Escaped with the Orb" not in txt:
+        elif WIN_MARKER not in data:
             raise Loser('This is not a winning run.')
 
+        lines = data[:end].decode('utf-8', 'replace').split('\n')[:20]
+
         # optionally, save morgue to file
-        self._save_winners(txt, url)
+        self._save_winners(data, url)
 
         version = lines[0].split(' version ')[1].split('-')[0].split()[0].split('.')
         version = '.'.join([version[0], version[1]])
@@ -232,39 +518,76 @@ class WinningParser:
 
         return species, background, god, num_runes, version
 
-    def _save_winners(self, txt, url):
-        """ optionally, save the winning morgue to a BZIP2 file
+    @staticmethod
+    def features(data):
+        """ Read the numeric description of a winning character (see morgue_features.py).
+        A winner is still a winner even if this fails, so failures are not errors.
+
+        Args:
+            data (bytes): full dump of morgue file (a str is also accepted)
+        Returns:
+            MorgueFeatures: the numbers that describe this character, or None
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        try:
+            return read_features(WinningParser.strip_html(data))
+        except ParserError:
+            return None
+
+    @staticmethod
+    def header_end(data, num_lines):
+        """ Find where the first few lines of a morgue end, without decoding anything
+
+        Args:
+            data (bytes): full dump of morgue file
+            num_lines (int): number of lines in the header
+        Returns:
+            int: index just past the end of the header lines
+        """
+        end = 0
+        for _ in range(num_lines):
+            i = data.find(b'\n', end)
+            if i < 0:
+                return len(data)
+            end = i + 1
+
+        return end
+
+    def _save_winners(self, data, url):
+        """ optionally, save the winning morgue to a compressed file (see file_codecs.py)
 
         Args:
-            txt (str): full text dump of morgue file
+            data (bytes): full dump of morgue file
             url (str): path to the URL (or file path) for this morgue
         Returns: None
         """
-        if self.save_winners and url.starts('http'):
+        if self.save_winners and url.startswith('http'):
             file_path = url.replace('https://', '').replace('http://', '').replace('/', '_')
-            file_path = os.path.join(self.saved_dir, file_path + '.bz2')
-            compressor = BZ2Compressor()
-            f = bz2.open(file_path, "wb")
-            f.write(compressor.compress(txt))
-            f.close()
+            file_path = os.path.join(self.saved_dir, file_path + self.codec.extension)
+            os.makedirs(self.saved_dir, exist_ok=True)
+            with open_file(file_path, 'wb', self.codec) as f:
+                f.write(data)
 
     @staticmethod
-    def strip_html(txt):
+    def strip_html(data):
         """ strip HTML from a non-raw dump, if any exists
 
         Args:
-            txt (str): raw text of morgue file
+            data (bytes): raw bytes of morgue file
         Returns:
-            str: text of morgue file, with any HTML hopefully stripped out
+            bytes: morgue file, with any HTML hopefully stripped out
         """
-        if "<!DOCTYPE html>" in txt or "<html>" in txt:
-            i = txt.find(' Dungeon Crawl Stone Soup version ')
+        if b'<!DOCTYPE html>' in data or b'<html>' in data:
+            i = data.find(HEADER_MARKER)
             if i < 21:
-                return ''
+                return b''
             else:
-                return txt[i:].split('</pre>')[0]
+                end = data.find(b'</pre>', i)
+                return data[i:] if end < 0 else data[i:end]
         else:
-            return txt
+            return data
 
     def current_datetime_string(self):
         """ Get the current datetime in a simple format useful for file names
@@ -0,0 +1,418 @@
+""" Work Queue
+
+Spread a huge master list of morgue URLs across several worker processes, on one or more
+machines that share a filesystem, without ever fetching the same morgue twice or hitting the
+same server from two workers at once.
+
+The work queue is a SQLite database (data/work_queue.sqlite):
+
+* Every URL is loaded once (duplicates and known morgues are dropped, see canonical_urls.py). Each
+  game is only queued once too, even if it is loaded again later from another mirror.
+* Workers lease batches of URLs. Every batch comes from a single host, and each host is leased
+  to exactly one worker at a time, so the per-host politeness waits still hold.
+* Leases expire. If a worker dies, its URLs and hosts are reclaimed by the other workers.
+* Transient failures (connection errors, HTTP 429/5xx) go back into the queue with a backoff.
+* The results are merged into the usual winners_*, losers_*, parser_errors_* and features_*
+  files, exactly once per URL. The files are written as temp files and only renamed once the
+  database has marked their URLs as merged, so a crash part way through never duplicates a line.
+
+Usage:
+
+    python MorgueLibrarian/work_queue.py load data/morgue_urls_*.txt
+    python MorgueLibrarian/work_queue.py work                  # run on as many machines as you like
+    python MorgueLibrarian/work_queue.py work --worker box2 -b 20 --cache
+    python MorgueLibrarian/work_queue.py status
+    python MorgueLibrarian/work_queue.py merge
+"""
+from datetime import datetime
+import os
+from shutil import copyfile
+import socket
+import sqlite3
+from sys import argv
+from time import sleep
+from canonical_urls import canonical_url, game_fingerprint, unique_urls
+from data_files import iter_lines
+from host_policies import base_url
+from known_morgues import KnownMorgues
+from library_data import *
+from parse_results import ErrorRecord, LosingRecord, WinningRecord, error_line, features_line, winning_line
+from response_cache import ResponseCache
+from winning_parser import WinningParser
+
+# CONSTANTS
+BATCH_SIZE = 20
+LEASE_SECONDS = 2 * 3600
+MAX_ATTEMPTS = 8
+POLL_SECONDS = 60.0
+RETRY_WAIT = 600.0
+
+
+def main():
+    if len(argv) < 2 or argv[1] not in ('load', 'work', 'status', 'merge'):
+        usage()
+
+    command = argv[1]
+    worker = '{0}-{1}'.format(socket.gethostname(), os.getpid())
+    batch_size = BATCH_SIZE
+    save_winners = False
+    use_cache = False
+    files = []
+
+    # optional commandline parsing
+    a = 2
+    while a < len(argv):
+        if argv[a].lower() in ('-b', '--batch_size'):
+            a += 1
+            batch_size = int(argv[a])
+        elif argv[a].lower() == '--worker':
+            a += 1
+            worker = argv[a]
+        elif argv[a].lower() in ('-s', '--save'):
+            save_winners = True
+        elif argv[a].lower() in ('-c', '--cache'):
+            use_cache = True
+        else:
+            files.append(argv[a])
+        a += 1
+
+    wq = WorkQueue(os.path.join(DATA_DIR, WORK_QUEUE))
+    if command == 'load':
+        urls = [line for f in files for line in iter_lines(f)]
+        print('Loaded {0} new URLs'.format(wq.load(urls)))
+    elif command == 'work':
+        parser = WinningParser([], save_winners)
+        if use_cache:
+            parser.cache = ResponseCache(os.path.join(DATA_DIR, RESPONSE_CACHE))
+        wq.work(worker, parser, batch_size)
+    elif command == 'status':
+        for state, count in sorted(wq.status().items()):
+            print('{0}:\t{1}'.format(state, count))
+    else:
+        print('Merged {0} results'.format(wq.merge(DATA_DIR)))
+
+
+class WorkQueue:
+    """ A SQLite-backed queue of morgue URLs, leased out to workers one host at a time """
+
+    def __init__(self, db_path, lease_seconds=LEASE_SECONDS):
+        self.db_path = db_path
+        self.lease_seconds = float(lease_seconds)
+        self.db = sqlite3.connect(db_path, timeout=120, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=DELETE')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS urls (
+                               url TEXT PRIMARY KEY, canonical TEXT UNIQUE, host TEXT,
+                               state TEXT DEFAULT 'pending', worker TEXT, lease_expires REAL DEFAULT 0,
+                               attempts INTEGER DEFAULT 0, not_before REAL DEFAULT 0,
+                               kind TEXT, result TEXT, features TEXT, game TEXT)''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS urls_by_host ON urls (state, host)')
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(urls)')]
+        if 'features' not in columns:
+            # queues made before the features were stored
+            self.db.execute('ALTER TABLE urls ADD COLUMN features TEXT')
+        if 'game' not in columns:
+            # queues made before the games were fingerprinted
+            self._add_games()
+        self.db.execute('CREATE UNIQUE INDEX IF NOT EXISTS urls_by_game ON urls (game)')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS hosts (
+                               host TEXT PRIMARY KEY, worker TEXT, lease_expires REAL DEFAULT 0,
+                               not_before REAL DEFAULT 0)''')
+        self.db.execute('CREATE TABLE IF NOT EXISTS merges (path TEXT PRIMARY KEY)')
+
+    def load(self, urls, data_dir=DATA_DIR):
+        """ Add URLs to the queue, skipping duplicates, games already in the queue (from any mirror),
+        and morgues we have already parsed
+
+        Args:
+            urls (iterable): morgue URLs
+            data_dir (str): data directory holding the winners/losers/parser_errors files
+        Returns:
+            int: number of new URLs added
+        """
+        known_morgues = KnownMorgues([WINNERS, LOSERS, PARSER_ERRORS], [data_dir])
+        known_morgues.find()
+        urls = [u for u in unique_urls(urls, known_morgues) if u.startswith('http')]
+
+        before = self._count()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.executemany('INSERT OR IGNORE INTO urls (url, canonical, host, game) VALUES (?, ?, ?, ?)',
+                                [(u, canonical_url(u), base_url(canonical_url(u)), WorkQueue._game(u))
+                                 for u in urls])
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        return self._count() - before
+
+    def lease(self, worker, batch_size=BATCH_SIZE):
+        """ Lease a batch of URLs, all from one host, which no other worker may touch until
+        we release it or the lease expires.
+
+        Args:
+            worker (str): unique name of this worker
+            batch_size (int): most URLs to lease
+        Returns:
+            tuple: (host, list of URLs); the list is empty if there is nothing to do right now
+        """
+        now = datetime.now().timestamp()
+        expires = now + self.lease_seconds
+
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            # reclaim the hosts and URLs of any worker that has gone quiet
+            self.db.execute('UPDATE hosts SET worker = NULL WHERE lease_expires < ?', (now,))
+            self.db.execute("UPDATE urls SET state = 'pending', worker = NULL "
+                            "WHERE state = 'leased' AND lease_expires < ?", (now,))
+
+            # find a host with work to do, that nobody else owns, and that we may hit now
+            row = self.db.execute('''SELECT u.host FROM urls u LEFT JOIN hosts h ON u.host = h.host
+                                     WHERE u.state = 'pending' AND u.not_before <= ?
+                                       AND (h.host IS NULL OR
+                                            ((h.worker IS NULL OR h.worker = ?) AND h.not_before <= ?))
+                                     ORDER BY (h.worker = ?) DESC, RANDOM() LIMIT 1''',
+                                  (now, worker, now, worker)).fetchone()
+            if row is None:
+                self.db.execute('COMMIT')
+                return None, []
+
+            host = row[0]
+            self.db.execute('INSERT OR IGNORE INTO hosts (host) VALUES (?)', (host,))
+            self.db.execute('UPDATE hosts SET worker = ?, lease_expires = ? WHERE host = ?', (worker, expires, host))
+            urls = [r[0] for r in self.db.execute('''SELECT url FROM urls
+                                                     WHERE host = ? AND state = 'pending' AND not_before <= ?
+                                                     LIMIT ?''', (host, now, int(batch_size)))]
+            self.db.executemany("UPDATE urls SET state = 'leased', worker = ?, lease_expires = ? WHERE url = ?",
+                                [(worker, expires, u) for u in urls])
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+
+        return host, urls
+
+    def finish(self, worker, record):
+        """ Record the result of parsing one leased URL, and renew our leases
+
+        Args:
+            worker (str): unique name of this worker
+            record (namedtuple): WinningRecord, LosingRecord, or ErrorRecord
+        Returns: None
+        """
+        now = datetime.now().timestamp()
+        expires = now + self.lease_seconds
+
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            if isinstance(record, ErrorRecord) and record.transient:
+                # put it back in the queue, with an exponential backoff
+                attempts = self.db.execute('SELECT attempts FROM urls WHERE url = ?', (record.url,)).fetchone()
+                attempts = (attempts[0] if attempts else 0) + 1
+                if attempts < MAX_ATTEMPTS:
+                    self.db.execute("UPDATE urls SET state = 'pending', worker = NULL, attempts = ?, not_before = ? "
+                                    "WHERE url = ? AND worker = ?",
+                                    (attempts, now + RETRY_WAIT * 2 ** (attempts - 1), record.url, worker))
+                else:
+                    self.db.execute("UPDATE urls SET state = 'done', kind = 'error', result = ?, attempts = ? "
+                                    "WHERE url = ? AND worker = ?",
+                                    (error_line(record._replace(transient=False)), attempts, record.url, worker))
+            else:
+                kind, result = WorkQueue._result(record)
+                features = features_line(record) if kind == 'winner' and record.features is not None else None
+                self.db.execute("UPDATE urls SET state = 'done', kind = ?, result = ?, features = ? "
+                                "WHERE url = ? AND worker = ?", (kind, result, features, record.url, worker))
+
+            self.db.execute("UPDATE urls SET lease_expires = ? WHERE worker = ? AND state = 'leased'",
+                            (expires, worker))
+            self.db.execute('UPDATE hosts SET lease_expires = ? WHERE worker = ?', (expires, worker))
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def release(self, worker, host, wait=0.0):
+        """ Give up our lease on a host, so another worker may take it, after the politeness wait
+
+        Args:
+            worker (str): unique name of this worker
+            host (str): base URL of the host
+            wait (float): seconds before anyone may hit this host again
+        Returns: None
+        """
+        not_before = datetime.now().timestamp() + float(wait)
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.execute("UPDATE urls SET state = 'pending', worker = NULL WHERE worker = ? AND state = 'leased'",
+                            (worker,))
+            self.db.execute('UPDATE hosts SET worker = NULL, not_before = ? WHERE host = ? AND worker = ?',
+                            (not_before, host, worker))
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def work(self, worker, parser, batch_size=BATCH_SIZE):
+        """ Keep leasing and parsing batches of URLs, until the whole queue is done
+
+        Args:
+            worker (str): unique name of this worker
+            parser (WinningParser): parser used to read the morgues
+            batch_size (int): most URLs to lease at once
+        Returns: None
+        """
+        while True:
+            host, urls = self.lease(worker, batch_size)
+            if not len(urls):
+                if not self._count('pending') and not self._count('leased'):
+                    break
+                sleep(POLL_SECONDS)
+                continue
+
+            try:
+                for record in parser.parse_many(urls):
+                    print('.', end='', flush=True)
+                    self.finish(worker, record)
+            finally:
+                self.release(worker, host, parser.policies.wait_for(host))
+
+    def merge(self, data_dir):
+        """ Write all the finished results to new output files, exactly once each
+
+        Args:
+            data_dir (str): data directory to write the winners/losers/parser_errors/features files to
+        Returns:
+            int: number of results merged
+        """
+        dt_now = datetime.now().strftime(DT_FMT)
+        prefixes = {'winner': WINNERS, 'loser': LOSERS, 'error': PARSER_ERRORS}
+        paths = []
+
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            # finish off any merge that committed, but crashed before renaming its files
+            self._rename_merged()
+
+            rows = self.db.execute("SELECT url, kind, result, features FROM urls WHERE state = 'done' "
+                                   "ORDER BY url").fetchall()
+            outputs = dict((prefix, [r[2] for r in rows if r[1] == kind]) for kind, prefix in prefixes.items())
+            outputs[FEATURES] = [r[3] for r in rows if r[3] is not None]
+            for prefix, lines in outputs.items():
+                if len(lines):
+                    path = os.path.join(data_dir, '{0}{1}.txt'.format(prefix, dt_now))
+                    paths.append(path)
+                    if os.path.exists(path):
+                        # another merge in the same second: keep its lines too
+                        copyfile(path, path + '.tmp')
+                    else:
+                        open(path + '.tmp', 'w').close()
+                    with open(path + '.tmp', 'a') as f:
+                        f.writelines(lines)
+
+            self.db.executemany('INSERT OR IGNORE INTO merges (path) VALUES (?)', [(p,) for p in paths])
+            self.db.executemany("UPDATE urls SET state = 'merged' WHERE url = ?", [(r[0],) for r in rows])
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            for path in paths:
+                if os.path.exists(path + '.tmp'):
+                    os.remove(path + '.tmp')
+            raise
+
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self._rename_merged()
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        return len(rows)
+
+    def status(self):
+        """ How many URLs are in each state?
+
+        Returns:
+            dict: count of URLs for each state
+        """
+        return dict(self.db.execute('SELECT state, COUNT(*) FROM urls GROUP BY state').fetchall())
+
+    def _rename_merged(self):
+        """ Rename the temp files of every committed merge to their real names.
+        Must be called inside a transaction, so only one worker renames them.
+
+        Returns: None
+        """
+        for path, in self.db.execute('SELECT path FROM merges').fetchall():
+            if os.path.exists(path + '.tmp'):
+                os.replace(path + '.tmp', path)
+            self.db.execute('DELETE FROM merges WHERE path = ?', (path,))
+
+    def _add_games(self):
+        """ Add the game fingerprint column to an older queue, and fill it in for the URLs already there.
+        If an older queue already holds the same game twice, only the first one gets its fingerprint.
+
+        Returns: None
+        """
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            if 'game' in [row[1] for row in self.db.execute('PRAGMA table_info(urls)')]:
+                # another worker got here first
+                self.db.execute('COMMIT')
+                return
+            self.db.execute('ALTER TABLE urls ADD COLUMN game TEXT')
+            self.db.execute('CREATE UNIQUE INDEX IF NOT EXISTS urls_by_game ON urls (game)')
+            urls = [r[0] for r in self.db.execute('SELECT url FROM urls ORDER BY rowid')]
+            self.db.executemany('UPDATE OR IGNORE urls SET game = ? WHERE url = ?',
+                                [(WorkQueue._game(u), u) for u in urls])
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def _count(self, state=None):
+        """ Count the URLs in the queue, optionally only those in one state
+
+        Args:
+            state (str): optional, e.g. "pending"
+        Returns:
+            int: number of URLs
+        """
+        if state is None:
+            return self.db.execute('SELECT COUNT(*) FROM urls').fetchone()[0]
+        return self.db.execute('SELECT COUNT(*) FROM urls WHERE state = ?', (state,)).fetchone()[0]
+
+    @staticmethod
+    def _game(url):
+        """ Fingerprint the game a morgue URL belongs to, so its mirrors share one row in the queue
+
+        Args:
+            url (str): morgue URL
+        Returns:
+            str: "player-timestamp", or None if the URL doesn't look like a morgue file
+        """
+        fingerprint = game_fingerprint(url)
+        return None if fingerprint is None else '-'.join(fingerprint)
+
+    @staticmethod
+    def _result(record):
+        """ Turn a parse result into the line we will eventually write to an output file
+
+        Args:
+            record (namedtuple): WinningRecord, LosingRecord, or ErrorRecord
+        Returns:
+            tuple: (kind, output line)
+        """
+        if isinstance(record, WinningRecord):
+            return 'winner', winning_line(record)
+        elif isinstance(record, LosingRecord):
+            return 'loser', '{0}\n'.format(record.url)
+        return 'error', error_line(record)
+
+
+def usage():
+    """ Print a help menu to the screen, if the user enters a bad command line flag. """
+    print(__doc__)
+    exit()
+
+
+if __name__ == '__main__':
+    main()
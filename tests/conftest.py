@@ -0,0 +1,5 @@
+""" The MorgueLibrarian scripts import each other as top-level modules, so put them on the path """
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'MorgueLibrarian'))
@@ -0,0 +1,78 @@
+import os
+from time import time
+from compact_data import CompactData
+from data_files import find_data_files, iter_lines, read_manifest
+from file_codecs import CODECS
+
+
+def write(file_path, lines, age=3600.0):
+    with open(file_path, 'w') as f:
+        for line in lines:
+            f.write(line + '\n')
+    then = time() - age
+    os.utime(file_path, (then, then))
+
+
+def read_all(data_dir, prefix, keys=None):
+    return [line for f in find_data_files(data_dir, prefix, keys) for line in iter_lines(f)]
+
+
+def compact(data_dir, **kwargs):
+    CompactData(data_dir, codec=CODECS['gzip'], **kwargs).compact()
+
+
+def test_merged_sorted_and_newest_line_wins(tmp_path):
+    d = str(tmp_path)
+    write(os.path.join(d, 'winners_20200101_000000.txt'), ['http://b/2 old', 'http://a/1 x', 'http://c/3 x'])
+    write(os.path.join(d, 'winners_20200102_000000.txt'), ['http://b/2 new', 'http://d/4 x'])
+    compact(d, shard_lines=2)
+
+    assert read_all(d, 'winners_') == ['http://a/1 x\n', 'http://b/2 new\n', 'http://c/3 x\n', 'http://d/4 x\n']
+    category = read_manifest(d)['winners_']
+    assert [(s['first'], s['last'], s['count']) for s in category['shards']] == \
+        [('http://a/1', 'http://b/2', 2), ('http://c/3', 'http://d/4', 2)]
+    assert category['sources'] == {}
+    assert not [f for f in os.listdir(d) if f.startswith('winners_')]
+    assert not [f for f in os.listdir(os.path.join(d, 'shards')) if f.endswith('.tmp')]
+
+
+def test_recompacting_merges_old_shards(tmp_path):
+    d = str(tmp_path)
+    write(os.path.join(d, 'losers_20200101_000000.txt'), ['http://a/1 old', 'http://c/3 x'])
+    compact(d, shard_lines=1)
+    write(os.path.join(d, 'losers_20200102_000000.txt'), ['http://a/1 new', 'http://b/2 x'])
+    compact(d, shard_lines=1)
+
+    assert read_all(d, 'losers_') == ['http://a/1 new\n', 'http://b/2 x\n', 'http://c/3 x\n']
+    assert len(os.listdir(os.path.join(d, 'shards'))) == 4
+
+
+def test_files_still_being_written_are_left_alone(tmp_path):
+    d = str(tmp_path)
+    write(os.path.join(d, 'morgue_urls_20200101_000000.txt'), ['http://a/1'])
+    write(os.path.join(d, 'morgue_urls_20200102_000000.txt'), ['http://b/2'], age=0.0)
+    compact(d)
+
+    assert os.path.exists(os.path.join(d, 'morgue_urls_20200102_000000.txt'))
+    assert sorted(read_all(d, 'morgue_urls_')) == ['http://a/1\n', 'http://b/2\n']
+
+
+def test_kept_file_appended_to_is_read_again(tmp_path):
+    d = str(tmp_path)
+    raw = os.path.join(d, 'parser_errors_20200101_000000.txt')
+    write(raw, ['http://a/1 e'])
+    compact(d, keep=True)
+    assert read_all(d, 'parser_errors_') == ['http://a/1 e\n']
+
+    with open(raw, 'a+') as f:
+        f.write('http://b/2 e\n')
+    assert 'http://b/2 e\n' in read_all(d, 'parser_errors_')
+
+
+def test_key_ranges_pick_shards(tmp_path):
+    d = str(tmp_path)
+    write(os.path.join(d, 'winners_20200101_000000.txt'), ['http://a/1 x', 'http://b/2 x', 'http://c/3 x'])
+    compact(d, shard_lines=1)
+
+    assert read_all(d, 'winners_', ['http://b/2']) == ['http://b/2 x\n']
+    assert read_all(d, 'winners_', ['http://bb/0']) == []
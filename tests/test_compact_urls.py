@@ -0,0 +1,39 @@
+from compact_urls import URLList, URLTable
+
+URLS = ['http://crawl.akrasiac.org/rawdata/bob/morgue-bob-20200101-101010.txt',
+        'https://crawl.xtahua.com/crawl/morgue/Alice/morgue-Alice-20191231-235959.txt',
+        'http://crawl.akrasiac.org/rawdata/bob/morgue-bob-20200101-101010.lst',
+        'http://crawl.akrasiac.org']
+
+PATHS = ['morgue-bob-20200101-101010.txt',
+         'notes.txt',
+         'bob/morgue-bob-20200101-101010.txt',
+         'data/saved/bob/morgue-bob-20200101-101010.txt',
+         '/tmp/morgues/morgue-bob-20200101-101010.txt',
+         './morgue-carol-20210202-020202.txt',
+         'C:\\morgues\\morgue-bob-20200101-101010.txt']
+
+
+def test_urls_round_trip():
+    table = URLTable()
+    for url in URLS:
+        assert table.join(*table.split(url)) == url
+
+
+def test_local_paths_round_trip():
+    table = URLTable()
+    for path in PATHS:
+        assert table.join(*table.split(path)) == path
+
+
+def test_url_list_round_trip():
+    urls = URLList(URLTable(), URLS + PATHS)
+    assert list(urls) == URLS + PATHS
+    assert urls[-1] == PATHS[-1]
+
+
+def test_usual_names_are_packed():
+    table = URLTable()
+    dir_id, stamp, _ = table.split(URLS[0])
+    assert stamp == 20200101101010
+    assert table.join(dir_id, stamp) == URLS[0]
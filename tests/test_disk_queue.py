@@ -0,0 +1,43 @@
+from threading import Thread
+from disk_queue import DiskQueue
+
+URLS = ['http://crawl.akrasiac.org/rawdata/bob/morgue-bob-20200101-{0:06d}.txt'.format(i) for i in range(10)]
+
+
+def test_first_in_first_out(tmp_path):
+    queue = DiskQueue(str(tmp_path / 'queue'))
+    assert queue.put(URLS[:4])
+    assert queue.put(['  ', URLS[4] + '\n'] + URLS[5:])
+    assert queue.get(3) == URLS[:3]
+    assert queue.get(100) == URLS[3:]
+    assert queue.get() == []
+
+
+def test_survives_a_restart(tmp_path):
+    DiskQueue(str(tmp_path / 'queue')).put(URLS)
+    assert DiskQueue(str(tmp_path / 'queue')).get(5) == URLS[:5]
+    assert DiskQueue(str(tmp_path / 'queue')).get(5) == URLS[5:]
+
+
+def test_full_queue_waits_for_the_consumer(tmp_path):
+    queue = DiskQueue(str(tmp_path / 'queue'), max_bytes=len(URLS[0]) * 3, poll_seconds=0.01)
+    assert queue.put(URLS[:2])
+    assert not queue.put(URLS[2:4], timeout=0.05)
+
+    consumer = Thread(target=lambda: queue.get(2))
+    consumer.start()
+    assert queue.put(URLS[2:4], timeout=5)
+    consumer.join()
+    assert queue.get() == URLS[2:4]
+
+
+def test_finished_once_closed_and_empty(tmp_path):
+    queue = DiskQueue(str(tmp_path / 'queue'))
+    queue.put(URLS[:2])
+    queue.close()
+    assert not queue.finished()
+    assert queue.get() == URLS[:2]
+    assert queue.finished()
+
+    queue.reopen()
+    assert not queue.finished()
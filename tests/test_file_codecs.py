@@ -0,0 +1,61 @@
+import os
+import pytest
+import file_codecs
+from data_files import iter_lines, write_lines
+from file_codecs import CODECS, available_codecs, codec_for_path, compress, open_file, read_bytes, strip_extension
+
+LINES = ['http://crawl.akrasiac.org/rawdata/bob/morgue-bob-20200101-{0:06d}.txt\tMiBe^Trog,3,0.24\n'.format(i)
+         for i in range(1000)]
+
+
+@pytest.mark.parametrize('name', available_codecs())
+def test_open_file_round_trip(tmp_path, name):
+    codec = CODECS[name]
+    file_path = str(tmp_path / ('morgue.txt' + codec.extension))
+    with open_file(file_path, 'wb') as f:
+        f.write(b'some morgue')
+
+    assert codec_for_path(file_path) == codec
+    assert read_bytes(file_path) == b'some morgue'
+    assert strip_extension(file_path) == str(tmp_path / 'morgue.txt')
+
+
+@pytest.mark.parametrize('name', available_codecs())
+def test_codec_sniffed_without_extension(tmp_path, name):
+    file_path = str(tmp_path / 'morgue')
+    with open(file_path, 'wb') as f:
+        f.write(compress(b'one stream', CODECS[name]) + compress(b', and another', CODECS[name]))
+
+    assert codec_for_path(file_path) == CODECS[name]
+    assert read_bytes(file_path) == b'one stream, and another'
+
+
+def test_plain_file(tmp_path):
+    file_path = str(tmp_path / 'morgue.txt')
+    with open(file_path, 'wb') as f:
+        f.write(b'plain')
+    assert codec_for_path(file_path) is None
+    assert read_bytes(file_path) == b'plain'
+
+
+@pytest.mark.parametrize('extension', [''] + [CODECS[n].extension for n in available_codecs()])
+def test_write_lines_round_trip(tmp_path, extension):
+    file_path = str(tmp_path / ('winners_20200101_000000.txt' + extension))
+    write_lines(file_path, LINES, lines_per_stream=100)
+    assert list(iter_lines(file_path)) == LINES
+
+
+def test_bz2_streams_read_in_parallel(tmp_path, monkeypatch):
+    import data_files
+    monkeypatch.setattr(data_files, 'MIN_SPLIT_BYTES', 0)
+    file_path = str(tmp_path / 'winners_20200101_000000.txt.bz2')
+    write_lines(file_path, LINES, lines_per_stream=100)
+    assert list(iter_lines(file_path, workers=4)) == LINES
+
+
+def test_missing_zstandard(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_codecs, '_zstandard', lambda: None)
+    assert 'zstd' not in available_codecs()
+    assert file_codecs.default_codec() == CODECS['gzip']
+    with pytest.raises(ImportError):
+        open_file(str(tmp_path / 'morgue.txt.zst'), 'wb')
@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor
+from file_lock import FileLock
+
+
+def add_one(lock_path, counter_path, times=50):
+    for _ in range(times):
+        with FileLock(lock_path, poll_seconds=0.001):
+            with open(counter_path, 'r') as f:
+                n = int(f.read())
+            with open(counter_path, 'w') as f:
+                f.write(str(n + 1))
+
+
+def die_holding(lock_path):
+    FileLock(lock_path).acquire()
+    os._exit(0)
+
+
+def counter_in(tmp_path):
+    counter_path = str(tmp_path / 'counter')
+    with open(counter_path, 'w') as f:
+        f.write('0')
+    return str(tmp_path / 'lock'), counter_path
+
+
+def read_counter(counter_path):
+    with open(counter_path, 'r') as f:
+        return int(f.read())
+
+
+def test_threads_take_turns(tmp_path):
+    lock_path, counter_path = counter_in(tmp_path)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: add_one(lock_path, counter_path), range(8)))
+    assert read_counter(counter_path) == 8 * 50
+
+
+def test_processes_take_turns(tmp_path):
+    lock_path, counter_path = counter_in(tmp_path)
+    procs = [multiprocessing.Process(target=add_one, args=(lock_path, counter_path)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert read_counter(counter_path) == 4 * 50
+
+
+def test_lock_of_a_dead_process_is_released(tmp_path):
+    lock_path = str(tmp_path / 'lock')
+    p = multiprocessing.Process(target=die_holding, args=(lock_path,))
+    p.start()
+    p.join()
+
+    with FileLock(lock_path):
+        pass
+
+
+def test_shared_instance_between_threads(tmp_path):
+    lock_path, counter_path = counter_in(tmp_path)
+    lock = FileLock(lock_path, poll_seconds=0.001)
+
+    def add(_):
+        for _ in range(50):
+            with lock:
+                n = read_counter(counter_path)
+                with open(counter_path, 'w') as f:
+                    f.write(str(n + 1))
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(add, range(4)))
+    assert read_counter(counter_path) == 4 * 50
@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+pytest.importorskip('requests')
+from crawl_clock import VirtualClock
+from host_policies import HostPolicies, base_url
+
+URL = 'https://crawl.akrasiac.org/rawdata/bob/morgue-bob-20200101-101010.txt'
+
+
+def test_slow_down_and_speed_up():
+    policies = HostPolicies(default_wait=10.0, use_robots=False, clock=VirtualClock())
+    base = base_url(URL)
+    policies.slow_down(URL, 30)
+    policies.slow_down(URL)
+    assert policies.wait_for(base) == 40.0
+    assert policies.not_before(base) == policies.clock.now() + 30
+
+    for _ in range(20):
+        policies.speed_up(URL)
+    assert policies.wait_for(base) == 10.0
+    assert base not in policies.slow_downs
+
+
+def test_speed_up_from_many_threads():
+    policies = HostPolicies(default_wait=10.0, use_robots=False)
+    for _ in range(1000):
+        policies.slow_down(URL)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(policies.speed_up, [URL] * 64))
+    assert policies.slow_downs == {}
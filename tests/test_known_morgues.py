@@ -0,0 +1,42 @@
+from known_morgues import KnownMorgues
+
+GAME = 'morgue-bob-20200101-101010.txt'
+MIRROR_A = 'http://crawl.akrasiac.org/rawdata/bob/' + GAME
+MIRROR_B = 'https://crawl.xtahua.com/crawl/morgue/bob/' + GAME
+
+
+def write(file_path, urls):
+    with open(str(file_path), 'w') as f:
+        for url in urls:
+            f.write(url + '\tsome,other,columns\n')
+
+
+def known(tmp_path):
+    km = KnownMorgues(['winners_', 'losers_', 'parser_errors_'], [str(tmp_path)], workers=1)
+    km.find()
+    return km
+
+
+def test_parsed_game_is_known_on_every_mirror(tmp_path):
+    write(tmp_path / 'winners_20200101_000000.txt', [MIRROR_A])
+    km = known(tmp_path)
+    assert km.includes(MIRROR_A)
+    assert km.includes(MIRROR_A.replace('http://', 'https://'))
+    assert km.includes(MIRROR_B)
+
+
+def test_failed_game_may_be_read_from_another_mirror(tmp_path):
+    write(tmp_path / 'parser_errors_20200101_000000.txt', [MIRROR_A])
+    km = known(tmp_path)
+    assert km.includes(MIRROR_A)
+    assert not km.includes(MIRROR_B)
+
+
+def test_added_urls_are_only_fingerprinted_when_asked(tmp_path):
+    km = known(tmp_path)
+    km.add([MIRROR_A])
+    assert km.includes(MIRROR_A)
+    assert not km.includes(MIRROR_B)
+
+    km.add([MIRROR_A], fingerprint=True)
+    assert km.includes(MIRROR_B)
@@ -0,0 +1,48 @@
+import os
+from crawl_data import SKILLS
+from morgue_features import MAX_BYTES, read_features
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+LONG_MORGUE = os.path.join(DATA_DIR, 'morgue-Vessa-20240914-101112.txt')
+
+
+def read_morgue(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+def test_skills_after_a_long_inventory():
+    data = read_morgue(LONG_MORGUE)
+    assert data.find(b'Skills:') > MAX_BYTES
+
+    features = read_features(data)
+    skills = dict(zip(SKILLS, features.skills))
+    assert skills['fighting'] == 27.0
+    assert skills['armour'] == 27.0
+    assert skills['shields'] == 26.8
+    assert skills['invocations'] == 18.4
+    assert skills['stealth'] == 2.0
+
+
+def test_boosted_skill_levels():
+    features = read_features(read_morgue(LONG_MORGUE))
+    skills = dict(zip(SKILLS, features.skills))
+    assert skills['axes'] == 14.2
+
+
+def test_newer_skills():
+    features = read_features(read_morgue(LONG_MORGUE))
+    skills = dict(zip(SKILLS, features.skills))
+    assert skills['ranged weapons'] == 9.0
+    assert skills['shapeshifting'] == 6.2
+    assert skills['alchemy'] == 7.7
+    assert skills['forgecraft'] == 11.0
+
+
+def test_character_stats():
+    features = read_features(read_morgue(LONG_MORGUE))
+    assert features.god == 'Oka'
+    assert features.num_runes == 15
+    assert features.xl == 27
+    assert (features.strength, features.intelligence, features.dexterity) == (37, 11, 16)
+    assert features.turns == 143218
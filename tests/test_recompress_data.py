@@ -0,0 +1,41 @@
+import os
+from compact_data import CompactData
+from data_files import find_data_files, iter_lines, read_manifest, write_lines
+from file_codecs import CODECS, codec_for_path, compress, read_bytes
+from recompress_data import RecompressData
+
+LINES = ['http://a/{0} MiBe^Trog,3,0.24\n'.format(i) for i in range(10)]
+
+
+def read_all(data_dir, prefix):
+    return sorted(line for f in find_data_files(data_dir, prefix) for line in iter_lines(f))
+
+
+def test_recompress_data_files_and_shards(tmp_path):
+    d = str(tmp_path)
+    write_lines(os.path.join(d, 'winners_20200101_000000.txt.bz2'), LINES[:5])
+    CompactData(d, codec=CODECS['gzip'], keep=True, active_seconds=0).compact()
+    write_lines(os.path.join(d, 'winners_20200102_000000.txt'), LINES[5:])
+
+    RecompressData(d, CODECS['xz']).recompress()
+    assert sorted(f for f in os.listdir(d) if f.startswith('winners_')) == \
+        ['winners_20200101_000000.txt.xz', 'winners_20200102_000000.txt.xz']
+    assert all(s['file'].endswith('.xz') for s in read_manifest(d)['winners_']['shards'])
+
+    # the kept source is still known to be compacted, so nothing is read twice
+    assert read_all(d, 'winners_') == sorted(LINES)
+
+
+def test_saved_morgues_recompressed_in_place(tmp_path):
+    d = str(tmp_path)
+    os.makedirs(os.path.join(d, 'saved'))
+    in_place = os.path.join(d, 'saved', 'morgue-bob')
+    with open(in_place, 'wb') as f:
+        f.write(compress(b'bob', CODECS['bz2']))
+    with open(os.path.join(d, 'saved', 'morgue-carol.txt.bz2'), 'wb') as f:
+        f.write(compress(b'carol', CODECS['bz2']))
+
+    RecompressData(d, None, saved=True).recompress()
+    assert sorted(os.listdir(os.path.join(d, 'saved'))) == ['morgue-bob', 'morgue-carol.txt']
+    assert codec_for_path(in_place) is None
+    assert read_bytes(in_place) == b'bob'
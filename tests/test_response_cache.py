@@ -0,0 +1,68 @@
+import os
+from file_codecs import CODECS
+from response_cache import ResponseCache
+
+URL = 'http://crawl.akrasiac.org/rawdata/bob/morgue-bob-20200101-101010.txt'
+
+
+def cache_in(tmp_path, max_bytes=10 ** 6):
+    return ResponseCache(str(tmp_path / 'cache'), max_bytes=max_bytes, codec=CODECS['gzip'])
+
+
+def test_put_and_get(tmp_path):
+    cache = cache_in(tmp_path)
+    assert cache.get(URL) is None
+    assert not cache.includes(URL)
+
+    cache.put(URL, b'morgue text')
+    assert cache.get(URL) == b'morgue text'
+    assert cache.get(URL.replace('http://', 'https://').replace('akrasiac', 'AKRASIAC')) == b'morgue text'
+    assert cache.includes(URL)
+
+
+def test_overwrite_counts_size_once(tmp_path):
+    cache = cache_in(tmp_path)
+    cache.put(URL, b'first')
+    cache.put(URL + '.2', b'second')
+    size = cache.size
+
+    cache.put(URL, b'first')
+    assert cache.size == size
+    assert cache.size == sum(s for _, s, _ in cache._entries())
+
+
+def test_least_recently_used_evicted(tmp_path):
+    urls = [URL + str(i) for i in range(5)]
+    cache = cache_in(tmp_path)
+    for i, url in enumerate(urls):
+        cache.put(url, os.urandom(1000))
+        os.utime(cache.path_for(url), (i, i))
+    cache.get(urls[0])
+
+    # a limit just big enough for four pages
+    cache.max_bytes = cache.size - 1
+    cache.put(urls[4], os.urandom(1000))
+    assert cache.size <= cache.max_bytes
+    assert cache.includes(urls[0])
+    assert not cache.includes(urls[1])
+    assert cache.includes(urls[4])
+
+
+def test_page_compressed_with_a_missing_codec_is_a_miss(tmp_path, monkeypatch):
+    import file_codecs
+    cache = cache_in(tmp_path)
+    cache.put(URL, b'morgue text')
+    with open(cache.path_for(URL), 'wb') as f:
+        f.write(CODECS['zstd'].magic + b'not really zstd')
+
+    monkeypatch.setattr(file_codecs, '_zstandard', lambda: None)
+    assert cache.get(URL) is None
+    cache.put(URL, b'fetched again')
+    assert cache.get(URL) == b'fetched again'
+
+
+def test_older_file_names_still_read(tmp_path):
+    cache = cache_in(tmp_path)
+    cache.put(URL, b'morgue text')
+    os.rename(cache.path_for(URL), cache.path_for(URL) + '.gz')
+    assert cache.get(URL) == b'morgue text'
@@ -0,0 +1,73 @@
+from retry_queue import RetryQueue, host_of
+
+A = 'http://crawl.akrasiac.org/rawdata/bob/morgue-bob-20200101-101010.txt'
+A2 = 'http://crawl.akrasiac.org/rawdata/carol/morgue-carol-20200101-101010.txt'
+B = 'https://crawl.xtahua.com/crawl/morgue/bob/morgue-bob-20200102-101010.txt'
+
+
+def queue_in(tmp_path):
+    return RetryQueue(str(tmp_path / 'retry_queue.txt'), base_wait=10.0, max_wait=100.0, max_attempts=3)
+
+
+def test_host_of():
+    assert host_of(A) == 'http://crawl.akrasiac.org'
+    assert host_of('http://crawl.akrasiac.org') == 'http://crawl.akrasiac.org'
+
+
+def test_backoff_grows_once_per_window(tmp_path):
+    q = queue_in(tmp_path)
+    assert q.add(A, 'Timeout', now=0.0) == 10.0
+    # a second failure while the host is backing off doesn't count against it again
+    q.add(A2, 'Timeout', now=1.0)
+    assert q.host_failures[host_of(A)] == 1
+
+    assert q.add(A, 'Timeout', now=20.0) == 40.0
+    assert q.host_failures[host_of(A)] == 2
+    assert q.add(A, 'Timeout', now=200.0) == 240.0
+    assert q._backoff(10) == 100.0
+
+
+def test_due_and_exhausted(tmp_path):
+    q = queue_in(tmp_path)
+    q.add(A, 'Timeout', now=0.0)
+    q.add(B, 'HTTPError', now=0.0)
+    assert q.due(now=5.0) == []
+    assert sorted(q.due(now=10.0)) == [A, B]
+
+    q.add(A, 'Timeout', now=10.0)
+    q.add(A, 'Timeout', now=100.0)
+    assert q.exhausted() == [(A, 'Timeout')]
+    assert q.due(now=1000.0) == [B]
+
+
+def test_success_clears_the_host(tmp_path):
+    q = queue_in(tmp_path)
+    q.add(A, 'Timeout', now=0.0)
+    assert q.backing_off(A2, now=5.0)
+    q.succeeded(A2)
+    q.remove(A2)
+    assert not q.backing_off(A2, now=5.0)
+    assert A in q
+
+
+def test_deferred_urls_are_not_attempts(tmp_path):
+    q = queue_in(tmp_path)
+    q.add(A, 'Timeout', now=0.0)
+    q.defer(A2, 'BackingOff', now=1.0)
+    assert q.entries[A2] == [0, 1.0, 'BackingOff']
+    assert q.due(now=5.0) == []
+    assert sorted(q.due(now=10.0)) == [A, A2]
+
+
+def test_save_and_load(tmp_path):
+    q = queue_in(tmp_path)
+    q.add(A, 'Timeout', now=0.0)
+    q.add(B, 'HTTPError', now=0.0)
+    q.defer(A2, 'BackingOff', now=0.0)
+    q.save()
+
+    q2 = queue_in(tmp_path)
+    q2.load()
+    assert q2.entries == q.entries
+    assert q2.host_failures == q.host_failures
+    assert q2.host_not_before == q.host_not_before
@@ -0,0 +1,50 @@
+import os
+import pytest
+pytest.importorskip('requests')
+from custom_errors import Loser, ParserError, TransientError
+from host_policies import HostPolicies
+from retry_queue import RetryQueue
+from winning_parser import BACKING_OFF, WinningParser
+
+DOWN = ['http://down.example.org/morgue-p{0}-20200101-101010.txt'.format(i) for i in range(5)]
+UP = ['http://up.example.org/morgue-q{0}-20200101-101010.txt'.format(i) for i in range(3)]
+MORGUE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'morgue-Vessa-20240914-101112.txt')
+
+
+def test_failing_server_is_not_hit_again(tmp_path, monkeypatch):
+    fetched = []
+
+    def read_url(url, cache=None, look_in_cache=True):
+        fetched.append(url)
+        if 'down' in url:
+            raise TransientError('HTTP 503')
+        return b'not a morgue'
+
+    monkeypatch.setattr(WinningParser, 'read_url', staticmethod(read_url))
+    parser = WinningParser([])
+    parser.data_dir = str(tmp_path)
+    parser.policies = HostPolicies(default_wait=0.0, use_robots=False)
+    parser.retry_queue = RetryQueue(str(tmp_path / 'retry_queue.txt'))
+    parser.parse_urls(DOWN + UP)
+
+    assert len([u for u in fetched if 'down' in u]) == 1
+    assert sorted(u for u in fetched if 'up' in u) == UP
+    assert sorted(parser.retry_queue.entries) == DOWN
+    assert sorted(e[0] for e in parser.retry_queue.entries.values()) == [0, 0, 0, 0, 1]
+
+    assert sorted(e[2] for e in parser.retry_queue.entries.values()) == [BACKING_OFF] * 4 + ['HTTPError']
+
+
+def test_parse_one_morgue():
+    with open(MORGUE, 'rb') as f:
+        data = f.read()
+    parser = WinningParser([])
+
+    assert parser.parse_one_morgue(data, MORGUE) == ('Gr', 'Fi', 'Oka', 15, '0.32')
+    assert parser.parse_one_morgue(data.decode('utf-8'), MORGUE) == ('Gr', 'Fi', 'Oka', 15, '0.32')
+    with pytest.raises(Loser):
+        parser.parse_one_morgue(data.replace(b'Escaped with the Orb', b'Slain by an orc\xff'), MORGUE)
+    with pytest.raises(ParserError, match='not long enough'):
+        parser.parse_one_morgue(b'\n'.join(data.split(b'\n')[:12]), MORGUE)
+    with pytest.raises(ParserError, match='starting line'):
+        parser.parse_one_morgue(b'junk' + data, MORGUE)
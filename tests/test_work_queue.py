@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import pytest
+pytest.importorskip('requests')
+import work_queue
+from parse_results import LosingRecord
+from work_queue import WorkQueue
+
+A = ['http://a.example.org/morgue-p{0}-20200101-101010.txt'.format(i) for i in range(3)]
+B = ['http://b.example.org/crawl/morgue-q{0}-20200101-101010.txt'.format(i) for i in range(2)]
+
+
+def queue(tmp_path, lease_seconds=3600):
+    return WorkQueue(str(tmp_path / 'work_queue.sqlite'), lease_seconds)
+
+
+def test_load_skips_mirrors_loaded_later(tmp_path):
+    wq = queue(tmp_path)
+    assert wq.load(A, str(tmp_path)) == 3
+    mirror = 'https://mirror.example.net/morgues/p0/morgue-p0-20200101-101010.txt'
+    assert wq.load([mirror] + B, str(tmp_path)) == 2
+    assert wq.status() == {'pending': 5}
+
+
+def test_old_queue_gets_game_fingerprints(tmp_path):
+    db = sqlite3.connect(str(tmp_path / 'work_queue.sqlite'))
+    db.execute('CREATE TABLE urls (url TEXT PRIMARY KEY, canonical TEXT UNIQUE, host TEXT, '
+               "state TEXT DEFAULT 'pending', worker TEXT, lease_expires REAL DEFAULT 0, "
+               'attempts INTEGER DEFAULT 0, not_before REAL DEFAULT 0, kind TEXT, result TEXT)')
+    db.execute("INSERT INTO urls (url, canonical, host) VALUES (?, ?, 'http://a.example.org')", (A[0], A[0]))
+    db.commit()
+    db.close()
+
+    wq = queue(tmp_path)
+    assert wq.load([A[0].replace('a.example.org', 'c.example.org')], str(tmp_path)) == 0
+
+
+def test_each_host_is_leased_to_one_worker(tmp_path):
+    wq = queue(tmp_path)
+    wq.load(A + B, str(tmp_path))
+    host1, urls1 = wq.lease('w1', 10)
+    host2, urls2 = wq.lease('w2', 10)
+    assert {host1, host2} == {'http://a.example.org', 'http://b.example.org'}
+    assert sorted(urls1 + urls2) == sorted(A + B)
+    assert all(u.startswith(host1) for u in urls1)
+    assert wq.lease('w3', 10) == (None, [])
+
+
+def test_expired_leases_are_reclaimed(tmp_path):
+    wq = queue(tmp_path, lease_seconds=-1)
+    wq.load(A, str(tmp_path))
+    assert sorted(wq.lease('dead', 10)[1]) == A
+    assert sorted(wq.lease('alive', 10)[1]) == A
+
+    # the dead worker's late result is ignored
+    wq.finish('dead', LosingRecord(A[0]))
+    assert wq.status() == {'leased': 3}
+
+
+def test_merge_writes_each_result_once(tmp_path):
+    wq = queue(tmp_path)
+    wq.load(A, str(tmp_path))
+    wq.lease('w1', 10)
+    for url in A:
+        wq.finish('w1', LosingRecord(url))
+
+    assert wq.merge(str(tmp_path)) == 3
+    assert wq.merge(str(tmp_path)) == 0
+    lines = [line for f in os.listdir(str(tmp_path)) if f.startswith('losers_') for line in open(str(tmp_path / f))]
+    assert sorted(lines) == sorted(u + '\n' for u in A)
+    assert wq.status() == {'merged': 3}
+
+
+def test_merge_survives_a_crash_after_commit(tmp_path, monkeypatch):
+    wq = queue(tmp_path)
+    wq.load(A, str(tmp_path))
+    wq.lease('w1', 10)
+    for url in A:
+        wq.finish('w1', LosingRecord(url))
+
+    def crash(src, dst):
+        raise OSError('crash')
+
+    monkeypatch.setattr(work_queue.os, 'replace', crash)
+    with pytest.raises(OSError):
+        wq.merge(str(tmp_path))
+    assert not [f for f in os.listdir(str(tmp_path)) if f.endswith('.txt')]
+    monkeypatch.undo()
+
+    assert wq.merge(str(tmp_path)) == 0
+    lines = [line for f in os.listdir(str(tmp_path)) if f.startswith('losers_') for line in open(str(tmp_path / f))]
+    assert sorted(lines) == sorted(u + '\n' for u in A)
+    assert not [f for f in os.listdir(str(tmp_path)) if f.endswith('.tmp')]